@@ -0,0 +1,46 @@
+"""add posts_fts full-text index (merges full_name and investor_proposals heads)
+
+Revision ID: 1a2b3c4d5e6f
+Revises: f0a1b2c3d4e5, f7e8d9c0add
+Create Date: 2025-10-01
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e6f'
+down_revision = ('f0a1b2c3d4e5', 'f7e8d9c0add')
+branch_labels = None
+depends_on = None
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5("
+    "title, details, content='posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN "
+    "INSERT INTO posts_fts(rowid, title, details) VALUES (new.id, new.title, new.details); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); END",
+    "CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, details ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); "
+    "INSERT INTO posts_fts(rowid, title, details) VALUES (new.id, new.title, new.details); END",
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    for stmt in FTS_DDL:
+        bind.exec_driver_sql(stmt)
+    # Backfill the index from existing posts
+    bind.exec_driver_sql("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    for trigger in ('posts_fts_ai', 'posts_fts_ad', 'posts_fts_au'):
+        bind.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    bind.exec_driver_sql("DROP TABLE IF EXISTS posts_fts")
@@ -0,0 +1,46 @@
+"""add table_counts for maintained list totals
+
+Revision ID: 2b3c4d5e6f7a
+Revises: 1a2b3c4d5e6f
+Create Date: 2025-10-02
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2b3c4d5e6f7a'
+down_revision = '1a2b3c4d5e6f'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('table_counts'):
+        op.create_table(
+            'table_counts',
+            sa.Column('entity', sa.String(), primary_key=True),
+            sa.Column('bucket', sa.String(), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        )
+    # Backfill from the base tables
+    op.execute("DELETE FROM table_counts")
+    op.execute(
+        "INSERT INTO table_counts (entity, bucket, count) "
+        "SELECT 'posts', COALESCE(status, 'none'), COUNT(*) FROM posts GROUP BY COALESCE(status, 'none')"
+    )
+    op.execute(
+        "INSERT INTO table_counts (entity, bucket, count) "
+        "SELECT 'investor_proposals', COALESCE(status, 'none'), COUNT(*) FROM investor_proposals GROUP BY COALESCE(status, 'none')"
+    )
+    op.execute("INSERT INTO table_counts (entity, bucket, count) SELECT 'users', 'all', COUNT(*) FROM users")
+
+
+def downgrade():
+    if table_exists('table_counts'):
+        op.drop_table('table_counts')
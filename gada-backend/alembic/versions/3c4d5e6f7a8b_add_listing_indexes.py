@@ -0,0 +1,40 @@
+"""add composite indexes for post listing and token lookups
+
+Revision ID: 3c4d5e6f7a8b
+Revises: 2b3c4d5e6f7a
+Create Date: 2025-10-03
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3c4d5e6f7a8b'
+down_revision = '2b3c4d5e6f7a'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_posts_status_id', 'posts', ['status', 'id']),
+    ('ix_posts_status_publish_at', 'posts', ['status', 'publish_at']),
+    ('ix_users_email_verification_token', 'users', ['email_verification_token']),
+    ('ix_users_password_reset_token', 'users', ['password_reset_token']),
+]
+
+
+def existing_indexes(table: str) -> set:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return {idx['name'] for idx in inspector.get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in INDEXES:
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,59 @@
+"""add posts.excerpt for summary list views
+
+Revision ID: 4d5e6f7a8b9c
+Revises: 3c4d5e6f7a8b
+Create Date: 2025-10-04
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4d5e6f7a8b9c'
+down_revision = '3c4d5e6f7a8b'
+branch_labels = None
+depends_on = None
+
+EXCERPT_LENGTH = 240
+BATCH = 500
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    # frozen copy of models.make_excerpt at the time of this migration
+    flat = " ".join((text or "").split())
+    if len(flat) <= length:
+        return flat
+    cut = flat[:length]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def column_exists(table, column):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return column in [c['name'] for c in inspector.get_columns(table)]
+
+
+def upgrade():
+    if not column_exists('posts', 'excerpt'):
+        op.add_column('posts', sa.Column('excerpt', sa.String(), nullable=True))
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text("SELECT id, details FROM posts WHERE id > :last ORDER BY id LIMIT :n"),
+            {"last": last_id, "n": BATCH},
+        ).fetchall()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE posts SET excerpt = :excerpt WHERE id = :id"),
+            [{"id": r[0], "excerpt": make_excerpt(r[1])} for r in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    if column_exists('posts', 'excerpt'):
+        with op.batch_alter_table('posts') as batch:
+            batch.drop_column('excerpt')
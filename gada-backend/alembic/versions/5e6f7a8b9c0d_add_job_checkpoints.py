@@ -0,0 +1,35 @@
+"""add job_checkpoints for resumable background jobs
+
+Revision ID: 5e6f7a8b9c0d
+Revises: 4d5e6f7a8b9c
+Create Date: 2025-10-05
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5e6f7a8b9c0d'
+down_revision = '4d5e6f7a8b9c'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('job_checkpoints'):
+        op.create_table(
+            'job_checkpoints',
+            sa.Column('name', sa.String(), primary_key=True),
+            sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade():
+    if table_exists('job_checkpoints'):
+        op.drop_table('job_checkpoints')
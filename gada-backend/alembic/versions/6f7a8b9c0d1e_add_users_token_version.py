@@ -0,0 +1,31 @@
+"""add users.token_version for access-token revocation
+
+Revision ID: 6f7a8b9c0d1e
+Revises: 5e6f7a8b9c0d
+Create Date: 2025-10-06
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6f7a8b9c0d1e'
+down_revision = '5e6f7a8b9c0d'
+branch_labels = None
+depends_on = None
+
+
+def column_exists(table, column):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return column in [c['name'] for c in inspector.get_columns(table)]
+
+
+def upgrade():
+    if not column_exists('users', 'token_version'):
+        op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    if column_exists('users', 'token_version'):
+        with op.batch_alter_table('users') as batch:
+            batch.drop_column('token_version')
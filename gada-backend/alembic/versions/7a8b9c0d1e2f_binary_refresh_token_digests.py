@@ -0,0 +1,61 @@
+"""store refresh token digests as 32-byte blobs instead of hex strings
+
+Revision ID: 7a8b9c0d1e2f
+Revises: 6f7a8b9c0d1e
+Create Date: 2025-10-07
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7a8b9c0d1e2f'
+down_revision = '6f7a8b9c0d1e'
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def _convert(to_blob: bool):
+    bind = op.get_bind()
+    source_type = 'text' if to_blob else 'blob'
+    while True:
+        rows = bind.execute(sa.text(
+            f"SELECT id, token FROM refresh_tokens WHERE typeof(token) = '{source_type}' LIMIT {BATCH}"
+        )).all()
+        if not rows:
+            break
+        for row_id, token in rows:
+            if to_blob:
+                try:
+                    value = bytes.fromhex(token)
+                except ValueError:
+                    value = None
+            else:
+                value = bytes(token).hex()
+            if value is None:  # not a digest we can carry over; the session has to log in again
+                bind.execute(sa.text("DELETE FROM refresh_tokens WHERE id = :id"), {"id": row_id})
+            else:
+                bind.execute(sa.text("UPDATE refresh_tokens SET token = :token WHERE id = :id"), {"token": value, "id": row_id})
+
+
+def upgrade():
+    if not table_exists('refresh_tokens'):
+        return
+    _convert(to_blob=True)
+    with op.batch_alter_table('refresh_tokens') as batch:
+        batch.alter_column('token', type_=sa.LargeBinary(), existing_type=sa.String())
+
+
+def downgrade():
+    if not table_exists('refresh_tokens'):
+        return
+    _convert(to_blob=False)
+    with op.batch_alter_table('refresh_tokens') as batch:
+        batch.alter_column('token', type_=sa.String(), existing_type=sa.LargeBinary())
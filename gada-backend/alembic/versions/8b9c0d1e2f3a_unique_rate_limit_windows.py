@@ -0,0 +1,38 @@
+"""unique (scope, identifier, window_start) on rate_limits for batched upserts
+
+Revision ID: 8b9c0d1e2f3a
+Revises: 7a8b9c0d1e2f
+Create Date: 2025-10-08
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8b9c0d1e2f3a'
+down_revision = '7a8b9c0d1e2f'
+branch_labels = None
+depends_on = None
+
+INDEX = 'uq_rate_limits_scope_identifier_window'
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def upgrade():
+    if index_exists('rate_limits', INDEX):
+        return
+    # rows written by the old per-request limiter: keep the newest of any duplicate window
+    op.execute(
+        "DELETE FROM rate_limits WHERE id NOT IN "
+        "(SELECT max(id) FROM rate_limits GROUP BY scope, identifier, window_start)"
+    )
+    op.create_index(INDEX, 'rate_limits', ['scope', 'identifier', 'window_start'], unique=True)
+
+
+def downgrade():
+    if index_exists('rate_limits', INDEX):
+        op.drop_index(INDEX, table_name='rate_limits')
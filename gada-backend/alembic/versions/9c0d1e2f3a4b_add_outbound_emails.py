@@ -0,0 +1,55 @@
+"""add outbound_emails outbox table
+
+Revision ID: 9c0d1e2f3a4b
+Revises: 8b9c0d1e2f3a
+Create Date: 2025-10-09
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9c0d1e2f3a4b'
+down_revision = '8b9c0d1e2f3a'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_outbound_emails_status_next_attempt'
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def upgrade():
+    if not table_exists('outbound_emails'):
+        op.create_table(
+            'outbound_emails',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('to_email', sa.String(), nullable=False),
+            sa.Column('subject', sa.String(), nullable=False),
+            sa.Column('body', sa.String(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('claimed_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+        )
+    if not index_exists('outbound_emails', INDEX):
+        op.create_index(INDEX, 'outbound_emails', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    if table_exists('outbound_emails'):
+        if index_exists('outbound_emails', INDEX):
+            op.drop_index(INDEX, table_name='outbound_emails')
+        op.drop_table('outbound_emails')
@@ -0,0 +1,65 @@
+"""add newsletter_subscribers and newsletter_campaigns
+
+Revision ID: ad1e2f3a4b5c
+Revises: 9c0d1e2f3a4b
+Create Date: 2025-10-10
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'ad1e2f3a4b5c'
+down_revision = '9c0d1e2f3a4b'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def upgrade():
+    if not table_exists('newsletter_subscribers'):
+        op.create_table(
+            'newsletter_subscribers',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('email', sa.String(), nullable=False, unique=True),
+            sa.Column('status', sa.String(), nullable=False, server_default='active'),
+            sa.Column('unsubscribe_token', sa.String(), nullable=False, unique=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('unsubscribed_at', sa.DateTime(), nullable=True),
+        )
+    if not index_exists('newsletter_subscribers', 'ix_newsletter_subscribers_status_id'):
+        op.create_index('ix_newsletter_subscribers_status_id', 'newsletter_subscribers', ['status', 'id'])
+    if not table_exists('newsletter_campaigns'):
+        op.create_table(
+            'newsletter_campaigns',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('post_id', sa.Integer(), nullable=False, unique=True),
+            sa.Column('subject', sa.String(), nullable=False),
+            sa.Column('body', sa.String(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False, server_default='queued'),
+            sa.Column('send_after', sa.DateTime(), nullable=False),
+            sa.Column('sent_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('deferred_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('bounced_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+    if not index_exists('newsletter_campaigns', 'ix_newsletter_campaigns_status_send_after'):
+        op.create_index('ix_newsletter_campaigns_status_send_after', 'newsletter_campaigns', ['status', 'send_after'])
+
+
+def downgrade():
+    if table_exists('newsletter_campaigns'):
+        op.drop_table('newsletter_campaigns')
+    if table_exists('newsletter_subscribers'):
+        op.drop_table('newsletter_subscribers')
@@ -0,0 +1,50 @@
+"""add image_variants table
+
+Revision ID: be2f3a4b5c6d
+Revises: ad1e2f3a4b5c
+Create Date: 2025-10-11
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'be2f3a4b5c6d'
+down_revision = 'ad1e2f3a4b5c'
+branch_labels = None
+depends_on = None
+
+INDEX = 'uq_image_variants_filename_width_format'
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def upgrade():
+    if not table_exists('image_variants'):
+        op.create_table(
+            'image_variants',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('filename', sa.String(), nullable=False),
+            sa.Column('width', sa.Integer(), nullable=False),
+            sa.Column('format', sa.String(), nullable=False),
+            sa.Column('pixel_width', sa.Integer(), nullable=False),
+            sa.Column('pixel_height', sa.Integer(), nullable=False),
+            sa.Column('bytes', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+    if not index_exists('image_variants', INDEX):
+        op.create_index(INDEX, 'image_variants', ['filename', 'width', 'format'], unique=True)
+
+
+def downgrade():
+    if table_exists('image_variants'):
+        op.drop_table('image_variants')
@@ -0,0 +1,84 @@
+"""add upload_blobs and post_uploads, backfilled from posts.image
+
+Revision ID: cf3a4b5c6d7e
+Revises: be2f3a4b5c6d
+Create Date: 2025-10-12
+"""
+from alembic import op
+import sqlalchemy as sa
+import os, re
+from datetime import datetime
+
+# revision identifiers, used by Alembic.
+revision = 'cf3a4b5c6d7e'
+down_revision = 'be2f3a4b5c6d'
+branch_labels = None
+depends_on = None
+
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'uploads')
+
+
+def table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def _referenced(image):
+    names = set()
+    for part in re.split(r"[;,\s]+", image or ""):
+        if part.startswith('/uploads/'):
+            name = part[len('/uploads/'):]
+            if name and '/' not in name and not name.startswith('.'):
+                names.add(name)
+    return names
+
+
+def upgrade():
+    if not table_exists('upload_blobs'):
+        op.create_table(
+            'upload_blobs',
+            sa.Column('filename', sa.String(), primary_key=True),
+            sa.Column('sha256', sa.String(), nullable=True),
+            sa.Column('size', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_uploaded_at', sa.DateTime(), nullable=True),
+        )
+    if not index_exists('upload_blobs', 'ix_upload_blobs_last_uploaded_at'):
+        op.create_index('ix_upload_blobs_last_uploaded_at', 'upload_blobs', ['last_uploaded_at'])
+    if not table_exists('post_uploads'):
+        op.create_table(
+            'post_uploads',
+            sa.Column('post_id', sa.Integer(), primary_key=True),
+            sa.Column('filename', sa.String(), primary_key=True),
+        )
+    if not index_exists('post_uploads', 'ix_post_uploads_filename'):
+        op.create_index('ix_post_uploads_filename', 'post_uploads', ['filename'])
+
+    # Backfill: every upload a post lists becomes a referenced blob (existing uuid names keep working)
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    blobs = {}
+    for post_id, image in bind.execute(sa.text("SELECT id, image FROM posts WHERE image LIKE '%/uploads/%'")).all():
+        for name in _referenced(image):
+            bind.execute(sa.text("INSERT OR IGNORE INTO post_uploads (post_id, filename) VALUES (:p, :f)"),
+                         {"p": post_id, "f": name})
+            blobs.setdefault(name, None)
+    for name in blobs:
+        path = os.path.join(UPLOAD_DIR, name)
+        size = os.path.getsize(path) if os.path.isfile(path) else None
+        bind.execute(sa.text("INSERT OR IGNORE INTO upload_blobs (filename, size, created_at, last_uploaded_at) "
+                             "VALUES (:f, :s, :t, :t)"), {"f": name, "s": size, "t": now})
+
+
+def downgrade():
+    if table_exists('post_uploads'):
+        op.drop_table('post_uploads')
+    if table_exists('upload_blobs'):
+        op.drop_table('upload_blobs')
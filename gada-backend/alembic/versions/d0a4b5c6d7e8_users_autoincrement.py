@@ -0,0 +1,34 @@
+"""users: AUTOINCREMENT ids, so a deleted user's id is never reused
+
+Revision ID: d0a4b5c6d7e8
+Revises: cf3a4b5c6d7e
+Create Date: 2025-10-13
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd0a4b5c6d7e8'
+down_revision = 'cf3a4b5c6d7e'
+branch_labels = None
+depends_on = None
+
+
+def autoincrement(table: str) -> bool:
+    sql = op.get_bind().execute(sa.text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:t"), {"t": table}).scalar()
+    return 'AUTOINCREMENT' in (sql or '').upper()
+
+
+def upgrade():
+    if autoincrement('users'):
+        return
+    # SQLite can only add AUTOINCREMENT by rebuilding the table; the sequence starts at the current max id
+    with op.batch_alter_table('users', recreate='always', table_kwargs={'sqlite_autoincrement': True}) as batch:
+        pass
+
+
+def downgrade():
+    if not autoincrement('users'):
+        return
+    with op.batch_alter_table('users', recreate='always', table_kwargs={'sqlite_autoincrement': False}) as batch:
+        pass
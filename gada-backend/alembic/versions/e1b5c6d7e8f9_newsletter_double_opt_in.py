@@ -0,0 +1,48 @@
+"""newsletter_subscribers: confirmation token for double opt-in
+
+Revision ID: e1b5c6d7e8f9
+Revises: d0a4b5c6d7e8
+Create Date: 2025-10-14
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e1b5c6d7e8f9'
+down_revision = 'd0a4b5c6d7e8'
+branch_labels = None
+depends_on = None
+
+INDEX = 'uq_newsletter_subscribers_confirm_token'
+
+
+def column_exists(table, column):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return column in [c['name'] for c in inspector.get_columns(table)]
+
+
+def index_exists(table, name):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    return name in [i['name'] for i in inspector.get_indexes(table)]
+
+
+def upgrade():
+    # rows subscribed before this stay active; new ones start pending until confirmed
+    if not column_exists('newsletter_subscribers', 'confirm_token'):
+        op.add_column('newsletter_subscribers', sa.Column('confirm_token', sa.String(), nullable=True))
+    if not column_exists('newsletter_subscribers', 'confirm_sent_at'):
+        op.add_column('newsletter_subscribers', sa.Column('confirm_sent_at', sa.DateTime(), nullable=True))
+    if not index_exists('newsletter_subscribers', INDEX):
+        op.create_index(INDEX, 'newsletter_subscribers', ['confirm_token'], unique=True)
+
+
+def downgrade():
+    if index_exists('newsletter_subscribers', INDEX):
+        op.drop_index(INDEX, table_name='newsletter_subscribers')
+    with op.batch_alter_table('newsletter_subscribers') as batch:
+        if column_exists('newsletter_subscribers', 'confirm_sent_at'):
+            batch.drop_column('confirm_sent_at')
+        if column_exists('newsletter_subscribers', 'confirm_token'):
+            batch.drop_column('confirm_token')
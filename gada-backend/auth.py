@@ -1,11 +1,12 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import secrets, hashlib, re
+import secrets, hashlib, hmac, re, threading, time
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-import models, database
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+import models, database, hashing
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -19,10 +20,18 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+# Resolved token subjects kept in memory; the TTL bounds how long a change made
+# by another process (or outside the ORM) can go unnoticed
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', '1024'))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+# Seconds between bulk reloads of users' token versions
+TOKEN_VERSION_REFRESH = float(os.getenv('TOKEN_VERSION_REFRESH', '10'))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt context lives in hashing so the hash pool's worker processes can use it
+pwd_context = hashing.pwd_context
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Inline (blocking) helpers; request handlers await hashing.pool instead
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -40,14 +49,26 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def access_token_for(user: models.User) -> str:
+    """Access token carrying enough claims to authorize the user without loading the row."""
+    return create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role,
+        "approved": bool(user.approved),
+        "ev": bool(user.email_verified),
+        "tv": user.token_version or 0,
+    })
+
 def generate_refresh_token() -> str:
     return secrets.token_urlsafe(64)
 
-def hash_refresh_token(raw: str) -> str:
-    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+def hash_refresh_token(raw: str) -> bytes:
+    # stored as the raw 32-byte digest: half the size of hex in the token index
+    return hashlib.sha256(raw.encode('utf-8')).digest()
 
-def verify_refresh_token(raw: str, stored_hash: str) -> bool:
-    return hash_refresh_token(raw) == stored_hash
+def verify_refresh_token(raw: str, stored_hash: bytes) -> bool:
+    return hmac.compare_digest(hash_refresh_token(raw), stored_hash)
 
 PASSWORD_MIN_LENGTH = 8
 _PASSWORD_REGEXES = [
@@ -66,45 +87,273 @@ def password_strength_errors(pw: str) -> list[str]:
             errors.append(f"at least one {desc}")
     return errors
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
+class UserCache:
+    """LRU of user rows by username (the token subject), each kept for `ttl` seconds.
+
+    Entries are plain column dicts, not ORM objects, so nothing is shared
+    between sessions: `resolve` rebuilds a User and attaches it to the caller's
+    session without a SELECT. Missing users are not cached.
+    """
+    def __init__(self, max_entries: int = AUTH_USER_CACHE_SIZE, ttl: int = AUTH_USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # username -> (column values, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, db: Session, username: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                values = entry[0]
+            else:
+                self.misses += 1
+                values = None
+        if values is not None:
+            user = models.User(**values)
+            make_transient_to_detached(user)
+            # returns the session's own instance if this user is already loaded there
+            return db.merge(user, load=False)
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if user is not None:
+            values = {attr.key: getattr(user, attr.key) for attr in inspect(models.User).column_attrs}
+            with self._lock:
+                self._entries[username] = (values, now + self.ttl)
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, usernames):
+        with self._lock:
+            for username in usernames:
+                self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+user_cache = UserCache()
+
+
+class TokenVersions:
+    """user id -> (token_version, username), checked against the `tv` and `sub`
+    claims of every access token.
+
+    The whole map is reloaded with one query at most every `refresh` seconds;
+    between reloads a check is a dict lookup. Versions committed by this process
+    are applied at once (hooks below); other processes' changes within `refresh`
+    seconds. Ids missing from the map (registered since the last reload) are
+    loaded one by one, and ids that turn out not to exist are kept as None.
+    """
+    def __init__(self, refresh: float = TOKEN_VERSION_REFRESH):
+        self.refresh = refresh
+        self._versions: dict[int, tuple[int, str] | None] = {}
+        self._loaded_at: float | None = None
+        self._since_reload: dict | None = None  # local changes committed while a reload runs
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+        self.point_loads = 0
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh
+
+    def _reload(self, db: Session):
+        with self._lock:
+            self._since_reload = {}
+        started = time.monotonic()
+        try:
+            rows = db.execute(select(models.User.id, models.User.token_version, models.User.username)).all()
+        except Exception:
+            with self._lock:
+                self._since_reload = None
+            raise
+        versions = {uid: (tv or 0, username) for uid, tv, username in rows}
+        with self._lock:
+            versions.update(self._since_reload)
+            self._versions, self._since_reload = versions, None
+            self._loaded_at = started
+            self.reloads += 1
+
+    def current(self, db: Session, user_id: int) -> tuple[int, str] | None:
+        """The user's (token version, username), or None if the user does not exist."""
+        if self._stale():
+            # the first load blocks; afterwards one request reloads while the rest use the old map
+            if self._reload_lock.acquire(blocking=self._loaded_at is None):
+                try:
+                    if self._stale():
+                        self._reload(db)
+                finally:
+                    self._reload_lock.release()
+        with self._lock:
+            if user_id in self._versions:
+                return self._versions[user_id]
+        row = db.execute(select(models.User.token_version, models.User.username).where(models.User.id == user_id)).first()
+        version = None if row is None else (row[0] or 0, row[1])
+        self.apply({user_id: version}, count=True)
+        return version
+
+    def apply(self, changes: dict, count: bool = False):
+        with self._lock:
+            self._versions.update(changes)
+            if self._since_reload is not None:
+                self._since_reload.update(changes)
+            if count:
+                self.point_loads += 1
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._loaded_at = None
+            self.reloads = self.point_loads = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._versions),
+                "refresh_seconds": self.refresh,
+                "age_seconds": None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1),
+                "reloads": self.reloads,
+                "point_loads": self.point_loads,
+            }
+
+
+token_versions = TokenVersions()
+
+
+def forget_user(db: Session, user: models.User):
+    """Drop a user's cached auth record once the caller's transaction commits."""
+    db.info.setdefault('auth_users', set()).add(user.username)
+
+
+def revoke_tokens(db: Session, user: models.User):
+    """Invalidate the user's access tokens issued so far (takes effect on commit)."""
+    user.token_version = (user.token_version or 0) + 1
+    forget_user(db, user)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    # any other ORM write to a user (password reset, new token fields...) also invalidates,
+    # under the old username too if it changed
+    changed, versions = set(), {}
+    for obj in session.new:
+        if isinstance(obj, models.User):
+            versions[obj.id] = (inspect(obj).dict.get('token_version') or 0, obj.username)
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = inspect(obj)
+            changed.update(state.attrs.username.history.deleted or ())
+            changed.add(obj.username)
+            if state.attrs.token_version.history.has_changes() or state.attrs.username.history.has_changes():
+                versions[obj.id] = (obj.token_version or 0, obj.username)
+    for obj in session.deleted:
+        if isinstance(obj, models.User):
+            changed.add(obj.username)
+            versions[obj.id] = None
+    if changed:
+        session.info.setdefault('auth_users', set()).update(changed)
+    if versions:
+        session.info.setdefault('token_versions', {}).update(versions)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_user_changes(session):
+    changed = session.info.pop('auth_users', None)
+    if changed:
+        user_cache.invalidate(changed)
+    versions = session.info.pop('token_versions', None)
+    if versions:
+        token_versions.apply(versions)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('auth_users', None)
+    session.info.pop('token_versions', None)
+
+
+class Principal:
+    """The caller as described by a verified access token."""
+    __slots__ = ('id', 'username', 'role', 'approved', 'email_verified')
+
+    def __init__(self, claims: dict):
+        self.id = claims["uid"]
+        self.username = claims["sub"]
+        self.role = claims.get("role")
+        self.approved = bool(claims.get("approved"))
+        self.email_verified = bool(claims.get("ev"))
+
+
+def _credentials_error():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _principal(db: Session, token: str) -> Principal | None:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+        return None
+    if payload.get("sub") is None or "uid" not in payload or "tv" not in payload:
+        return None  # issued before tokens carried claims; the client refreshes
+    if token_versions.current(db, payload["uid"]) != (payload["tv"], payload["sub"]):
+        return None  # revoked, renamed, or the user was deleted (ids are never reused)
+    return Principal(payload)
 
-def get_current_user_optional(request: Request, db: Session = Depends(database.get_db)):
-    """Return current user if Authorization header present and valid; else None."""
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)) -> Principal:
+    """Authorize from token claims alone; use get_current_user when the endpoint needs the row."""
+    principal = _principal(db, token)
+    if principal is None:
+        raise _credentials_error()
+    return principal
+
+def get_current_principal_optional(request: Request, db: Session = Depends(database.get_db)) -> Principal | None:
+    """Return the caller's principal if an Authorization header is present and valid; else None."""
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.lower().startswith("bearer "):
         return None
-    token = auth_header.split()[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
-        return None
-    user = db.query(models.User).filter(models.User.username == username).first()
+    return _principal(db, auth_header.split()[1])
+
+def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(database.get_db)):
+    user = user_cache.resolve(db, principal.username)
+    if user is None or user.id != principal.id:
+        raise _credentials_error()
     return user
 
+def get_current_user_optional(principal: Principal | None = Depends(get_current_principal_optional), db: Session = Depends(database.get_db)):
+    """Return current user if Authorization header present and valid; else None."""
+    if principal is None:
+        return None
+    user = user_cache.resolve(db, principal.username)
+    return user if user is not None and user.id == principal.id else None
+
 # Dependency to check if current user is admin
 from fastapi import Security
-def get_current_admin(current_user: models.User = Depends(get_current_user)):
-    if current_user.role != "admin":
+def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if principal.role != "admin":
         raise HTTPException(status_code=403, detail="Admin privileges required")
-    if not current_user.email_verified:
+    if not principal.email_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
-    return current_user
+    return principal
@@ -0,0 +1,60 @@
+"""Password verify latency per hash cost on this machine.
+
+Times `verify` (what every login pays) for each bcrypt cost in a range, and
+argon2id at the configured settings when argon2-cffi is installed, then
+suggests the highest bcrypt cost that stays under the target. Set the result
+as BCRYPT_ROUNDS; existing hashes are upgraded as users log in.
+
+    python benchmarks/bcrypt_cost.py [--min 10] [--max 14] [--repeat 5] [--target-ms 250]
+"""
+import argparse, os, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing
+
+PASSWORD = 'Correct-horse-battery-1'
+
+
+def verify_ms(context, repeat: int) -> list[float]:
+    hashed = context.hash(PASSWORD)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        assert context.verify(PASSWORD, hashed)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main(low: int, high: int, repeat: int, target_ms: float):
+    print(f"verify latency, {repeat} runs each, {os.cpu_count()} cores; configured: {hashing.PASSWORD_SCHEME}, bcrypt cost {hashing.BCRYPT_ROUNDS}")
+    print(f"{'hash':<22}{'median ms':>10}{'max ms':>10}{'logins/s/core':>15}")
+    best = None
+    for rounds in range(low, high + 1):
+        times = verify_ms(hashing.make_context('bcrypt', rounds, rounds), repeat)
+        median = statistics.median(times)
+        if median <= target_ms:
+            best = rounds
+        print(f"{f'bcrypt cost {rounds}':<22}{median:>10.1f}{max(times):>10.1f}{1000 / median:>15.1f}")
+    try:
+        times = verify_ms(hashing.make_context('argon2'), repeat)
+    except Exception as e:  # passlib raises MissingBackendError without argon2-cffi
+        print(f"{'argon2id':<22}  skipped ({e.__class__.__name__})")
+    else:
+        median = statistics.median(times)
+        label = f"argon2id t={hashing.ARGON2_TIME_COST} m={hashing.ARGON2_MEMORY_COST // 1024}MiB"
+        print(f"{label:<22}{median:>10.1f}{max(times):>10.1f}{1000 / median:>15.1f}")
+    if best is None:
+        print(f"no bcrypt cost in {low}..{high} verifies within {target_ms:.0f} ms")
+    else:
+        print(f"highest bcrypt cost within {target_ms:.0f} ms: {best} (BCRYPT_ROUNDS={best})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--min', type=int, default=10)
+    parser.add_argument('--max', type=int, default=14)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=250)
+    args = parser.parse_args()
+    main(args.min, args.max, args.repeat, args.target_ms)
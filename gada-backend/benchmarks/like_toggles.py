@@ -0,0 +1,84 @@
+"""Sustained like toggles per second: commit-per-click vs the write-behind buffer.
+
+Runs a burst of concurrent clickers against one post in a throwaway SQLite
+file for a fixed duration with each mode, then checks that likes_count equals
+the like rows once the buffer has been flushed.
+
+    python benchmarks/like_toggles.py [--threads 16] [--seconds 5]
+"""
+import argparse, os, sys, tempfile, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import counters, like_buffer, models
+
+
+def run(mode: str, threads: int, seconds: float) -> tuple[float, int, int]:
+    fd, path = tempfile.mkstemp(prefix='bench_likes_', suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}', connect_args={"check_same_thread": False, "timeout": 30})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        post = models.Post(title='Campaign', date='2025-01-01', details='x', image='a.jpg', status='published')
+        s.add(post)
+        s.commit()
+        post_id = post.id
+    buf = like_buffer.LikeBuffer(session_factory=Session)
+    if mode == 'buffered':
+        buf.start()
+    done = threading.Event()
+    clicks = [0] * threads
+
+    def clicker(n):
+        with Session() as s:
+            while not done.is_set():
+                user_id = n * 1_000_000 + (clicks[n] % 500) + 1  # each thread cycles through 500 users
+                if mode == 'buffered':
+                    buf.toggle(s, post_id, user_id)
+                else:
+                    counters.toggle_like(s, post_id, user_id)
+                s.commit()
+                clicks[n] += 1
+
+    workers = [threading.Thread(target=clicker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    done.set()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    if mode == 'buffered':
+        buf.stop()
+    with Session() as s:
+        rows = s.query(models.PostLike).filter_by(post_id=post_id).count()
+        count = s.get(models.Post, post_id).likes_count
+    engine.dispose()
+    os.unlink(path)
+    return sum(clicks) / elapsed, rows, count
+
+
+def main(threads: int, seconds: float):
+    print(f"{threads} clicker threads, {seconds:.0f}s per mode")
+    print(f"{'mode':<12}{'toggles/s':>12}{'like rows':>12}{'likes_count':>13}")
+    results = {}
+    for mode in ('direct', 'buffered'):
+        rate, rows, count = run(mode, threads, seconds)
+        assert rows == count, f'{mode}: likes_count {count} != {rows} rows'
+        results[mode] = rate
+        print(f"{mode:<12}{rate:>12.0f}{rows:>12}{count:>13}")
+    print(f"speed-up: {results['buffered'] / results['direct']:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    main(args.threads, args.seconds)
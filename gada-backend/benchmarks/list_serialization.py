@@ -0,0 +1,98 @@
+"""Compare the validated and FAST_JSON serialization paths of the list endpoints.
+
+Seeds a throwaway SQLite database, then times each endpoint at a large page
+size with both paths and checks that the response bodies are identical.
+
+    python benchmarks/list_serialization.py [--rows 200] [--repeat 50]
+"""
+import argparse, os, sys, tempfile, time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+os.environ['AUTO_CREATE'] = '0'
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import auth, database, fastjson, feedcache, main, models
+
+
+def seed(session, rows: int):
+    base = datetime(2025, 1, 1, 8, 0, 0, 250000)
+    admin = models.User(username='bench_admin', email='bench_admin@example.com', hashed_password='x', role='admin', approved=True, email_verified=True)
+    session.add(admin)
+    session.add_all(models.User(username=f'user{i}', email=f'user{i}@example.com', hashed_password='x', full_name=f'User {i}', role='user', approved=bool(i % 2)) for i in range(rows))
+    session.add_all(models.Post(title=f'Post {i} about the region', date='2025-01-01', details='Lorem ipsum dolor sit amet. ' * 40, image=f'/uploads/{i}.jpg',
+                                status='published', publish_at=base + timedelta(hours=i)) for i in range(rows))
+    session.add_all(models.InvestorProposal(name=f'Company {i}', email=f'c{i}@example.com', sector='agro', phone=str(i), proposal_filename=f'{i}.pdf') for i in range(rows))
+    session.commit()
+    post_id = session.query(models.Post.id).order_by(models.Post.id).first().id
+    session.add_all(models.Comment(post_id=post_id, user_id=1 + i % rows, content=f'Comment number {i}') for i in range(rows))
+    session.commit()
+    return admin, post_id
+
+
+def timed(client, url, params, headers, repeat: int):
+    best, body = float('inf'), None
+    for _ in range(repeat):
+        feedcache.cache.clear()  # measure the query + serialization, not cache hits
+        start = time.perf_counter()
+        resp = client.get(url, params=params, headers=headers)
+        best = min(best, time.perf_counter() - start)
+        body = resp.content
+    return best, body
+
+
+def main_(rows: int, repeat: int):
+    fd, path = tempfile.mkstemp(prefix='bench_gada_', suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}', connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[database.get_db] = get_db
+    with Session() as session:
+        admin, post_id = seed(session, rows)
+        token = auth.access_token_for(admin)
+    admin_headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'identity'}
+    cases = [
+        ('/posts (public)', '/posts', {'limit': 100}, {'Accept-Encoding': 'identity'}),
+        ('/posts (admin)', '/posts', {'limit': 100, 'status': 'all'}, admin_headers),
+        ('/posts summary', '/posts', {'limit': 100, 'fields': 'summary'}, {'Accept-Encoding': 'identity'}),
+        ('/users', '/users', {'limit': 100}, admin_headers),
+        ('/investor-proposals', '/investor-proposals', {'limit': 200}, admin_headers),
+        ('/posts/{id}/comments', f'/posts/{post_id}/comments', {'limit': 200}, {'Accept-Encoding': 'identity'}),
+    ]
+    client = TestClient(main.app)
+    print(f"encoder: {'orjson' if fastjson.orjson else 'json (stdlib)'}; rows={rows}, best of {repeat}")
+    print(f"{'endpoint':<24}{'validated ms':>14}{'fast ms':>10}{'speed-up':>10}")
+    try:
+        for label, url, params, headers in cases:
+            fastjson.FAST_JSON = False
+            slow, slow_body = timed(client, url, params, headers, repeat)
+            fastjson.FAST_JSON = True
+            fast, fast_body = timed(client, url, params, headers, repeat)
+            assert slow_body == fast_body, f'{label}: fast path changed the response body'
+            print(f"{label:<24}{slow * 1000:>14.2f}{fast * 1000:>10.2f}{slow / fast:>9.2f}x")
+    finally:
+        main.app.dependency_overrides.clear()
+        engine.dispose()
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    main_(args.rows, args.repeat)
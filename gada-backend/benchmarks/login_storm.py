@@ -0,0 +1,154 @@
+"""`/posts` latency while a storm of logins hashes passwords.
+
+Serves the app with uvicorn on a throwaway SQLite file and measures GET /posts
+from one client: first idle, then while `--clients` connections in a separate
+process log in back to back (a 503 is retried after its Retry-After). The storm
+runs twice: with bcrypt inline on the request threadpool (how the sync
+endpoints used to run it) and with the bounded hash pool.
+
+    python benchmarks/login_storm.py [--clients 48] [--seconds 10]
+"""
+import argparse, http.client, os, socket, statistics, subprocess, sys, tempfile, threading, time, urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+os.environ['AUTO_CREATE'] = '0'
+
+import uvicorn
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import auth, database, hashing, main, models
+
+USERS = 400  # the login rate limit allows 5 attempts a minute per username
+PASSWORD = 'Passw0rd!'
+
+
+class InlinePool(hashing.HashPool):
+    """bcrypt on the request threadpool with no bound: the old behaviour."""
+    async def _run(self, fn, *args):
+        return await run_in_threadpool(fn, *args)
+
+
+def seed(session):
+    hashed = auth.get_password_hash(PASSWORD)
+    session.add_all(models.User(username=f'storm{i}', email=f'storm{i}@example.com', hashed_password=hashed,
+                                role='user', approved=True, email_verified=True) for i in range(USERS))
+    session.add_all(models.Post(title=f'Post {i}', date='2025-01-01', details='Lorem ipsum. ' * 40, image=f'/uploads/{i}.jpg',
+                                status='published') for i in range(200))
+    session.commit()
+
+
+def serve():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, port
+
+
+def get_posts(port: int, seconds: float) -> list[float]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies, deadline = [], time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request('GET', '/posts?limit=20')
+        resp = conn.getresponse()
+        resp.read()
+        assert resp.status == 200, resp.status
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies
+
+
+def storm(port: int, clients: int):
+    """Storm client process: log in until stdin closes, then print status counts."""
+    done, counts, lock = threading.Event(), {}, threading.Lock()
+
+    def client(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        i = n
+        while not done.is_set():
+            body = urllib.parse.urlencode({'username': f'storm{i % USERS}', 'password': PASSWORD})
+            conn.request('POST', '/token', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+            resp = conn.getresponse()
+            resp.read()
+            with lock:
+                counts[resp.status] = counts.get(resp.status, 0) + 1
+            if resp.status == 503:
+                done.wait(float(resp.getheader('Retry-After', '1')))
+            i += clients
+        conn.close()
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for w in workers:
+        w.start()
+    sys.stdin.read()
+    done.set()
+    for w in workers:
+        w.join()
+    print(', '.join(f"{status}: {n}" for status, n in sorted(counts.items())))
+
+
+def summary(latencies: list[float]) -> str:
+    q = statistics.quantiles(latencies, n=100, method='inclusive')
+    return f"{len(latencies):>8}{statistics.median(latencies) * 1000:>10.1f}{q[94] * 1000:>10.1f}{max(latencies) * 1000:>10.1f}"
+
+
+def main_(clients: int, seconds: float):
+    fd, path = tempfile.mkstemp(prefix='bench_logins_', suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}', connect_args={"check_same_thread": False, "timeout": 30})
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as s:
+        seed(s)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+    main.app.dependency_overrides[database.get_db] = get_db
+    server, thread, port = serve()
+    hashing.pool.start()
+    print(f"{clients} login clients, {seconds:.0f}s per run, {os.cpu_count()} cores, hash pool workers={hashing.HASH_WORKERS} queue={hashing.HASH_QUEUE_SIZE}")
+    print(f"{'run':<18}{'requests':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}   logins")
+    print(f"{'idle':<18}{summary(get_posts(port, seconds))}")
+    pooled = hashing.pool
+    for name, pool in (('storm, inline', InlinePool()), ('storm, hash pool', pooled)):
+        hashing.pool = pool
+        proc = subprocess.Popen([sys.executable, __file__, '--storm', str(port), '--clients', str(clients)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        time.sleep(2)  # let the storm build up
+        latencies = get_posts(port, seconds)
+        logins, _ = proc.communicate('')
+        print(f"{name:<18}{summary(latencies)}   {logins.strip()}")
+    hashing.pool = pooled
+    stats = pooled.stats()
+    print(f"hash pool: queue wait avg {stats['queue_wait_ms_avg']} ms (max {stats['queue_wait_ms_max']}), "
+          f"hash avg {stats['hash_ms_avg']} ms, rejected {stats['rejected']}")
+    server.should_exit = True
+    thread.join()
+    pooled.shutdown()
+    engine.dispose()
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=48)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--storm', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.storm:
+        storm(args.storm, args.clients)
+    else:
+        main_(args.clients, args.seconds)
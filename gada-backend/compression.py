@@ -0,0 +1,255 @@
+"""Negotiated gzip/brotli response compression.
+
+`CompressionMiddleware` compresses JSON and other text responses (API routes
+and the /uploads static mount) when the client accepts it and the body is at
+least `COMPRESSION_MIN_SIZE` bytes. Already-compressed media (JPEG/PNG/WebP/GIF,
+PDF) and streaming responses such as Server-Sent Events pass through untouched.
+
+Responses carrying an ETag (cached /posts pages, static files) are cacheable:
+their compressed variants are kept in a bounded LRU keyed by (ETag, encoding),
+so a popular page or file is compressed once, not once per request.
+
+Per-route CPU cost is recorded in `stats()` and compression can be switched
+off per route with `COMPRESSION_EXCLUDE` (comma-separated path prefixes) or
+`COMPRESSION_ENABLED=0` globally.
+"""
+import gzip, os, threading, time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_EXCLUDE = [p.strip() for p in os.getenv('COMPRESSION_EXCLUDE', '').split(',') if p.strip()]
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+VARIANT_CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', '512'))
+# Bodies larger than this are streamed through uncompressed rather than buffered
+MAX_BUFFER_BYTES = 8 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'text/html', 'text/plain', 'text/css', 'text/csv',
+    'application/javascript', 'text/javascript', 'image/svg+xml', 'application/xml', 'text/xml',
+)
+
+
+def supported_encodings() -> list[str]:
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Pick the best supported encoding from an Accept-Encoding header (q-values honoured; br preferred on ties)."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            weights[token] = q
+    best, best_q = None, 0.0
+    for enc in supported_encodings():
+        q = weights.get(enc, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: dict[str, dict] = {}
+        self.variant_hits = 0
+        self.variant_misses = 0
+
+    def record(self, route: str, encoding: str, bytes_in: int, bytes_out: int, seconds: float, cached: bool):
+        with self._lock:
+            r = self._routes.setdefault(route, {"responses": 0, "cached": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0, "encodings": {}})
+            r["responses"] += 1
+            r["bytes_in"] += bytes_in
+            r["bytes_out"] += bytes_out
+            r["cpu_seconds"] += seconds
+            r["encodings"][encoding] = r["encodings"].get(encoding, 0) + 1
+            if cached:
+                r["cached"] += 1
+                self.variant_hits += 1
+            else:
+                self.variant_misses += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {}
+            for route, r in self._routes.items():
+                routes[route] = dict(r, encodings=dict(r["encodings"]), cpu_seconds=round(r["cpu_seconds"], 6),
+                                     ratio=round(r["bytes_out"] / r["bytes_in"], 4) if r["bytes_in"] else None)
+            return {"enabled": COMPRESSION_ENABLED, "encodings": supported_encodings(), "min_size": COMPRESSION_MIN_SIZE,
+                    "variant_hits": self.variant_hits, "variant_misses": self.variant_misses, "routes": routes}
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+            self.variant_hits = self.variant_misses = 0
+
+
+_stats = _Stats()
+_variants: OrderedDict = OrderedDict()  # (etag, encoding) -> compressed bytes
+_variants_lock = threading.Lock()
+
+
+def stats() -> dict:
+    return _stats.snapshot()
+
+
+def clear():
+    _stats.clear()
+    with _variants_lock:
+        _variants.clear()
+
+
+def _cached_variant(etag: str, encoding: str, body: bytes) -> tuple[bytes, bool]:
+    key = (etag, encoding)
+    with _variants_lock:
+        hit = _variants.get(key)
+        if hit is not None:
+            _variants.move_to_end(key)
+            return hit, True
+    out = compress(body, encoding)
+    with _variants_lock:
+        _variants[key] = out
+        while len(_variants) > VARIANT_CACHE_SIZE:
+            _variants.popitem(last=False)
+    return out, False
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Weak validator for the compressed representation of a response tagged `etag`."""
+    tag = etag.removeprefix('W/').strip('"')
+    return f'W/"{tag}-{encoding}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak If-None-Match comparison that also accepts the validators of our compressed variants."""
+    if not if_none_match:
+        return False
+    tag = etag.removeprefix('W/').strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip().removeprefix('W/').strip('"')
+        if candidate == '*' or candidate == tag or candidate in (f'{tag}-{enc}' for enc in ('br', 'gzip')):
+            return True
+    return False
+
+
+def _header(headers, name: bytes) -> str | None:
+    for k, v in headers:
+        if k.lower() == name:
+            return v.decode('latin-1')
+    return None
+
+
+def _route_name(scope) -> str:
+    route = scope.get('route')
+    if route is not None and getattr(route, 'path', None):
+        return route.path
+    path = scope.get('path', '')
+    return '/uploads' if path.startswith('/uploads/') else path
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, exclude: list[str] | None = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.exclude = list(COMPRESSION_EXCLUDE if exclude is None else exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not COMPRESSION_ENABLED or scope.get('method') == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        if any(scope.get('path', '').startswith(prefix) for prefix in self.exclude):
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(_header(scope.get('headers', []), b'accept-encoding') or '')
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks: list[bytes] = []
+        size = 0
+        passthrough = False
+
+        async def flush_passthrough():
+            await send(start)
+            if chunks:
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+                chunks.clear()
+
+        async def wrapped_send(message):
+            nonlocal start, size, passthrough
+            if message['type'] == 'http.response.start':
+                start = message
+                headers = message.get('headers', [])
+                ctype = (_header(headers, b'content-type') or '').split(';')[0].strip().lower()
+                if (message['status'] != 200 or _header(headers, b'content-encoding')
+                        or ctype not in COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] != 'http.response.body':
+                # e.g. http.response.pathsend: the server streams the file itself
+                passthrough = True
+                await flush_passthrough()
+                await send(message)
+                return
+            body = message.get('body', b'')
+            more = message.get('more_body', False)
+            chunks.append(body)
+            size += len(body)
+            if more:
+                if size > MAX_BUFFER_BYTES:
+                    passthrough = True
+                    await flush_passthrough()
+                return
+            full = b''.join(chunks)
+            if len(full) < self.minimum_size:
+                await send(start)
+                await send({'type': 'http.response.body', 'body': full})
+                return
+            headers = [(k, v) for k, v in start.get('headers', []) if k.lower() not in (b'content-length', b'etag', b'vary')]
+            etag = _header(start.get('headers', []), b'etag')
+            vary = _header(start.get('headers', []), b'vary')
+            started = time.perf_counter()
+            if etag:
+                out, cached = _cached_variant(etag, encoding, full)
+            else:
+                out, cached = compress(full, encoding), False
+            _stats.record(_route_name(scope), encoding, len(full), len(out), time.perf_counter() - started, cached)
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+            headers.append((b'content-length', str(len(out)).encode('latin-1')))
+            vary = f'{vary}, Accept-Encoding' if vary and 'accept-encoding' not in vary.lower() else (vary or 'Accept-Encoding')
+            headers.append((b'vary', vary.encode('latin-1')))
+            if etag:
+                # the compressed representation gets its own (weak) validator
+                headers.append((b'etag', variant_etag(etag, encoding).encode('latin-1')))
+            await send({**start, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': out})
+
+        await self.app(scope, receive, wrapped_send)
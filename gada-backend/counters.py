@@ -0,0 +1,76 @@
+"""Atomic like/comment counters on posts.
+
+`posts.likes_count` / `posts.comments_count` are moved with a single
+`UPDATE posts SET n = max(n + delta, 0) ... RETURNING n` in the same
+transaction as the like/comment row change, instead of a read-modify-write on
+a loaded Post (which loses increments under concurrent requests). The like row
+itself is flipped with `DELETE ... RETURNING` / `INSERT ... ON CONFLICT DO
+NOTHING RETURNING`, so callers learn the new state without re-querying.
+
+These are Core statements, so the feed cache's flush hooks never see them;
+`feedcache.mark_post` queues the per-post invalidation for commit instead.
+Nothing here commits: the caller owns the transaction.
+"""
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.sqlite import insert
+
+import models, feedcache
+
+
+def _bump(db, column, post_id: int, delta: int) -> int | None:
+    """Apply `delta` to a post counter; returns the new value, or None when the post does not exist."""
+    new = db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values({column: func.max(func.coalesce(column, 0) + delta, 0)})
+        .returning(column)
+    ).scalar_one_or_none()
+    if new is not None and delta:
+        feedcache.mark_post(db, post_id)
+    return new
+
+
+def toggle_like(db, post_id: int, user_id: int) -> tuple[bool, int] | None:
+    """Flip a user's like on a post. Returns (liked, likes_count), or None if the post does not exist."""
+    removed = db.execute(
+        delete(models.PostLike)
+        .where(models.PostLike.post_id == post_id, models.PostLike.user_id == user_id)
+        .returning(models.PostLike.id)
+    ).first()
+    if removed is not None:
+        liked, delta = False, -1
+    else:
+        stmt = insert(models.PostLike).values(post_id=post_id, user_id=user_id)
+        inserted = db.execute(
+            stmt.on_conflict_do_nothing(index_elements=['post_id', 'user_id']).returning(models.PostLike.id)
+        ).first()
+        # a concurrent request may have inserted the same like first; it already counted it
+        liked, delta = True, 1 if inserted is not None else 0
+    count = _bump(db, models.Post.likes_count, post_id, delta)
+    if count is None:
+        return None
+    return liked, count
+
+
+def comment_added(db, post_id: int) -> int | None:
+    return _bump(db, models.Post.comments_count, post_id, 1)
+
+
+def comment_removed(db, post_id: int) -> int | None:
+    return _bump(db, models.Post.comments_count, post_id, -1)
+
+
+def user_removed(db, user_id: int) -> int:
+    """Delete a user's likes and take them off each post's likes_count. Returns how many were removed."""
+    post_ids = db.execute(
+        delete(models.PostLike).where(models.PostLike.user_id == user_id).returning(models.PostLike.post_id)
+    ).scalars().all()
+    if post_ids:
+        db.execute(
+            update(models.Post).where(models.Post.id.in_(post_ids))
+            .values(likes_count=func.max(func.coalesce(models.Post.likes_count, 0) - 1, 0)),
+            execution_options={'synchronize_session': False},
+        )
+        for post_id in post_ids:
+            feedcache.mark_post(db, post_id)
+    return len(post_ids)
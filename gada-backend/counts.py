@@ -0,0 +1,104 @@
+"""Row counts maintained transactionally alongside writes.
+
+List endpoints used to run `query.count()` before every page. Instead, mapper
+events bump a `table_counts` row per (entity, bucket) inside the same flush as
+the insert/delete/status change, so the count commits or rolls back with the
+write. Buckets are the status value for posts and investor proposals and
+'all' for users; comments per post use the denormalized `posts.comments_count`.
+
+Bulk `query(...).delete()` / Core statements bypass mapper events; code doing
+those must call `rebuild()` (see wipe_users.py).
+"""
+from sqlalchemy import event, func, inspect, select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+
+ALL_BUCKET = 'all'
+NULL_BUCKET = 'none'
+
+# mapped class -> (entity name, bucket column or None for a single 'all' bucket)
+TRACKED = {
+    models.Post: ('posts', 'status'),
+    models.InvestorProposal: ('investor_proposals', 'status'),
+    models.User: ('users', None),
+}
+
+TOTAL_MODES = {'exact', 'estimate', 'none'}
+
+
+def _bucket_value(value) -> str:
+    return NULL_BUCKET if value is None else str(value)
+
+
+def _bump(connection, entity: str, bucket: str, delta: int):
+    stmt = insert(models.TableCount).values(entity=entity, bucket=bucket, count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['entity', 'bucket'],
+        set_={'count': models.TableCount.count + stmt.excluded['count']},
+    )
+    connection.execute(stmt)
+
+
+def _register(cls, entity: str, column: str | None):
+    def bucket_of(target):
+        return _bucket_value(getattr(target, column)) if column else ALL_BUCKET
+
+    @event.listens_for(cls, 'after_insert')
+    def _after_insert(mapper, connection, target):
+        _bump(connection, entity, bucket_of(target), 1)
+
+    @event.listens_for(cls, 'after_delete')
+    def _after_delete(mapper, connection, target):
+        _bump(connection, entity, bucket_of(target), -1)
+
+    if column:
+        # active_history loads the previous value even when the attribute was expired,
+        # so a status change always knows which bucket to move the row out of
+        @event.listens_for(getattr(cls, column), 'set', active_history=True)
+        def _track_old(target, value, oldvalue, initiator):
+            pass
+
+        @event.listens_for(cls, 'after_update')
+        def _after_update(mapper, connection, target):
+            hist = inspect(target).attrs[column].history
+            if not hist.has_changes() or not hist.deleted:
+                return
+            old, new = _bucket_value(hist.deleted[0]), bucket_of(target)
+            if old != new:
+                _bump(connection, entity, old, -1)
+                _bump(connection, entity, new, 1)
+
+
+for _cls, (_entity, _column) in TRACKED.items():
+    _register(_cls, _entity, _column)
+
+
+def get(db, entity: str, buckets=None) -> int:
+    """Sum of the maintained counts for `entity`, restricted to `buckets` when given."""
+    q = db.query(func.coalesce(func.sum(models.TableCount.count), 0)).filter(models.TableCount.entity == entity)
+    if buckets is not None:
+        q = q.filter(models.TableCount.bucket.in_([_bucket_value(b) for b in buckets]))
+    return int(q.scalar())
+
+
+def rebuild(connection):
+    """Recompute every maintained count from the base tables (one GROUP BY per entity)."""
+    connection.execute(delete(models.TableCount))
+    for cls, (entity, column) in TRACKED.items():
+        if column:
+            col = getattr(cls, column)
+            rows = connection.execute(select(col, func.count()).group_by(col)).all()
+        else:
+            rows = [(ALL_BUCKET, connection.execute(select(func.count()).select_from(cls)).scalar())]
+        for bucket, n in rows:
+            if n:
+                connection.execute(insert(models.TableCount).values(
+                    entity=entity, bucket=_bucket_value(bucket) if column else bucket, count=n))
+
+
+@event.listens_for(models.Base.metadata, 'after_create')
+def _seed_counts(target, connection, **kw):
+    # Databases created before table_counts existed start with an empty table
+    if connection.execute(select(func.count()).select_from(models.TableCount)).scalar() == 0:
+        rebuild(connection)
@@ -0,0 +1,195 @@
+"""In-process pub/sub hub behind the Server-Sent Events endpoints.
+
+Write paths call `hub.publish(topic, event, data)` after they commit. Topics
+are `post:<id>` (comments, like counts) and `feed` (newly published posts).
+Every open `/posts/{id}/events` or `/posts/events` stream is an asyncio queue
+on the server loop; publishing hands the event to each queue with
+`call_soon_threadsafe`, so readers never touch the database.
+
+- Backpressure: a subscriber whose queue (`SSE_QUEUE_SIZE`) is full is sent a
+  `lagged` event and disconnected instead of slowing publishers or growing
+  without bound; the browser reconnects with `Last-Event-ID`.
+- Resume: each topic keeps its last `SSE_REPLAY_SIZE` events (for the
+  `SSE_REPLAY_TOPICS` most recently active topics); a reconnect with
+  `Last-Event-ID` replays what it missed, or gets `reset` (refetch) when the id
+  is older than the buffer or from a previous server process.
+- `SSE_HEARTBEAT` seconds of silence send a comment line, which keeps proxies
+  from closing idle streams and notices disconnected clients.
+- At most `SSE_MAX_SUBSCRIBERS` streams are open per process; more get a 503.
+
+The hub is per process: with several workers each reader only sees events
+published by the worker it is connected to.
+"""
+import asyncio, itertools, os, threading, time
+from collections import OrderedDict, deque
+
+import fastjson
+
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '64'))
+SSE_REPLAY_SIZE = int(os.getenv('SSE_REPLAY_SIZE', '256'))
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', '5000'))
+# Topics with a replay buffer; the least recently published one is forgotten first
+SSE_REPLAY_TOPICS = int(os.getenv('SSE_REPLAY_TOPICS', '1024'))
+# Browsers wait this long (ms) before reconnecting a dropped stream
+SSE_RETRY_MS = 3000
+
+FEED_TOPIC = 'feed'
+
+# Ids are "<process epoch>-<sequence>" so ids from before a restart are recognisable
+EPOCH = format(int(time.time() * 1000), 'x')
+_LAGGED = object()
+
+
+def post_topic(post_id: int) -> str:
+    return f'post:{post_id}'
+
+
+class HubFull(Exception):
+    pass
+
+
+class _Subscriber:
+    def __init__(self, loop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def offer(self, item):
+        # runs on the subscriber's event loop
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_LAGGED)
+
+
+class Hub:
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, replay_size: int = SSE_REPLAY_SIZE, max_subscribers: int = SSE_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.replay_size = replay_size
+        self.max_subscribers = max_subscribers
+        self._topics: dict[str, set] = {}
+        self._replay: OrderedDict = OrderedDict()  # topic -> deque of (seq, id, event, payload)
+        self._evicted: dict[str, int] = {}  # topic -> newest sequence number pushed out of its replay buffer
+        self._forgotten = 0  # newest sequence number of any replay buffer dropped whole
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def _count(self) -> int:
+        return sum(len(subs) for subs in self._topics.values())
+
+    def publish(self, topic: str, event: str, data: dict):
+        """Fan an event out to the topic's subscribers; safe to call from any thread."""
+        payload = fastjson.dumps(data).decode('utf-8')
+        with self._lock:
+            seq = next(self._seq)
+            item = (seq, f'{EPOCH}-{seq}', event, payload)
+            replay = self._replay.get(topic)
+            if replay is None:
+                replay = self._replay[topic] = deque(maxlen=self.replay_size)
+                while len(self._replay) > SSE_REPLAY_TOPICS:
+                    old_topic, old = self._replay.popitem(last=False)
+                    self._evicted.pop(old_topic, None)
+                    self._forgotten = max(self._forgotten, old[-1][0])
+            else:
+                self._replay.move_to_end(topic)
+                if len(replay) == replay.maxlen:
+                    self._evicted[topic] = replay[0][0]
+            replay.append(item)
+            subscribers = list(self._topics.get(topic, ()))
+            self.published += 1
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, item)
+            except RuntimeError:  # loop already closed
+                self.unsubscribe(topic, sub)
+
+    def subscribe(self, topic: str, last_event_id: str | None = None):
+        """Register a subscriber on the running loop. Returns (subscriber, backlog, reset)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._count() >= self.max_subscribers:
+                raise HubFull()
+            sub = _Subscriber(loop, self.queue_size)
+            self._topics.setdefault(topic, set()).add(sub)
+            backlog, reset = self._backlog(topic, last_event_id)
+        return sub, backlog, reset
+
+    def _backlog(self, topic: str, last_event_id: str | None):
+        # caller holds the lock, so nothing is published between backlog and subscription
+        if not last_event_id:
+            return [], False
+        epoch, _, seq = last_event_id.partition('-')
+        replay = self._replay.get(topic, ())
+        if epoch != EPOCH or not seq.isdigit():
+            return [], True
+        seq = int(seq)
+        # sequence numbers are shared by all topics, so gaps are normal; only eviction loses events
+        if seq < self._evicted.get(topic, 0) or (topic not in self._replay and seq < self._forgotten):
+            return list(replay), True
+        return [item for item in replay if item[0] > seq], False
+
+    def unsubscribe(self, topic: str, sub):
+        with self._lock:
+            subs = self._topics.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._topics[topic]
+            if sub.lagged:
+                self.dropped += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": self._count(),
+                "topics": len(self._topics),
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+                "dropped_slow_subscribers": self.dropped,
+            }
+
+
+hub = Hub()
+
+
+def _frame(item) -> str:
+    _, event_id, event, payload = item
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
+
+
+def open_stream(request, topic: str, last_event_id: str | None = None):
+    """Subscribe now (raises HubFull before any response is sent) and return the SSE body generator."""
+    sub, backlog, reset = hub.subscribe(topic, last_event_id)
+    return _stream(request, topic, sub, backlog, reset)
+
+
+async def _stream(request, topic: str, sub, backlog, reset):
+    # retry hint, missed events, then live events and heartbeats
+    try:
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        if reset:
+            yield 'event: reset\ndata: {}\n\n'
+        for item in backlog:
+            yield _frame(item)
+        while True:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ': ping\n\n'
+                continue
+            if item is _LAGGED:
+                yield 'event: lagged\ndata: {}\n\n'
+                break
+            yield _frame(item)
+    finally:
+        hub.unsubscribe(topic, sub)
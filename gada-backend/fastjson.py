@@ -0,0 +1,78 @@
+"""Opt-in fast serialization for read-only list endpoints.
+
+With `FAST_JSON=1`, list endpoints select plain column rows (no ORM entities,
+no identity map) and encode them straight to JSON bytes instead of validating
+each row into a pydantic schema. The output is byte-for-byte the same as
+`Schema.model_validate(...).model_dump_json()`: keys in schema field order,
+compact separators, UTF-8, naive ISO-8601 datetimes.
+
+orjson is used when installed; otherwise the stdlib encoder is used, which is
+slower but still skips per-row validation.
+"""
+import json, os
+from datetime import datetime
+from fastapi import Response
+from pydantic_core import PydanticUndefined
+from sqlalchemy import inspect
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+FAST_JSON = os.getenv('FAST_JSON', '0') == '1'
+
+
+def enabled() -> bool:
+    return FAST_JSON
+
+
+def columns(model, schema, exclude=()) -> list:
+    """Mapped columns of `model` that `schema` serializes, in schema field order."""
+    mapped = inspect(model).column_attrs.keys()
+    return [getattr(model, name) for name in schema.model_fields if name in mapped and name not in exclude]
+
+
+def _default(field):
+    return None if field.default is PydanticUndefined else field.default
+
+
+def items(schema, rows, **overrides) -> list[dict]:
+    """Rows (anything with `_fields`, e.g. SQLAlchemy Rows) to dicts keyed like `schema`.
+
+    Fields missing from the rows take the schema default; `overrides` maps a field
+    name to a function of the row computing its value.
+    """
+    if not rows:
+        return []
+    present = rows[0]._fields
+    plan = []
+    for name, field in schema.model_fields.items():
+        if name in overrides:
+            plan.append((name, overrides[name], None))
+        elif name in present:
+            plan.append((name, None, present.index(name)))
+        else:
+            default = _default(field)
+            plan.append((name, lambda row, d=default: d, None))
+    if all(fn is None for _, fn, _ in plan):
+        names = [name for name, _, _ in plan]
+        idx = [i for _, _, i in plan]
+        return [dict(zip(names, [row[i] for i in idx])) for row in rows]
+    return [{name: (row[i] if fn is None else fn(row)) for name, fn, i in plan} for row in rows]
+
+
+def _stdlib_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_stdlib_default).encode('utf-8')
+
+
+def response(obj) -> Response:
+    return Response(content=dumps(obj), media_type='application/json')
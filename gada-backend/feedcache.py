@@ -0,0 +1,170 @@
+"""In-process LRU cache of serialized public /posts pages.
+
+Only the anonymous/non-admin visibility path is cached; every visitor sees the
+same pages there, so the JSON bytes (and their ETag, which also keys the
+compressed variants kept by `compression`) can be reused as-is. Entries are dropped:
+
+- on commit of any ORM change that can alter public pages (a published post
+  created, edited, unpublished or deleted; a post becoming published),
+- per post when only its like/comment counters change (`invalidate_post`),
+- when the next scheduled `publish_at` of a published post passes (`expires_at`),
+- after `FEED_CACHE_TTL` seconds, as a bound on writes made by other processes.
+"""
+import hashlib, os, threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import models
+
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', '256'))
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', '60'))
+
+# Post columns whose change only affects the cards showing that post
+COUNTER_FIELDS = {'likes_count', 'comments_count'}
+
+
+class FeedCache:
+    def __init__(self, max_entries: int = FEED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()  # key -> (payload, post_ids, expires_at)
+        self._by_post: dict[int, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, now: datetime | None = None):
+        now = now or datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, payload, post_ids, expires_at: datetime):
+        post_ids = frozenset(post_ids)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payload, post_ids, expires_at)
+            for pid in post_ids:
+                self._by_post.setdefault(pid, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_post(self, post_id: int):
+        with self._lock:
+            keys = self._by_post.pop(post_id, set())
+            for key in keys:
+                self._drop(key)
+            if keys:
+                self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_post.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_post.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        # caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for pid in entry[1]:
+            keys = self._by_post.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_post[pid]
+
+
+cache = FeedCache()
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def _pending(session) -> dict:
+    return session.info.setdefault('feedcache', {"all": False, "posts": set()})
+
+
+def mark_post(session, post_id: int):
+    """Queue a per-post invalidation for commit (Core counter updates bypass the flush hooks)."""
+    _pending(session)["posts"].add(post_id)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_post_changes(session, flush_context, instances):
+    pending = None
+    for obj in session.new:
+        if isinstance(obj, models.Post) and obj.status == 'published':
+            pending = pending or _pending(session)
+            pending["all"] = True
+    for obj in session.deleted:
+        if isinstance(obj, models.Post):
+            status_hist = inspect(obj).attrs.status.history
+            if obj.status == 'published' or 'published' in (status_hist.deleted or ()):
+                pending = pending or _pending(session)
+                pending["all"] = True
+    for obj in session.dirty:
+        if not isinstance(obj, models.Post) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        status_hist = state.attrs.status.history
+        was_or_is_published = obj.status == 'published' or 'published' in (status_hist.deleted or ())
+        if not was_or_is_published:
+            continue  # drafts/scheduled posts are invisible to the public feed
+        changed = {attr.key for attr in state.attrs if attr.history.has_changes()}
+        pending = pending or _pending(session)
+        if changed <= COUNTER_FIELDS:
+            pending["posts"].add(obj.id)
+        else:
+            pending["all"] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_post_changes(session):
+    pending = session.info.pop('feedcache', None)
+    if not pending:
+        return
+    if pending["all"]:
+        cache.invalidate_all()
+    else:
+        for post_id in pending["posts"]:
+            cache.invalidate_post(post_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_post_changes(session):
+    session.info.pop('feedcache', None)
@@ -0,0 +1,89 @@
+"""SQLite FTS5 index over posts.title / posts.details.
+
+`posts_fts` is an external-content FTS5 table: it stores only the inverted index
+and reads column text back from `posts`. Triggers on `posts` keep it in sync, so
+every write path (endpoints, scheduler jobs, scripts) updates the index without
+extra code. The same DDL is applied by the Alembic migration for existing DBs.
+
+Search snippets are safe HTML: FTS5 wraps matches in private-use sentinel
+characters, `highlight` escapes the post text and only then turns the
+sentinels into `<mark>` tags.
+"""
+import html, re
+import sqlalchemy as sa
+from sqlalchemy import event
+
+import models
+
+FTS_TABLE = "posts_fts"
+# bm25 column weights: a hit in the title counts far more than one in the body
+TITLE_WEIGHT = 10.0
+DETAILS_WEIGHT = 1.0
+SNIPPET_TOKENS = 16
+MAX_QUERY_TOKENS = 8
+
+FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, details, content='posts', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, details) VALUES (new.id, new.title, new.details); END",
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); END",
+    f"CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, details ON posts BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, details) VALUES ('delete', old.id, old.title, old.details); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, details) VALUES (new.id, new.title, new.details); END",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Unicode private-use characters: survive escaping untouched, never produced by html.escape
+MARK_OPEN, MARK_CLOSE = "\ue000", "\ue001"
+
+
+def ensure_index(connection):
+    """Create the FTS table and triggers if missing; rebuild from `posts` when newly created."""
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,)
+    ).first()
+    for stmt in FTS_DDL:
+        connection.exec_driver_sql(stmt)
+    if not exists:
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@event.listens_for(models.Base.metadata, "after_create")
+def _create_fts_index(target, connection, **kw):
+    ensure_index(connection)
+
+
+def match_expression(text: str) -> str | None:
+    """Turn free text into an FTS5 query: every word must match, each as a prefix."""
+    tokens = _TOKEN_RE.findall(text or "")[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    # Quoting neutralises FTS5 operators (AND/OR/NEAR, column filters) typed by users
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def match_subquery(expression: str):
+    """Subquery of (post_id, rank, snippet) for posts matching `expression`; lower rank is better."""
+    fts = sa.table(FTS_TABLE)
+    return (
+        sa.select(
+            sa.literal_column(f"{FTS_TABLE}.rowid").label("post_id"),
+            sa.literal_column(f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DETAILS_WEIGHT})").label("rank"),
+            sa.func.snippet(sa.literal_column(FTS_TABLE), -1, MARK_OPEN, MARK_CLOSE, "…", SNIPPET_TOKENS).label("snippet"),
+        )
+        .select_from(fts)
+        .where(sa.literal_column(FTS_TABLE).op("MATCH")(expression))
+        .subquery("fts")
+    )
+
+
+def highlight(snippet: str | None) -> str | None:
+    """A raw FTS5 snippet as safe HTML: escaped post text with matches in <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
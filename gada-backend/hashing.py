@@ -0,0 +1,199 @@
+"""Password hashing off the request threads.
+
+A bcrypt hash or verify costs ~250 ms of CPU. Done inline in a sync endpoint
+it holds one of the server's threadpool workers for that long, so a burst of
+logins used up the pool and stalled unrelated routes such as `/posts`.
+
+`pool.verify` / `pool.hash` are awaited from async endpoints and run in a
+process pool of `HASH_WORKERS` processes (default: one per core). At most
+`HASH_QUEUE_SIZE` calls may be waiting or running; beyond that `HashPoolBusy`
+is raised straight away and the endpoint answers 503, instead of queueing
+logins for longer than a client would wait. `HASH_WORKERS=0` runs the calls
+in the event loop's default thread executor instead (same bound, no child
+processes).
+
+The pool records how long calls waited for a worker and how long the hash
+itself took; both are in `/metrics`.
+
+The hash settings come from the environment (worker processes read the same):
+`PASSWORD_SCHEME` is `bcrypt` (default) or `argon2` (argon2id, needs
+argon2-cffi), with `BCRYPT_ROUNDS` or `ARGON2_TIME_COST` / `ARGON2_MEMORY_COST`
+/ `ARGON2_PARALLELISM` for the cost. A stored hash made with another scheme,
+or a bcrypt cost outside `BCRYPT_MIN_ROUNDS`..`BCRYPT_ROUNDS`, is outdated:
+`verify_and_update` returns a replacement that login stores, so a new cost
+reaches users as they sign in. `benchmarks/bcrypt_cost.py` helps pick the cost.
+"""
+import asyncio, logging, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+
+logger = logging.getLogger("gada")
+
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', str(max(HASH_WORKERS, 1) * 4)))
+# Seconds a rejected client is told to wait before retrying
+HASH_RETRY_AFTER = 2
+
+PASSWORD_SCHEME = os.getenv('PASSWORD_SCHEME', 'bcrypt')
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+# Lower this to stop logins rehashing older, cheaper hashes after a cost increase
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', str(BCRYPT_ROUNDS)))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '3'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '65536'))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '4'))
+
+
+def make_context(scheme: str = PASSWORD_SCHEME, bcrypt_rounds: int = BCRYPT_ROUNDS, bcrypt_min_rounds: int = BCRYPT_MIN_ROUNDS) -> CryptContext:
+    """CryptContext hashing with `scheme`; hashes of the other scheme still verify but are deprecated."""
+    if scheme not in ('bcrypt', 'argon2'):
+        raise ValueError(f"PASSWORD_SCHEME must be bcrypt or argon2, not {scheme!r}")
+    settings = {
+        "bcrypt__rounds": bcrypt_rounds,
+        "bcrypt__min_rounds": min(bcrypt_min_rounds, bcrypt_rounds),
+        "bcrypt__max_rounds": bcrypt_rounds,
+    }
+    if scheme == 'argon2':
+        settings.update({
+            "argon2__type": "ID",
+            "argon2__time_cost": ARGON2_TIME_COST,
+            "argon2__memory_cost": ARGON2_MEMORY_COST,
+            "argon2__parallelism": ARGON2_PARALLELISM,
+        })
+        schemes = ["argon2", "bcrypt"]
+    else:
+        schemes = ["bcrypt"]
+    return CryptContext(schemes=schemes, default=scheme, deprecated="auto", **settings)
+
+
+pwd_context = make_context()
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+def _timed(fn, *args):
+    # runs in the worker: returns the result with the CPU time it took there
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def _verify(plain: str, hashed: str) -> bool:
+    return pwd_context.verify(plain, hashed)
+
+
+def _hash(plain: str) -> str:
+    return pwd_context.hash(plain)
+
+
+def _verify_and_update(plain: str, hashed: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain, hashed)
+
+
+class HashPool:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hash_total = 0.0
+        self.hash_max = 0.0
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None  # loop's default executor
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the server process has threads and open SQLite handles
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HashPoolBusy()
+            self._pending += 1
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            try:
+                result, took = await loop.run_in_executor(executor, _timed, fn, *args)
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM-killed); start a fresh pool and retry once
+                logger.warning("Password hash pool broken; restarting it")
+                self._reset(executor)
+                result, took = await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+        waited = max(time.perf_counter() - start - took, 0.0)
+        with self._lock:
+            self.completed += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.hash_total += took
+            self.hash_max = max(self.hash_max, took)
+        return result
+
+    def start(self):
+        """Spawn the worker processes now rather than on the first login."""
+        executor = self._get_executor()
+        if executor is not None:
+            for future in [executor.submit(_timed, abs, 0) for _ in range(self.workers)]:
+                future.result()
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run(_verify, plain, hashed)
+
+    async def verify_and_update(self, plain: str, hashed: str) -> tuple[bool, str | None]:
+        """(password matches, replacement hash if the stored one is outdated else None)."""
+        return await self._run(_verify_and_update, plain, hashed)
+
+    async def hash(self, plain: str) -> str:
+        return await self._run(_hash, plain)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self.completed
+            return {
+                "scheme": PASSWORD_SCHEME,
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": done,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "queue_wait_ms_avg": round(self.wait_total / done * 1000, 1) if done else 0.0,
+                "queue_wait_ms_max": round(self.wait_max * 1000, 1),
+                "hash_ms_avg": round(self.hash_total / done * 1000, 1) if done else 0.0,
+                "hash_ms_max": round(self.hash_max * 1000, 1),
+            }
+
+
+pool = HashPool()
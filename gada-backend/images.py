@@ -0,0 +1,274 @@
+"""Responsive variants of uploaded images.
+
+`upload_image` used to hand the original (up to 4 MB) to every card and
+gallery. After the upload is written, `pool.submit` queues it for a process
+pool that renders `IMAGE_WIDTHS` x WebP/JPEG variants with Pillow (EXIF
+orientation applied, then metadata dropped; never upscaled) into
+`uploads/variants/` and records them in `image_variants`. The upload request
+only pays for the submit; when more than `IMAGE_QUEUE_SIZE` uploads are
+waiting, the rest are skipped and `/tasks/process-images` picks them up later.
+
+Variant URLs are derived from the upload's filename:
+`/images/{width}/{filename}.{webp|jpg}`. `srcset_maps` lists only recorded
+variants (one query per page of posts), each labelled with its real pixel
+width: a 700 px original gets `320w, 640w, 700w`, not a "1280w" candidate that
+is really 700 px. The route serves the variant when it exists and the original
+otherwise (briefly cacheable), so a variant deleted or lost since it was
+recorded costs bandwidth, not a broken image.
+
+Pillow is optional: without it nothing is rendered and the maps stay empty, so
+clients keep using the original `image` URL.
+"""
+import importlib.util, logging, multiprocessing, os, re, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+import models, database, feedcache
+
+logger = logging.getLogger("gada")
+
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
+IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.getenv('IMAGE_WIDTHS', '320,640,1280').split(',') if w.strip()))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '1'))
+IMAGE_QUEUE_SIZE = int(os.getenv('IMAGE_QUEUE_SIZE', '32'))
+# format -> (Pillow format, file extension, content type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+EXT_FORMAT = {ext: name for name, (_, ext, _) in FORMATS.items()}
+# Uploads the pipeline renders; GIFs stay as they are (animation)
+UPLOAD_NAME = re.compile(r'^[A-Za-z0-9_-]+\.(?:png|jpe?g|webp)$')
+
+HAS_PILLOW = importlib.util.find_spec('PIL') is not None
+
+
+def variant_dir(upload_dir: str | None = None) -> str:
+    return os.path.join(upload_dir or UPLOAD_DIR, 'variants')
+
+
+def variant_filename(filename: str, width: int, fmt: str) -> str:
+    return f"{filename}-{width}.{FORMATS[fmt][1]}"
+
+
+def variant_url(filename: str, width: int, fmt: str) -> str:
+    return f"/images/{width}/{filename}.{FORMATS[fmt][1]}"
+
+
+def _upload_filename(url: str) -> str | None:
+    if url.startswith('/uploads/'):
+        name = url[len('/uploads/'):]
+        if UPLOAD_NAME.match(name):
+            return name
+    return None
+
+
+def _uploads_in(image: str | None) -> list[tuple[str, str]]:
+    found = {}
+    for url in re.split(r'[;,\s]+', image or ''):
+        name = _upload_filename(url)
+        if name:
+            found.setdefault(url, name)
+    return list(found.items())
+
+
+def srcset_maps(db, image_fields: list) -> list[dict]:
+    """For each post `image` value, {original url: {format: srcset}} from the recorded variants."""
+    parsed = [_uploads_in(image) for image in image_fields]
+    names = {name for uploads in parsed for _, name in uploads}
+    if not names:
+        return [{} for _ in parsed]
+    # (filename, format) -> {pixel width: smallest nominal width rendered at it}
+    candidates = {}
+    for row in db.execute(
+        select(models.ImageVariant.filename, models.ImageVariant.format, models.ImageVariant.width, models.ImageVariant.pixel_width)
+        .where(models.ImageVariant.filename.in_(names)).order_by(models.ImageVariant.width)
+    ):
+        if row.width in IMAGE_WIDTHS and row.format in FORMATS:
+            candidates.setdefault((row.filename, row.format), {}).setdefault(row.pixel_width, row.width)
+    result = []
+    for uploads in parsed:
+        maps = {}
+        for url, name in uploads:
+            srcsets = {fmt: ", ".join(f"{variant_url(name, w, fmt)} {px}w" for px, w in sorted(candidates[(name, fmt)].items()))
+                       for fmt in FORMATS if (name, fmt) in candidates}
+            if srcsets:
+                maps[url] = srcsets
+        result.append(maps)
+    return result
+
+
+def render_variants(upload_dir: str, filename: str, widths=IMAGE_WIDTHS, quality: int = IMAGE_QUALITY) -> list[dict]:
+    """Runs in a worker process: write every width x format variant of one upload; returns what it wrote."""
+    from PIL import Image, ImageOps
+    out_dir = variant_dir(upload_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    with Image.open(os.path.join(upload_dir, filename)) as src:
+        img = ImageOps.exif_transpose(src)  # bake in the orientation before the EXIF goes
+        icc = src.info.get('icc_profile')  # colour profile, not metadata worth stripping
+        rendered = {}
+        for width in widths:
+            target = min(width, img.width)  # never upscale: oversize widths reuse the original size
+            if target not in rendered:
+                resized = img if target == img.width else img.resize((target, round(img.height * target / img.width)), Image.LANCZOS)
+                rendered[target] = resized
+            resized = rendered[target]
+            for fmt, (pil_format, _, _) in FORMATS.items():
+                frame = resized
+                if pil_format == 'JPEG' and frame.mode not in ('RGB', 'L'):
+                    frame = frame.convert('RGBA').convert('RGB') if frame.mode == 'P' else frame.convert('RGB')
+                elif frame.mode not in ('RGB', 'RGBA', 'L'):
+                    frame = frame.convert('RGBA')
+                name = variant_filename(filename, width, fmt)
+                tmp = os.path.join(out_dir, f".{name}.tmp")
+                options = {"quality": quality}
+                if pil_format == 'JPEG':
+                    options.update(optimize=True, progressive=True)
+                else:
+                    options["method"] = 4
+                if icc:
+                    options["icc_profile"] = icc
+                frame.save(tmp, pil_format, **options)  # no exif= argument: metadata is not copied
+                os.replace(tmp, os.path.join(out_dir, name))
+                written.append({"width": width, "format": fmt, "pixel_width": frame.width,
+                                "pixel_height": frame.height, "bytes": os.path.getsize(os.path.join(out_dir, name))})
+    return written
+
+
+def record(db, filename: str, variants: list[dict]):
+    if not variants:
+        return
+    now = datetime.utcnow()
+    stmt = insert(models.ImageVariant).values([{"filename": filename, "created_at": now, **v} for v in variants])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['filename', 'width', 'format'],
+        set_={"pixel_width": stmt.excluded.pixel_width, "pixel_height": stmt.excluded.pixel_height,
+              "bytes": stmt.excluded.bytes, "created_at": stmt.excluded.created_at},
+    ))
+
+
+def remove_variant_files(filename: str, upload_dir: str | None = None):
+    """Delete an upload's variant files; their rows go with the upload's blob row (see uploads.py)."""
+    out_dir = variant_dir(upload_dir)
+    for width in IMAGE_WIDTHS:
+        for fmt in FORMATS:
+            path = os.path.join(out_dir, variant_filename(filename, width, fmt))
+            if os.path.isfile(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def unprocessed(db, upload_dir: str | None = None) -> list[str]:
+    """Uploads on disk with no recorded variants."""
+    upload_dir = upload_dir or UPLOAD_DIR
+    done = set(db.execute(select(models.ImageVariant.filename).distinct()).scalars())
+    return sorted(name for name in os.listdir(upload_dir)
+                  if UPLOAD_NAME.match(name) and name not in done and os.path.isfile(os.path.join(upload_dir, name)))
+
+
+class ImagePool:
+    def __init__(self, workers: int = IMAGE_WORKERS, max_pending: int = IMAGE_QUEUE_SIZE, session_factory=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.session_factory = session_factory or database.SessionLocal
+        self._executor = None
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._pending = 0
+        self.processed = 0
+        self.variants = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.workers <= 0:  # tests and tiny deployments: one thread, no child process
+                    self._executor = ThreadPoolExecutor(1, thread_name_prefix='images')
+                else:
+                    # spawn, not fork: the server process has threads and open SQLite handles
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, filename: str, upload_dir: str | None = None):
+        """Queue an upload for rendering without waiting; returns the future, or None if it was not queued."""
+        if not HAS_PILLOW or not UPLOAD_NAME.match(filename):
+            return None
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.skipped += 1
+                logger.warning("Image queue full; %s left for /tasks/process-images", filename)
+                return None
+            self._pending += 1
+        upload_dir = upload_dir or UPLOAD_DIR
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(render_variants, upload_dir, filename)
+            except BrokenProcessPool:
+                # a worker died (e.g. OOM-killed on a huge image); start a fresh pool
+                logger.warning("Image pool broken; restarting it")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+                future = self._get_executor().submit(render_variants, upload_dir, filename)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self.failed += 1
+            logger.exception("Could not queue %s for variants", filename)
+            return None
+        future.add_done_callback(lambda f: self._done(filename, f))
+        return future
+
+    def _done(self, filename: str, future):
+        # runs on the executor's callback thread; a short insert, then the slot is free
+        try:
+            variants = future.result()
+            db = self.session_factory()
+            try:
+                record(db, filename, variants)
+                db.commit()
+            finally:
+                db.close()
+            # cached feed pages were rendered without these srcsets
+            feedcache.cache.invalidate_all()
+            with self._lock:
+                self.processed += 1
+                self.variants += len(variants)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            logger.exception("Rendering variants of %s failed; the original is served instead", filename)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._drained.notify_all()
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """Wait until every queued upload is rendered and recorded."""
+        with self._lock:
+            return self._drained.wait_for(lambda: self._pending == 0, timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"available": HAS_PILLOW, "workers": self.workers, "pending": self._pending,
+                    "max_pending": self.max_pending, "processed": self.processed, "variants": self.variants,
+                    "skipped": self.skipped, "failed": self.failed}
+
+
+pool = ImagePool()
@@ -0,0 +1,227 @@
+"""Optional write-behind buffer for like toggles.
+
+With `LIKE_BUFFER=1`, `toggle_like` no longer commits per click. The desired
+state of each (post, user) pair is kept in memory and the response is computed
+from the database state plus the buffered changes. A background thread flushes
+the buffer every `LIKE_BUFFER_INTERVAL_MS` (or as soon as
+`LIKE_BUFFER_MAX_EVENTS` pairs are pending) in one transaction:
+
+- multi-row `INSERT ... ON CONFLICT DO NOTHING RETURNING` for new likes and
+  `DELETE ... WHERE (post_id, user_id) IN (...) RETURNING` for removed ones;
+- one `UPDATE posts SET likes_count = max(likes_count + d, 0)` per touched post,
+  with `d` taken from the rows that actually changed.
+
+A burst of clicks therefore costs one commit per interval instead of one per
+click, and a like/unlike pair on the same post cancels out before it reaches
+the database. `stop()` (app shutdown, and atexit as a fallback) flushes what is
+left. A failed flush puts its batch back so the next one retries it.
+
+The buffer is per process: run a single worker when it is enabled, or another
+process may answer from stale rows until the flush lands.
+"""
+import atexit, logging, os, threading, time
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+
+import models, feedcache, database
+
+logger = logging.getLogger("gada")
+
+LIKE_BUFFER = os.getenv('LIKE_BUFFER', '0') == '1'
+LIKE_BUFFER_INTERVAL_MS = int(os.getenv('LIKE_BUFFER_INTERVAL_MS', '200'))
+LIKE_BUFFER_MAX_EVENTS = int(os.getenv('LIKE_BUFFER_MAX_EVENTS', '500'))
+# pairs per multi-row statement, well under SQLite's bound-variable limit
+STATEMENT_BATCH = 400
+
+
+def enabled() -> bool:
+    return LIKE_BUFFER
+
+
+class LikeBuffer:
+    def __init__(self, session_factory=None, interval_ms: int = LIKE_BUFFER_INTERVAL_MS, max_events: int = LIKE_BUFFER_MAX_EVENTS):
+        self.session_factory = session_factory or database.SessionLocal
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self._pending: dict = {}   # (post_id, user_id) -> (liked in db, liked wanted)
+        self._inflight: dict = {}  # batch being written; still the newest state until it commits
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._generation = 0  # odd while a flush commits, bumped again once it is visible
+        self.toggles = 0
+        self.flushes = 0
+        self.flushed_pairs = 0
+        self.failures = 0
+
+    # -- request path -------------------------------------------------------
+
+    def _state(self, key):
+        entry = self._pending.get(key) or self._inflight.get(key)
+        return None if entry is None else entry[1]
+
+    def _delta(self, post_id: int) -> int:
+        # a pending entry's base is the in-flight state, so both layers add up
+        delta = 0
+        for source in (self._inflight, self._pending):
+            for (pid, _), (base, wanted) in source.items():
+                if pid == post_id:
+                    delta += int(wanted) - int(base)
+        return delta
+
+    def overlay(self, post_id: int, likes_count: int, user_id: int | None = None, liked: bool = False):
+        """Apply buffered changes to a (liked, likes_count) pair read from the database."""
+        with self._lock:
+            if user_id is not None:
+                state = self._state((post_id, user_id))
+                liked = liked if state is None else state
+            return liked, max(likes_count + self._delta(post_id), 0)
+
+    def toggle(self, db, post_id: int, user_id: int) -> tuple[bool, int] | None:
+        """Flip a like in the buffer. Returns (liked, likes_count), or None if the post does not exist."""
+        key = (post_id, user_id)
+        while True:
+            generation = self._generation
+            if generation % 2:
+                time.sleep(0.001)  # a flush is committing; its rows are neither in the db nor gone yet
+                continue
+            stored = db.execute(select(models.Post.likes_count).where(models.Post.id == post_id)).first()
+            if stored is None:
+                return None
+            with self._lock:
+                known = self._state(key)
+            in_db = None
+            if known is None:
+                in_db = db.execute(select(models.PostLike.id).where(
+                    models.PostLike.post_id == post_id, models.PostLike.user_id == user_id)).first() is not None
+            with self._lock:
+                if generation != self._generation:
+                    continue  # a flush committed between the reads; read again
+                state = self._state(key)
+                if state is None:
+                    base = state = in_db
+                elif key in self._pending:
+                    base = self._pending[key][0]
+                else:
+                    base = state  # the in-flight write is what the db will hold
+                wanted = not state
+                if wanted == base:
+                    self._pending.pop(key, None)  # back to the state below it: nothing to write
+                else:
+                    self._pending[key] = (base, wanted)
+                self.toggles += 1
+                count = max((stored[0] or 0) + self._delta(post_id), 0)
+                full = len(self._pending) >= self.max_events
+            if full:
+                self._wake.set()
+            return wanted, count
+
+    # -- flushing -----------------------------------------------------------
+
+    def flush(self) -> int:
+        """Write pending toggles in one transaction. Returns the number of pairs written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                batch = self._inflight
+            adds = [key for key, (base, wanted) in batch.items() if wanted and not base]
+            removes = [key for key, (base, wanted) in batch.items() if base and not wanted]
+            db = self.session_factory()
+            try:
+                deltas: dict[int, int] = {}
+                for i in range(0, len(adds), STATEMENT_BATCH):
+                    rows = [{"post_id": p, "user_id": u} for p, u in adds[i:i + STATEMENT_BATCH]]
+                    stmt = insert(models.PostLike).values(rows).on_conflict_do_nothing(index_elements=['post_id', 'user_id'])
+                    for post_id in db.execute(stmt.returning(models.PostLike.post_id)).scalars():
+                        deltas[post_id] = deltas.get(post_id, 0) + 1
+                for i in range(0, len(removes), STATEMENT_BATCH):
+                    pairs = removes[i:i + STATEMENT_BATCH]
+                    stmt = delete(models.PostLike).where(tuple_(models.PostLike.post_id, models.PostLike.user_id).in_(pairs))
+                    for post_id in db.execute(stmt.returning(models.PostLike.post_id)).scalars():
+                        deltas[post_id] = deltas.get(post_id, 0) - 1
+                for post_id, delta in deltas.items():
+                    if delta:
+                        db.execute(
+                            update(models.Post).where(models.Post.id == post_id)
+                            .values(likes_count=func.max(func.coalesce(models.Post.likes_count, 0) + delta, 0)),
+                            execution_options={'synchronize_session': False},
+                        )
+                        feedcache.mark_post(db, post_id)
+                with self._lock:
+                    self._generation += 1
+                db.commit()
+            except Exception:
+                db.rollback()
+                self.failures += 1
+                with self._lock:
+                    if self._generation % 2:
+                        self._generation += 1
+                    # retry next time; newer toggles for a pair keep their wanted state
+                    for key, (base, wanted) in batch.items():
+                        if key in self._pending:
+                            self._pending[key] = (base, self._pending[key][1])
+                        else:
+                            self._pending[key] = (base, wanted)
+                    self._inflight = {}
+                raise
+            finally:
+                db.close()
+            with self._lock:
+                # pending entries made while this batch was in flight were based on it
+                self._inflight = {}
+                self._generation += 1
+                self.flushes += 1
+                self.flushed_pairs += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Like buffer flush failed; will retry")
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": enabled(),
+                "pending": len(self._pending),
+                "inflight": len(self._inflight),
+                "toggles": self.toggles,
+                "flushes": self.flushes,
+                "flushed_pairs": self.flushed_pairs,
+                "failures": self.failures,
+            }
+
+
+buffer = LikeBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    if buffer._pending:
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception("Like buffer flush at exit failed")
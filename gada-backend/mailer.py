@@ -0,0 +1,400 @@
+"""Outbound email through a durable outbox.
+
+Endpoints used to connect, STARTTLS and log in to the SMTP server inside the
+request, so a slow mail server held the request for up to the 20 s timeout.
+Now `enqueue` adds an `outbound_emails` row in the caller's transaction and
+returns; the committed row wakes the sender thread, which
+
+- claims up to `MAIL_BATCH_SIZE` due rows with one `UPDATE ... RETURNING`
+  (status `sending`, with a lease so a crashed process's claims are picked up
+  again after `MAIL_CLAIM_LEASE_SEC`);
+- sends them in parallel over a pool of `MAIL_SMTP_POOL_SIZE` logged-in SMTP
+  sessions that are reused across batches, checked with NOOP after
+  `MAIL_SMTP_IDLE_SEC` idle and replaced after `MAIL_SMTP_MAX_MESSAGES`;
+- marks them sent, or schedules a retry after `MAIL_BACKOFF_SEC * 2**attempt`
+  (capped at `MAIL_BACKOFF_MAX_SEC`, with jitter) until `MAIL_MAX_ATTEMPTS`.
+  A permanent 5xx rejection fails the row straight away.
+
+Sent rows are deleted after `MAIL_RETENTION_DAYS`. Without SMTP settings
+nothing is queued and the endpoints keep exposing dev codes, as before.
+"""
+import atexit, logging, os, random, smtplib, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email import policy
+from email.message import EmailMessage
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+import models, database
+
+logger = logging.getLogger("gada")
+
+SMTP_HOST = os.getenv('SMTP_HOST')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USER = os.getenv('SMTP_USER')
+SMTP_PASS = os.getenv('SMTP_PASS')
+SMTP_FROM = os.getenv('SMTP_FROM', SMTP_USER or 'no-reply@example.com')
+SMTP_SSL = os.getenv('SMTP_SSL', '0') == '1'  # if 1, use SMTPS (port 465)
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '20'))
+
+MAIL_SMTP_POOL_SIZE = int(os.getenv('MAIL_SMTP_POOL_SIZE', '2'))
+MAIL_SMTP_IDLE_SEC = float(os.getenv('MAIL_SMTP_IDLE_SEC', '30'))
+MAIL_SMTP_MAX_MESSAGES = int(os.getenv('MAIL_SMTP_MAX_MESSAGES', '100'))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', '20'))
+MAIL_POLL_SEC = float(os.getenv('MAIL_POLL_SEC', '5'))
+MAIL_CLAIM_LEASE_SEC = int(os.getenv('MAIL_CLAIM_LEASE_SEC', '300'))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', '8'))
+MAIL_BACKOFF_SEC = float(os.getenv('MAIL_BACKOFF_SEC', '30'))
+MAIL_BACKOFF_MAX_SEC = float(os.getenv('MAIL_BACKOFF_MAX_SEC', '3600'))
+MAIL_RETENTION_DAYS = int(os.getenv('MAIL_RETENTION_DAYS', '7'))
+# Recent send and queue latencies kept for the metrics
+LATENCY_SAMPLES = 500
+
+
+def configured() -> bool:
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASS)
+
+
+def enqueue(db, to_email: str, subject: str, body: str) -> bool:
+    """Queue a message in db's transaction; it is sent once that commits. False if SMTP is not configured."""
+    if not configured():
+        logger.warning("SMTP not configured; skipping email to %s: %s", to_email, subject)
+        return False
+    now = datetime.utcnow()
+    db.add(models.OutboundEmail(to_email=to_email, subject=subject, body=body, status='pending',
+                                attempts=0, next_attempt_at=now, created_at=now))
+    db.info['mail_queued'] = True
+    return True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_sender(session):
+    if session.info.pop('mail_queued', False):
+        sender.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_queued(session):
+    session.info.pop('mail_queued', None)
+
+
+def _connect():
+    if SMTP_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        server.ehlo()
+        try:
+            server.starttls()
+            server.ehlo()
+        except smtplib.SMTPException:
+            # If STARTTLS not supported, continue without TLS (some local dev servers)
+            pass
+    server.login(SMTP_USER, SMTP_PASS)
+    return server
+
+
+class _Connection:
+    __slots__ = ('server', 'used_at', 'messages')
+
+    def __init__(self, server):
+        self.server = server
+        self.used_at = time.monotonic()
+        self.messages = 0
+
+
+class SMTPPool:
+    """Logged-in SMTP sessions shared by the sender's threads."""
+    def __init__(self, size: int = MAIL_SMTP_POOL_SIZE, connect=_connect, idle_sec: float = MAIL_SMTP_IDLE_SEC,
+                 max_messages: int = MAIL_SMTP_MAX_MESSAGES):
+        self.size = size
+        self.connect = connect
+        self.idle_sec = idle_sec
+        self.max_messages = max_messages
+        self._idle: deque[_Connection] = deque()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def _discard(self, conn: _Connection):
+        self.discarded += 1
+        try:
+            conn.server.quit()
+        except Exception:
+            try:
+                conn.server.close()
+            except Exception:
+                pass
+
+    def acquire(self) -> _Connection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                break
+            if time.monotonic() - conn.used_at < self.idle_sec:
+                self.reused += 1
+                return conn
+            try:  # servers drop idle sessions; check before trusting it
+                if conn.server.noop()[0] == 250:
+                    self.reused += 1
+                    return conn
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._discard(conn)
+        conn = _Connection(self.connect())
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def release(self, conn: _Connection, broken: bool = False):
+        conn.used_at = time.monotonic()
+        if broken or conn.messages >= self.max_messages:
+            self._discard(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def send(self, msg: EmailMessage):
+        conn = self.acquire()
+        try:
+            conn.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.release(conn, broken=True)
+            raise
+        except smtplib.SMTPException:
+            # a rejected message leaves the session usable once reset
+            try:
+                conn.server.rset()
+            except Exception:
+                self.release(conn, broken=True)
+                raise
+            self.release(conn)
+            raise
+        conn.messages += 1
+        self.release(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "opened": self.opened,
+                    "reused": self.reused, "discarded": self.discarded}
+
+
+def is_permanent(exc: Exception) -> bool:
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False  # a settings problem, not this message's
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+def build_message(to_email: str, subject: str, body: str, headers: dict | None = None) -> EmailMessage:
+    # long URL headers (List-Unsubscribe) must stay unencoded; 998 is the RFC 5322 hard limit
+    msg = EmailMessage(policy=policy.SMTP.clone(max_line_length=998))
+    msg['Subject'] = subject
+    msg['From'] = SMTP_FROM
+    msg['To'] = to_email
+    for name, value in (headers or {}).items():
+        msg[name] = value
+    msg.set_content(body)
+    return msg
+
+
+class MailSender:
+    def __init__(self, session_factory=None, pool: SMTPPool | None = None, batch_size: int = MAIL_BATCH_SIZE,
+                 interval: float = MAIL_POLL_SEC, max_attempts: int = MAIL_MAX_ATTEMPTS,
+                 backoff: float = MAIL_BACKOFF_SEC, backoff_max: float = MAIL_BACKOFF_MAX_SEC):
+        self.session_factory = session_factory or database.SessionLocal
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._purged_at = 0.0
+        self._send_ms: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._queue_ms: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = 0
+        self._depth = {"pending": None, "oldest_pending_sec": None, "measured_at": None}
+
+    def wake(self):
+        self._wake.set()
+
+    def _retry_delay(self, attempts: int) -> timedelta:
+        delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def _claim(self, db, now: datetime) -> list:
+        lease_cutoff = now - timedelta(seconds=MAIL_CLAIM_LEASE_SEC)
+        db.execute(
+            update(models.OutboundEmail)
+            .where(models.OutboundEmail.status == 'sending', models.OutboundEmail.claimed_at < lease_cutoff)
+            .values(status='pending')
+        )
+        due = (
+            select(models.OutboundEmail.id)
+            .where(models.OutboundEmail.status == 'pending', models.OutboundEmail.next_attempt_at <= now)
+            .order_by(models.OutboundEmail.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        rows = db.execute(
+            update(models.OutboundEmail)
+            .where(models.OutboundEmail.id.in_(due), models.OutboundEmail.status == 'pending')
+            .values(status='sending', claimed_at=now)
+            .returning(models.OutboundEmail.id, models.OutboundEmail.to_email, models.OutboundEmail.subject,
+                       models.OutboundEmail.body, models.OutboundEmail.attempts, models.OutboundEmail.created_at)
+        ).all()
+        db.commit()
+        return rows
+
+    def _send(self, row):
+        start = time.perf_counter()
+        try:
+            self.pool.send(build_message(row.to_email, row.subject, row.body))
+        except Exception as e:
+            return row, e, time.perf_counter() - start
+        return row, None, time.perf_counter() - start
+
+    def run_once(self) -> dict:
+        """Send one batch of due messages; returns what happened to it."""
+        report = {"claimed": 0, "sent": 0, "retried": 0, "failed": 0}
+        with self._run_lock:
+            db = self.session_factory()
+            try:
+                rows = self._claim(db, datetime.utcnow())
+                report["claimed"] = len(rows)
+                if rows:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max(self.pool.size, 1), thread_name_prefix='smtp')
+                    results = list(self._executor.map(self._send, rows))
+                    self._record(db, results, report)
+                self._depth = self.queue_depth(db)
+                self._maybe_purge(db)
+            finally:
+                db.close()
+        return report
+
+    def _record(self, db, results, report: dict):
+        now = datetime.utcnow()
+        sent_ids = []
+        for row, error, took in results:
+            if error is None:
+                sent_ids.append(row.id)
+                self._send_ms.append(took * 1000)
+                self._queue_ms.append((now - row.created_at).total_seconds() * 1000)
+                continue
+            attempts = row.attempts + 1
+            values = {"attempts": attempts, "last_error": str(error)[:500], "claimed_at": None}
+            if is_permanent(error) or attempts >= self.max_attempts:
+                values["status"] = 'failed'
+                report["failed"] += 1
+                logger.error("Giving up on email %d to %s after %d attempts: %s", row.id, row.to_email, attempts, error)
+            else:
+                values["status"] = 'pending'
+                values["next_attempt_at"] = now + self._retry_delay(attempts)
+                report["retried"] += 1
+                logger.warning("Email %d to %s failed (attempt %d), retrying: %s", row.id, row.to_email, attempts, error)
+            db.execute(update(models.OutboundEmail).where(models.OutboundEmail.id == row.id).values(**values))
+        if sent_ids:
+            db.execute(
+                update(models.OutboundEmail)
+                .where(models.OutboundEmail.id.in_(sent_ids))
+                .values(status='sent', sent_at=now, claimed_at=None, last_error=None)
+            )
+        db.commit()
+        report["sent"] = len(sent_ids)
+        self.sent += len(sent_ids)
+        self.retried += report["retried"]
+        self.failed += report["failed"]
+        self.batches += 1
+
+    def _maybe_purge(self, db):
+        now = time.time()
+        if now - self._purged_at < 3600:
+            return
+        self._purged_at = now
+        cutoff = datetime.utcnow() - timedelta(days=MAIL_RETENTION_DAYS)
+        db.execute(delete(models.OutboundEmail).where(models.OutboundEmail.status == 'sent', models.OutboundEmail.sent_at < cutoff))
+        db.commit()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                report = self.run_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("Outbox batch failed; will retry")
+                report = {"claimed": 0}
+            if report["claimed"] < self.batch_size:  # drained: sleep until woken or the next poll
+                self._wake.wait(self.interval)
+
+    def start(self):
+        if self._thread is None and configured():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='mail-sender', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.pool.close()
+
+    def queue_depth(self, db) -> dict:
+        pending, oldest = db.execute(
+            select(func.count(), func.min(models.OutboundEmail.created_at))
+            .where(models.OutboundEmail.status == 'pending')
+        ).one()
+        now = datetime.utcnow()
+        age = (now - oldest).total_seconds() if oldest else 0.0
+        return {"pending": pending, "oldest_pending_sec": round(age, 1), "measured_at": now.isoformat()}
+
+    def stats(self) -> dict:
+        """Counters plus the queue depth the sender measured after its last batch (no query here)."""
+        send_ms, queue_ms = list(self._send_ms), list(self._queue_ms)
+        return self._depth | {
+            "running": self._thread is not None,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "send_ms_avg": round(sum(send_ms) / len(send_ms), 1) if send_ms else 0.0,
+            "send_ms_max": round(max(send_ms), 1) if send_ms else 0.0,
+            "queue_ms_avg": round(sum(queue_ms) / len(queue_ms), 1) if queue_ms else 0.0,
+            "queue_ms_max": round(max(queue_ms), 1) if queue_ms else 0.0,
+            "smtp_pool": self.pool.stats(),
+        }
+
+
+sender = MailSender()
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Body, Response, Request, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Body, Response, Request, Form, Header
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,7 +9,7 @@ import os, uuid, shutil, secrets, time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
-import re
+import re, html
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import logging
@@ -15,7 +17,7 @@ import logging
 # Load environment variables from .env next to this file
 load_dotenv(dotenv_path=Path(__file__).parent / '.env')
 
-import auth, models, schemas, database
+import auth, hashing, models, schemas, database, pagination, fulltext, feedcache, counts, compression, fastjson, counters, profiles, reconcile, like_buffer, events, refresh_tokens, ratelimit, mailer, newsletter, images, uploads
 
 # Optional automatic table creation (disable with AUTO_CREATE=0 when migrations in place)
 if os.getenv("AUTO_CREATE", "1") == "1":
@@ -46,18 +48,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli for JSON and /uploads; compressed variants of ETag'd responses are reused
+app.add_middleware(compression.CompressionMiddleware)
 
-@app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    if not user.email:
-        raise HTTPException(status_code=400, detail="Email is required")
-    db_user = db.query(models.User).filter((models.User.username == user.username) | (models.User.email == user.email)).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Username or email already registered")
-    pw_errors = auth.password_strength_errors(user.password)
-    if pw_errors:
-        raise HTTPException(status_code=400, detail=f"Weak password, need: {', '.join(pw_errors)}")
-    hashed_password = auth.get_password_hash(user.password)
+# Endpoints that hash or verify passwords are async: bcrypt runs in hashing.pool and
+# their database work in the threadpool, so a login burst doesn't hold request threads.
+@app.exception_handler(hashing.HashPoolBusy)
+async def _hash_pool_busy(request: Request, exc: hashing.HashPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many sign-in requests, try again shortly"},
+        headers={"Retry-After": str(hashing.HASH_RETRY_AFTER)},
+    )
+
+def _username_or_email_taken(db: Session, username: str, email: str) -> bool:
+    return db.query(models.User.id).filter((models.User.username == username) | (models.User.email == email)).first() is not None
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     # Auto-approve admins; regular users require approval
     db_user = models.User(
         username=user.username,
@@ -72,34 +79,36 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_d
     db.refresh(db_user)
     return db_user
 
+@app.post("/register", response_model=schemas.User)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+    if not user.email:
+        raise HTTPException(status_code=400, detail="Email is required")
+    if await run_in_threadpool(_username_or_email_taken, db, user.username, user.email):
+        raise HTTPException(status_code=400, detail="Username or email already registered")
+    pw_errors = auth.password_strength_errors(user.password)
+    if pw_errors:
+        raise HTTPException(status_code=400, detail=f"Weak password, need: {', '.join(pw_errors)}")
+    hashed_password = await hashing.pool.hash(user.password)
+    return await run_in_threadpool(_create_user, db, user, hashed_password)
+
 LOGIN_SCOPE = "login"
 VERIFY_SCOPE = "verify"
 RESET_SCOPE = "reset"
+NEWSLETTER_SCOPE = "newsletter"
 RATE_LIMIT_DEFS = {
     LOGIN_SCOPE: {"window_sec": 60, "max": 5},            # 5 login attempts / 60s per ip+username
     VERIFY_SCOPE: {"window_sec": 3600, "max": 6},         # 6 verification requests / hour
     RESET_SCOPE: {"window_sec": 3600, "max": 3},          # 3 password reset requests / hour
+    NEWSLETTER_SCOPE: {"window_sec": 3600, "max": 10},    # 10 newsletter (un)subscribes / hour per ip
 }
 
-def _rate_limit(db: Session, scope: str, identifier: str):
-    cfg = RATE_LIMIT_DEFS[scope]
-    window = cfg["window_sec"]
-    max_allowed = cfg["max"]
-    now_dt = datetime.utcnow()
-    window_start = now_dt - timedelta(seconds=window)
-    row = db.query(models.RateLimit).filter(
-        models.RateLimit.scope == scope,
-        models.RateLimit.identifier == identifier,
-        models.RateLimit.window_start >= window_start
-    ).order_by(models.RateLimit.id.desc()).first()
-    if row and row.count >= max_allowed:
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
-    if not row or row.window_start < window_start:
-        row = models.RateLimit(scope=scope, identifier=identifier, window_start=now_dt, count=1)
-        db.add(row)
-    else:
-        row.count += 1
-    db.commit()
+# In memory by default; RATE_LIMIT_BACKEND=sqlite shares counts between worker processes
+rate_limiter = ratelimit.RateLimiter(RATE_LIMIT_DEFS)
+
+def _rate_limit(scope: str, identifier: str):
+    decision = rate_limiter.hit(scope, identifier)
+    if not decision.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": str(decision.retry_after)})
 
 REFRESH_COOKIE_NAME = "refresh_token"
 REFRESH_COOKIE_PATH = "/token"
@@ -108,45 +117,6 @@ REFRESH_COOKIE_SECURE = False  # set True when using HTTPS
 EMAIL_VERIFICATION_TOKEN_EXPIRE_HOURS = 24
 PASSWORD_RESET_TOKEN_EXPIRE_HOURS = 24
 
-# --- Email (SMTP) configuration ---
-SMTP_HOST = os.getenv('SMTP_HOST')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-SMTP_USER = os.getenv('SMTP_USER')
-SMTP_PASS = os.getenv('SMTP_PASS')
-SMTP_FROM = os.getenv('SMTP_FROM', SMTP_USER or 'no-reply@example.com')
-SMTP_SSL = os.getenv('SMTP_SSL', '0') == '1'  # if 1, use SMTPS (port 465)
-
-def _send_email(to_email: str, subject: str, body: str):
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
-        logger.warning("SMTP not configured; skipping email to %s: %s", to_email, subject)
-        return
-    import smtplib
-    from email.message import EmailMessage
-    msg = EmailMessage()
-    msg['Subject'] = subject
-    msg['From'] = SMTP_FROM
-    msg['To'] = to_email
-    msg.set_content(body)
-    try:
-        if SMTP_SSL:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=20) as server:
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=20) as server:
-                server.ehlo()
-                try:
-                    server.starttls()
-                    server.ehlo()
-                except smtplib.SMTPException:
-                    # If STARTTLS not supported, continue without TLS (some local dev servers)
-                    pass
-                server.login(SMTP_USER, SMTP_PASS)
-                server.send_message(msg)
-        logger.info("Sent email to %s: %s", to_email, subject)
-    except Exception as e:
-        logger.error("Failed to send email: %s", e)
-
 @app.post('/investor-proposals', response_model=schemas.InvestorProposal)
 def submit_investor_proposal(
     name: str = Form(...),
@@ -180,23 +150,25 @@ def submit_investor_proposal(
         status='submitted'
     )
     db.add(row)
+    # Email ack goes out from the outbox once the proposal is committed
+    mailer.enqueue(db, email.strip(), "GSEZ: Proposal received", "Thank you for your submission. Our team will contact you shortly.")
     db.commit()
     db.refresh(row)
 
-    # Optional email ack (best effort)
-    try:
-        _send_email(email, "GSEZ: Proposal received", "Thank you for your submission. Our team will contact you shortly.")
-    except Exception:
-        pass
-
     return row
 
+def _user_by_username(db: Session, username: str):
+    return db.query(models.User).filter(models.User.username == username).first()
+
 @app.post("/token", response_model=schemas.AccessToken)
-def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db), request: Request = None):
+async def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db), request: Request = None):
     client_ip = request.client.host if request and request.client else 'ip'
-    _rate_limit(db, LOGIN_SCOPE, f"{client_ip}:{form_data.username}")
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    _rate_limit(LOGIN_SCOPE, f"{client_ip}:{form_data.username}")
+    user = await run_in_threadpool(_user_by_username, db, form_data.username)
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await hashing.pool.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -207,10 +179,14 @@ def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestF
     if not user.email_verified:
         # Auto-fail with clear message
         raise HTTPException(status_code=403, detail="Email not verified")
-    access_token = auth.create_access_token(data={"sub": user.username, "role": user.role})
-    refresh_raw = auth.generate_refresh_token()
-    rt = models.RefreshToken(user_id=user.id, token=auth.hash_refresh_token(refresh_raw), expires_at=datetime.utcnow() + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS))
-    db.add(rt)
+    return await run_in_threadpool(_issue_tokens, db, response, user, new_hash)
+
+def _issue_tokens(db: Session, response: Response, user: models.User, new_hash: str | None = None) -> dict:
+    if new_hash:
+        # stored hash used an outdated scheme or cost; replace it now that we have the password
+        user.hashed_password = new_hash
+    access_token = auth.access_token_for(user)
+    refresh_raw = refresh_tokens.issue(db, user.id)
     db.commit()
     # HttpOnly cookie for refresh
     response.set_cookie(
@@ -229,18 +205,14 @@ def refresh_token(response: Response, request: Request, db: Session = Depends(da
     refresh_raw = request.cookies.get(REFRESH_COOKIE_NAME)
     if not refresh_raw:
         raise HTTPException(status_code=401, detail='Missing refresh token cookie')
-    hashed = auth.hash_refresh_token(refresh_raw)
-    token_row = db.query(models.RefreshToken).filter(models.RefreshToken.token == hashed, models.RefreshToken.revoked == False).first()
-    if not token_row or token_row.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=401, detail='Invalid refresh token')
-    user = db.query(models.User).filter(models.User.id == token_row.user_id).first()
+    # revoke the presented token and issue its successor (single use even under concurrent refreshes)
+    rotated = refresh_tokens.rotate(db, refresh_raw)
+    user = db.query(models.User).filter(models.User.id == rotated[0]).first() if rotated else None
     if not user:
+        db.rollback()
         raise HTTPException(status_code=401, detail='Invalid refresh token')
-    access_token = auth.create_access_token(data={"sub": user.username, "role": user.role})
-    # rotate refresh
-    token_row.revoked = True
-    new_refresh = auth.generate_refresh_token()
-    db.add(models.RefreshToken(user_id=user.id, token=auth.hash_refresh_token(new_refresh), expires_at=datetime.utcnow() + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS)))
+    access_token = auth.access_token_for(user)
+    new_refresh = rotated[1]
     db.commit()
     # Set rotated cookie
     response.set_cookie(
@@ -257,57 +229,58 @@ def refresh_token(response: Response, request: Request, db: Session = Depends(da
 @app.post('/token/logout')
 def logout(response: Response, request: Request, db: Session = Depends(database.get_db)):
     refresh_raw = request.cookies.get(REFRESH_COOKIE_NAME)
-    if refresh_raw:
-        hashed = auth.hash_refresh_token(refresh_raw)
-        row = db.query(models.RefreshToken).filter(models.RefreshToken.token == hashed, models.RefreshToken.revoked == False).first()
-        if row:
-            row.revoked = True
-            db.commit()
+    if refresh_raw and refresh_tokens.revoke(db, refresh_raw):
+        db.commit()
     response.delete_cookie(REFRESH_COOKIE_NAME, path=REFRESH_COOKIE_PATH)
     return {"detail": "Logged out"}
 
 @app.post('/email/send-verification')
 def send_email_verification(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(database.get_db), request: Request = None):
     if request and request.client:
-        _rate_limit(db, VERIFY_SCOPE, f"{request.client.host}:{current_user.id}")
+        _rate_limit(VERIFY_SCOPE, f"{request.client.host}:{current_user.id}")
     if current_user.email_verified:
         return {"detail": "Already verified"}
     # Generate a 6-digit code instead of a long token
     current_user.email_verification_token = f"{secrets.randbelow(900000) + 100000}"
     current_user.email_verification_sent_at = datetime.utcnow()
-    db.commit()
-    # Send email with code
-    _send_email(
+    # Queue email with code; sent in the background after the commit
+    mailer.enqueue(
+        db,
         to_email=current_user.email,
         subject="Verify your email",
         body=f"Your verification code is: {current_user.email_verification_token}\nIt expires in {EMAIL_VERIFICATION_TOKEN_EXPIRE_HOURS} hours."
     )
+    db.commit()
     resp = {"detail": "Verification email sent"}
     # In local dev without SMTP configured, expose code to unblock testing
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
+    if not mailer.configured():
         resp["dev_code"] = current_user.email_verification_token
     return resp
 
 @app.post('/email/send-verification-login')
-def send_email_verification_login(payload: schemas.EmailVerificationAuthRequest, db: Session = Depends(database.get_db), request: Request = None):
-    user = db.query(models.User).filter(models.User.username == payload.username).first()
+async def send_email_verification_login(payload: schemas.EmailVerificationAuthRequest, db: Session = Depends(database.get_db), request: Request = None):
+    user = await run_in_threadpool(_user_by_username, db, payload.username)
     # Validate credentials silently
-    if not user or not auth.verify_password(payload.password, user.hashed_password):
+    if not user or not await hashing.pool.verify(payload.password, user.hashed_password):
         raise HTTPException(status_code=401, detail='Invalid credentials')
     if user.email_verified:
         return {"detail": "Already verified"}
+    return await run_in_threadpool(_send_verification_code, db, user, request)
+
+def _send_verification_code(db: Session, user: models.User, request: Request | None) -> dict:
     if request and request.client:
-        _rate_limit(db, VERIFY_SCOPE, f"{request.client.host}:{user.id}")
+        _rate_limit(VERIFY_SCOPE, f"{request.client.host}:{user.id}")
     user.email_verification_token = f"{secrets.randbelow(900000) + 100000}"
     user.email_verification_sent_at = datetime.utcnow()
-    db.commit()
-    _send_email(
+    mailer.enqueue(
+        db,
         to_email=user.email,
         subject="Verify your email",
         body=f"Your verification code is: {user.email_verification_token}\nIt expires in {EMAIL_VERIFICATION_TOKEN_EXPIRE_HOURS} hours."
     )
+    db.commit()
     resp = {"detail": "Verification email sent"}
-    if not SMTP_HOST or not SMTP_USER or not SMTP_PASS:
+    if not mailer.configured():
         # Expose code in dev for testing convenience
         resp["dev_code"] = user.email_verification_token
         resp["token"] = user.email_verification_token
@@ -317,7 +290,7 @@ def send_email_verification_login(payload: schemas.EmailVerificationAuthRequest,
 def verify_email(payload: schemas.EmailVerificationRequest, db: Session = Depends(database.get_db), request: Request = None):
     # Optional: rate limit verification attempts per IP
     if request and request.client:
-        _rate_limit(db, VERIFY_SCOPE, f"{request.client.host}:verify")
+        _rate_limit(VERIFY_SCOPE, f"{request.client.host}:verify")
     # Optionally narrow by username/email to avoid matching a reused code across different users
     query = db.query(models.User).filter(models.User.email_verification_token == payload.token)
     if payload.username:
@@ -334,6 +307,7 @@ def verify_email(payload: schemas.EmailVerificationRequest, db: Session = Depend
     user.email_verified = True
     user.email_verification_token = None
     user.email_verification_sent_at = None
+    auth.forget_user(db, user)
     db.commit()
     return {"detail": "Email verified"}
 
@@ -342,7 +316,7 @@ def password_reset_request(payload: schemas.PasswordResetRequest, db: Session =
     user = db.query(models.User).filter(models.User.email == payload.email).first()
     if request and request.client:
         ident = f"{request.client.host}:{payload.email}"
-        _rate_limit(db, RESET_SCOPE, ident)
+        _rate_limit(RESET_SCOPE, ident)
     if not user:
         # Do not reveal existence
         return {"detail": "If that email exists, a reset was created"}
@@ -351,9 +325,67 @@ def password_reset_request(payload: schemas.PasswordResetRequest, db: Session =
     db.commit()
     return {"detail": "Reset token generated", "token": user.password_reset_token}
 
+@app.post('/newsletter/subscribe')
+def newsletter_subscribe(payload: schemas.NewsletterSubscribeRequest, db: Session = Depends(database.get_db), request: Request = None):
+    if not re.match(r".+@.+\..+", payload.email):
+        raise HTTPException(status_code=400, detail="Invalid email")
+    if request and request.client:
+        _rate_limit(NEWSLETTER_SCOPE, request.client.host)
+    row = newsletter.subscribe(db, payload.email)
+    db.commit()
+    # same answer whether or not the address was already subscribed
+    resp = {"detail": "Check your inbox to confirm the subscription"}
+    if not mailer.configured() and row.confirm_token:
+        resp["dev_token"] = row.confirm_token
+    return resp
+
+def _newsletter_action_page(title: str, path: str, token: str, button: str) -> HTMLResponse:
+    # GET only renders a button: link scanners and mail prefetchers must not change the subscription
+    return HTMLResponse(
+        f"<!doctype html><title>{title}</title><h1>{title}</h1>"
+        f'<form method="post" action="{path}?token={html.escape(token, quote=True)}"><button type="submit">{button}</button></form>'
+    )
+
+@app.get('/newsletter/confirm', response_class=HTMLResponse)
+def newsletter_confirm_page(token: str):
+    return _newsletter_action_page("Confirm your GSEZ newsletter subscription", "/newsletter/confirm", token, "Confirm subscription")
+
+@app.post('/newsletter/confirm')
+def newsletter_confirm(token: str, db: Session = Depends(database.get_db), request: Request = None):
+    if request and request.client:
+        _rate_limit(NEWSLETTER_SCOPE, request.client.host)
+    if not newsletter.confirm(db, token):
+        raise HTTPException(status_code=404, detail="Unknown or already used confirmation link")
+    db.commit()
+    return {"detail": "Subscribed"}
+
+@app.get('/newsletter/unsubscribe', response_class=HTMLResponse)
+def newsletter_unsubscribe_page(token: str):
+    return _newsletter_action_page("Unsubscribe from GSEZ news", "/newsletter/unsubscribe", token, "Unsubscribe")
+
+@app.post('/newsletter/unsubscribe')
+def newsletter_unsubscribe(token: str, db: Session = Depends(database.get_db), request: Request = None):
+    # also the RFC 8058 one-click target of the List-Unsubscribe header
+    if request and request.client:
+        _rate_limit(NEWSLETTER_SCOPE, request.client.host)
+    if not newsletter.unsubscribe(db, token):
+        raise HTTPException(status_code=404, detail="Unknown or already used unsubscribe link")
+    db.commit()
+    return {"detail": "Unsubscribed"}
+
+def _user_by_reset_token(db: Session, token: str):
+    return db.query(models.User).filter(models.User.password_reset_token == token).first()
+
+def _set_password(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    user.password_reset_token = None
+    user.password_reset_sent_at = None
+    auth.revoke_tokens(db, user)
+    db.commit()
+
 @app.post('/password/reset-perform')
-def password_reset_perform(payload: schemas.PasswordResetPerform, db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.password_reset_token == payload.token).first()
+async def password_reset_perform(payload: schemas.PasswordResetPerform, db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(_user_by_reset_token, db, payload.token)
     if not user:
         raise HTTPException(status_code=400, detail='Invalid token')
     if not user.password_reset_sent_at or user.password_reset_sent_at + timedelta(hours=PASSWORD_RESET_TOKEN_EXPIRE_HOURS) < datetime.utcnow():
@@ -361,10 +393,8 @@ def password_reset_perform(payload: schemas.PasswordResetPerform, db: Session =
     pw_errors = auth.password_strength_errors(payload.new_password)
     if pw_errors:
         raise HTTPException(status_code=400, detail=f"Weak password, need: {', '.join(pw_errors)}")
-    user.hashed_password = auth.get_password_hash(payload.new_password)
-    user.password_reset_token = None
-    user.password_reset_sent_at = None
-    db.commit()
+    hashed_password = await hashing.pool.hash(payload.new_password)
+    await run_in_threadpool(_set_password, db, user, hashed_password)
     return {"detail": "Password reset successful"}
 
 @app.get("/users/me", response_model=schemas.User)
@@ -385,7 +415,7 @@ def health():
 def create_post(
     post: schemas.PostCreate,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     db_post = models.Post(
         title=post.title,
@@ -404,7 +434,7 @@ def create_post(
     db.add(db_post)
     db.commit()
     db.refresh(db_post)
-    return db_post
+    return _with_srcsets(db, schemas.Post, [db_post])[0]
 
 ALLOWED_EXTS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
 MAX_IMAGE_BYTES = 4 * 1024 * 1024  # 4MB
@@ -412,7 +442,8 @@ MAX_IMAGE_BYTES = 4 * 1024 * 1024  # 4MB
 @app.post('/upload-image')
 def upload_image(
     file: UploadFile = File(...),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    db: Session = Depends(database.get_db),
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     # Basic content-type check
     if not file.content_type.startswith('image/'):
@@ -420,24 +451,89 @@ def upload_image(
     ext = os.path.splitext(file.filename)[1].lower() or '.img'
     if ext not in ALLOWED_EXTS:
         raise HTTPException(status_code=400, detail='Extension not allowed')
-    # Read first bytes to enforce size (stream copy with limit)
-    size = 0
-    filename = f"{uuid.uuid4().hex}{ext}"
-    dest_path = os.path.join(UPLOAD_DIR, filename)
-    with open(dest_path, 'wb') as out_file:
-        chunk = file.file.read(1024 * 1024)
-        while chunk:
-            size += len(chunk)
-            if size > MAX_IMAGE_BYTES:
-                out_file.close()
-                os.remove(dest_path)
-                raise HTTPException(status_code=400, detail='File too large (max 4MB)')
-            out_file.write(chunk)
-            chunk = file.file.read(1024 * 1024)
+    # Stream to a temp file with a size limit, named by the sha256 of the content
+    try:
+        filename, tmp_path, size = uploads.store(file.file, ext, MAX_IMAGE_BYTES, UPLOAD_DIR)
+    except uploads.TooLarge:
+        raise HTTPException(status_code=400, detail='File too large (max 4MB)')
+    # Register before placing the file, so a concurrent delete of the last reference keeps it
+    uploads.register(db, filename, size)
+    db.commit()
+    created = uploads.place(tmp_path, filename, size, UPLOAD_DIR)
+    if created:
+        # Resized variants are rendered in the background; until then /images serves the original
+        images.pool.submit(filename, UPLOAD_DIR)
+    url = f"/uploads/{filename}"
     # Return relative URL path
-    return { 'filename': filename, 'url': f"/uploads/{filename}" }
+    # empty until the variants are rendered (or already filled for a re-upload)
+    return { 'filename': filename, 'url': url, 'srcset': images.srcset_maps(db, [url])[0].get(url, {}), 'deduplicated': not created }
+
+@app.get('/images/{width}/{name}')
+def image_variant(width: int, name: str):
+    """A resized variant of an upload, or the original while the variant is missing."""
+    filename, _, ext = name.rpartition('.')
+    fmt = images.EXT_FORMAT.get(ext)
+    if width not in images.IMAGE_WIDTHS or fmt is None or not images.UPLOAD_NAME.match(filename):
+        raise HTTPException(status_code=404, detail='Not found')
+    path = os.path.join(images.variant_dir(UPLOAD_DIR), images.variant_filename(filename, width, fmt))
+    if os.path.isfile(path):
+        return FileResponse(path, media_type=images.FORMATS[fmt][2], headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+    original = os.path.join(UPLOAD_DIR, filename)
+    if not os.path.isfile(original):
+        raise HTTPException(status_code=404, detail='Not found')
+    # short-lived so the variant replaces it once rendered
+    return FileResponse(original, headers={'Cache-Control': 'public, max-age=60'})
 
-@app.get("/posts", response_model=schemas.PostList)
+@app.post('/tasks/process-images')
+def process_images(db: Session = Depends(database.get_db), current_admin: auth.Principal = Depends(auth.get_current_admin)):
+    """Queue uploads that have no variants yet (skipped when the queue was full, or uploaded before variants existed)."""
+    todo = images.unprocessed(db, UPLOAD_DIR)
+    queued = 0
+    for filename in todo:
+        if images.pool.submit(filename, UPLOAD_DIR) is None:
+            break
+        queued += 1
+    return {"queued": queued, "remaining": len(todo) - queued}
+
+POST_SORT_KEYS = {'created_asc', 'publish_at_asc', 'publish_at_desc', 'relevance'}
+POST_FIELDS = {'full', 'summary'}
+# Columns selected for fields=summary: everything a card or admin row shows, without the details body
+POST_SUMMARY_COLUMNS = (
+    models.Post.id, models.Post.title, models.Post.date, models.Post.image, models.Post.excerpt,
+    models.Post.created_at, models.Post.status, models.Post.publish_at,
+    models.Post.likes_count, models.Post.comments_count,
+)
+
+def _post_keyset_filter(sort_key: str, cur: dict, rank_col=None):
+    """Filter selecting rows strictly after the cursor position for the given sort."""
+    last_id = cur["id"]
+    if sort_key == 'relevance':
+        last_rank = cur.get("r")
+        if not isinstance(last_rank, (int, float)):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return (rank_col > last_rank) | ((rank_col == last_rank) & (models.Post.id < last_id))
+    if sort_key == 'created_asc':
+        return models.Post.id > last_id
+    if sort_key in ('publish_at_asc', 'publish_at_desc'):
+        last_pub = pagination.parse_datetime(cur.get("p"))
+        if last_pub is None:
+            # NULL publish_at rows sort last, so only the rest of the NULL tail remains
+            return (models.Post.publish_at == None) & (models.Post.id < last_id)
+        if sort_key == 'publish_at_asc':
+            beyond = models.Post.publish_at > last_pub
+        else:
+            beyond = models.Post.publish_at < last_pub
+        return beyond | ((models.Post.publish_at == last_pub) & (models.Post.id < last_id)) | (models.Post.publish_at == None)
+    return models.Post.id < last_id
+
+def _post_cursor(sort_key: str, post, rank=None) -> str:
+    if sort_key == 'relevance':
+        return pagination.encode_cursor(sort_key, id=post.id, r=rank)
+    if sort_key in ('publish_at_asc', 'publish_at_desc'):
+        return pagination.encode_cursor(sort_key, id=post.id, p=post.publish_at)
+    return pagination.encode_cursor(sort_key, id=post.id)
+
+@app.get("/posts", response_model=schemas.PostList | schemas.PostSummaryList)
 def read_posts(
     db: Session = Depends(database.get_db),
     skip: int = 0,
@@ -445,53 +541,254 @@ def read_posts(
     search: str | None = None,
     status: str | None = None,
     sort: str | None = None,
-    current_user: models.User | None = Depends(auth.get_current_user_optional)
+    cursor: str | None = None,
+    total: str = 'exact',
+    fields: str = 'full',
+    if_none_match: str | None = Header(None),
+    current_user: auth.Principal | None = Depends(auth.get_current_principal_optional)
 ):
     # Non-admin users see only published posts (status=published and publish_at <= now OR no publish_at but status=published)
     from datetime import datetime
-    query = db.query(models.Post)
-    if not current_user or current_user.role != 'admin':
-        now = datetime.utcnow()
-        query = query.filter(
-            (models.Post.status == 'published') & (
-                (models.Post.publish_at == None) | (models.Post.publish_at <= now)
-            )
-        )
+    sort_key = sort if sort in POST_SORT_KEYS else 'id_desc'
+    _check_total_mode(total)
+    if fields not in POST_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid fields; allowed: {', '.join(sorted(POST_FIELDS))}")
+    summary = fields == 'summary'
+    public = not current_user or current_user.role != 'admin'
+    now = datetime.utcnow()
+    page_size = max(min(limit, 100), 0)
+    cache_key = None
+    if public:
+        # Everyone on the public path sees identical pages: serve the cached JSON bytes when present
+        cache_key = ('posts', None if cursor else skip, cursor, page_size, search, status, sort_key, total, fields)
+        cached = feedcache.cache.get(cache_key, now)
+        if cached is not None:
+            return _cached_page_response(*cached, if_none_match)
+    fts = None
+    match = fulltext.match_expression(search) if search else None
+    # Plain column rows for summaries and the fast path; full ORM entities otherwise
+    plain = summary or fastjson.enabled()
+    entities = POST_SUMMARY_COLUMNS if summary else (fastjson.columns(models.Post, schemas.Post) if plain else (models.Post,))
+    if match:
+        # Full-text path: join the FTS5 index for matching ids, bm25 rank and a highlighted snippet
+        fts = fulltext.match_subquery(match)
+        query = db.query(*entities, fts.c.rank, fts.c.snippet).join(fts, fts.c.post_id == models.Post.id)
+    else:
+        query = db.query(*entities)
+    if sort_key == 'relevance' and fts is None:
+        sort_key = 'id_desc'
+    if public:
+        query = query.filter(_public_post_filter(now))
     if status and status != 'all':
         query = query.filter(models.Post.status == status)
-    if search:
+    if search and not match:
+        # No indexable words (e.g. only punctuation): fall back to a substring match
         like = f"%{search}%"
         query = query.filter(models.Post.title.ilike(like) | models.Post.details.ilike(like))
-    total = query.count()
-    # Sorting: created_at desc (default), or created_at asc, or publish_at asc/desc
-    if sort == 'created_asc':
+    total_count = _post_total(db, total, query, public, status, bool(search), now)
+    # Keyset mode: continue after the cursor row instead of skipping rows with OFFSET
+    if cursor:
+        cur = pagination.decode_cursor(cursor, sort_key)
+        query = query.filter(_post_keyset_filter(sort_key, cur, fts.c.rank if fts is not None else None))
+    # Sorting: created_at desc (default), or created_at asc, or publish_at asc/desc, or bm25 relevance
+    if sort_key == 'relevance':
+        query = query.order_by(fts.c.rank.asc(), models.Post.id.desc())
+    elif sort_key == 'created_asc':
         query = query.order_by(models.Post.id.asc())
-    elif sort == 'publish_at_asc':
-        from sqlalchemy import asc
+    elif sort_key == 'publish_at_asc':
         query = query.order_by(models.Post.publish_at.asc().nullslast(), models.Post.id.desc())
-    elif sort == 'publish_at_desc':
-        from sqlalchemy import desc
+    elif sort_key == 'publish_at_desc':
         query = query.order_by(models.Post.publish_at.desc().nullslast(), models.Post.id.desc())
     else:
         query = query.order_by(models.Post.id.desc())
-    posts = query.offset(skip).limit(min(limit, 100)).all()
-    return {"total": total, "items": posts}
+    if not cursor:
+        query = query.offset(skip)
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(page_size + 1).all() if page_size else []
+    # Plain rows are column tuples (attribute access works for serialization and cursors)
+    posts, ranks, snippets = [], {}, {}
+    for row in rows:
+        post = row if plain or fts is None else row[0]
+        if fts is not None:
+            snippets[post.id] = fulltext.highlight(row.snippet)
+            ranks[post.id] = row.rank
+        posts.append(post)
+    next_cursor = None
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        next_cursor = _post_cursor(sort_key, posts[-1], ranks.get(posts[-1].id))
+    if fastjson.enabled():
+        item_schema = schemas.PostSummary if summary else schemas.Post
+        srcsets = dict(zip([p.id for p in posts], images.srcset_maps(db, [p.image for p in posts])))
+        items = fastjson.items(item_schema, posts, images=lambda row: srcsets[row.id], snippet=lambda row: snippets.get(row.id))
+        body = fastjson.dumps({"total": total_count, "items": items, "next_cursor": next_cursor})
+    else:
+        item_schema = schemas.PostSummary if summary else schemas.Post
+        result = {"total": total_count, "items": _with_srcsets(db, item_schema, posts, snippets), "next_cursor": next_cursor}
+        list_schema = schemas.PostSummaryList if summary else schemas.PostList
+        body = list_schema.model_validate(result).model_dump_json().encode('utf-8')
+    if not public:
+        return Response(content=body, media_type='application/json')
+    etag = feedcache.etag_for(body)
+    feedcache.cache.put(cache_key, (body, etag), [p.id for p in posts], _feed_cache_expiry(db, now))
+    return _cached_page_response(body, etag, if_none_match)
+
+def _cached_page_response(body: bytes, etag: str, if_none_match: str | None) -> Response:
+    # The ETag also keys the compression middleware's cache of gzip/br variants
+    if compression.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
+
+def _with_srcsets(db: Session, schema, posts, snippets: dict | None = None) -> list:
+    """Posts (ORM or column rows) as `schema` with the `images` srcsets (and search snippets) filled in, one variant query for all."""
+    maps = images.srcset_maps(db, [p.image for p in posts])
+    return [schema.model_validate(p).model_copy(update={"images": m, "snippet": (snippets or {}).get(p.id)})
+            for p, m in zip(posts, maps)]
+
+def _public_post_filter(now: datetime):
+    return (models.Post.status == 'published') & (
+        (models.Post.publish_at == None) | (models.Post.publish_at <= now)
+    )
+
+def _post_is_public(db: Session, post_id: int) -> bool:
+    return db.query(models.Post.id).filter(models.Post.id == post_id, _public_post_filter(datetime.utcnow())).first() is not None
+
+MAX_BATCH_IDS = 100
+
+def _parse_post_ids(raw: str) -> list[int]:
+    try:
+        return [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail='ids must be a comma-separated list of integers')
+
+def _post_batch(db: Session, ids: list[int], fields: str, current_user: auth.Principal | None):
+    """Fetch posts by id with one IN query, keeping the requested order and the read_posts visibility rules."""
+    if fields not in POST_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid fields; allowed: {', '.join(sorted(POST_FIELDS))}")
+    ids = list(dict.fromkeys(ids))  # de-duplicate, keep first occurrence order
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f'At most {MAX_BATCH_IDS} ids per batch')
+    summary = fields == 'summary'
+    found = {}
+    if ids:
+        query = db.query(*(POST_SUMMARY_COLUMNS if summary else (models.Post,))).filter(models.Post.id.in_(ids))
+        if not current_user or current_user.role != 'admin':
+            query = query.filter(_public_post_filter(datetime.utcnow()))
+        found = {row.id: row for row in query.all()}
+    # Hidden posts are reported as missing so drafts do not leak
+    item_schema = schemas.PostSummary if summary else schemas.Post
+    result = {"items": _with_srcsets(db, item_schema, [found[i] for i in ids if i in found]), "missing": [i for i in ids if i not in found]}
+    batch_schema = schemas.PostSummaryBatch if summary else schemas.PostBatch
+    return Response(content=batch_schema.model_validate(result).model_dump_json(), media_type='application/json')
+
+@app.get('/posts/batch', response_model=schemas.PostBatch | schemas.PostSummaryBatch)
+def read_posts_batch(
+    ids: str,
+    fields: str = 'full',
+    db: Session = Depends(database.get_db),
+    current_user: auth.Principal | None = Depends(auth.get_current_principal_optional)
+):
+    return _post_batch(db, _parse_post_ids(ids), fields, current_user)
+
+@app.post('/posts/batch', response_model=schemas.PostBatch | schemas.PostSummaryBatch)
+def read_posts_batch_body(
+    payload: schemas.PostBatchRequest,
+    fields: str = 'full',
+    db: Session = Depends(database.get_db),
+    current_user: auth.Principal | None = Depends(auth.get_current_principal_optional)
+):
+    return _post_batch(db, payload.ids, fields, current_user)
+
+@app.get('/posts/likes', response_model=schemas.LikeStatusBatch)
+def like_statuses(ids: str, db: Session = Depends(database.get_db), current_user: auth.Principal | None = Depends(auth.get_current_principal_optional)):
+    """Like state for a page of cards: counts from posts.likes_count, the caller's likes from one IN query."""
+    post_ids = list(dict.fromkeys(_parse_post_ids(ids)))
+    if len(post_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f'At most {MAX_BATCH_IDS} ids per batch')
+    found, liked = {}, set()
+    if post_ids:
+        query = db.query(models.Post.id, models.Post.likes_count).filter(models.Post.id.in_(post_ids))
+        if not current_user or current_user.role != 'admin':
+            query = query.filter(_public_post_filter(datetime.utcnow()))
+        found = {row.id: row.likes_count or 0 for row in query.all()}
+    if current_user and found:
+        liked = {row.post_id for row in db.query(models.PostLike.post_id).filter(
+            models.PostLike.user_id == current_user.id, models.PostLike.post_id.in_(list(found))
+        )}
+    items = [{"post_id": i, "liked": i in liked, "likes_count": found[i]} for i in post_ids if i in found]
+    if like_buffer.enabled():
+        for item in items:
+            item["liked"], item["likes_count"] = like_buffer.buffer.overlay(
+                item["post_id"], item["likes_count"], current_user.id if current_user else None, item["liked"])
+    return {"items": items, "missing": [i for i in post_ids if i not in found]}
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def _event_stream(request: Request, topic: str, last_event_id: str | None):
+    try:
+        body = events.open_stream(request, topic, last_event_id)
+    except events.HubFull:
+        raise HTTPException(status_code=503, detail='Too many open event streams', headers={'Retry-After': '30'})
+    return StreamingResponse(body, media_type='text/event-stream', headers=SSE_HEADERS)
+
+@app.get('/posts/events')
+async def feed_events(request: Request, last_event_id: str | None = Header(None)):
+    """Server-Sent Events for the news feed: `published` when a scheduled post goes live."""
+    return _event_stream(request, events.FEED_TOPIC, last_event_id)
+
+@app.get('/posts/{post_id}/events')
+async def post_events(post_id: int, request: Request, last_event_id: str | None = Header(None)):
+    """Server-Sent Events for one post: `comment`, `comment_deleted` and `likes` (served from memory, no DB queries)."""
+    return _event_stream(request, events.post_topic(post_id), last_event_id)
+
+def _check_total_mode(mode: str):
+    if mode not in counts.TOTAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid total mode; allowed: {', '.join(sorted(counts.TOTAL_MODES))}")
+
+def _post_total(db: Session, mode: str, query, public: bool, status: str | None, searched: bool, now: datetime):
+    """Total for /posts: maintained status counts when they answer the filter, COUNT(*) only for exact searches."""
+    if mode == 'none':
+        return None
+    if searched and mode == 'exact':
+        return query.count()
+    buckets = [status] if status and status != 'all' else None
+    if public:
+        if buckets is not None and 'published' not in buckets:
+            return 0
+        buckets = ['published']
+    n = counts.get(db, 'posts', buckets)
+    if public and mode == 'exact':
+        # published posts whose publish_at is still ahead are counted but not yet visible
+        n -= db.query(models.Post.id).filter(models.Post.status == 'published', models.Post.publish_at > now).count()
+    return max(n, 0)
+
+def _feed_cache_expiry(db: Session, now: datetime) -> datetime:
+    """Public pages stay valid until the TTL or the next published post whose publish_at is still ahead."""
+    from sqlalchemy import func
+    expires = now + timedelta(seconds=feedcache.FEED_CACHE_TTL)
+    next_publish = db.query(func.min(models.Post.publish_at)).filter(
+        models.Post.status == 'published', models.Post.publish_at > now
+    ).scalar()
+    if next_publish and next_publish < expires:
+        return next_publish
+    return expires
 
 @app.post('/tasks/publish-scheduled')
-def publish_scheduled(db: Session = Depends(database.get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+def publish_scheduled(db: Session = Depends(database.get_db), current_admin: auth.Principal = Depends(auth.get_current_admin)):
     """Flip scheduled posts whose publish_at <= now to published. Returns count updated."""
     from datetime import datetime
     now = datetime.utcnow()
     q = db.query(models.Post).filter(models.Post.status == 'scheduled', models.Post.publish_at != None, models.Post.publish_at <= now)
-    count = 0
+    published = []
     for post in q.all():
         post.status = 'published'
-        count += 1
+        published.append({"id": post.id, "title": post.title})
     db.commit()
-    return {"updated": count}
+    _announce_published(published)
+    return {"updated": len(published)}
 
 @app.post('/tasks/backfill-post-status')
-def backfill_post_status(db: Session = Depends(database.get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+def backfill_post_status(db: Session = Depends(database.get_db), current_admin: auth.Principal = Depends(auth.get_current_admin)):
     """Set status='published' for posts with NULL status (legacy rows)."""
     q = db.query(models.Post).filter(models.Post.status == None)
     count = 0
@@ -501,37 +798,73 @@ def backfill_post_status(db: Session = Depends(database.get_db), current_admin:
     db.commit()
     return {"updated": count}
 
+@app.post('/tasks/reconcile-counters')
+def reconcile_counters(db: Session = Depends(database.get_db), current_admin: auth.Principal = Depends(auth.get_current_admin)):
+    """Reconcile one chunk of the likes/comments counter pass; returns its drift and `next_id` (call again to continue).
+
+    The full time-budgeted pass runs in the scheduler job, not in a request worker.
+    """
+    return reconcile.run(db, chunk_size=reconcile.CHUNK_SIZE, time_budget=0, pause=0)
+
 # --- Scheduler for auto-publishing scheduled posts ---
 _scheduler: BackgroundScheduler | None = None
 
+def _announce_published(posts: list[dict]):
+    for post in posts:
+        events.hub.publish(events.FEED_TOPIC, 'published', post)
+        events.hub.publish(events.post_topic(post["id"]), 'published', post)
+
 def _auto_publish_job():
     from datetime import datetime
     db = next(database.get_db())
     try:
         now = datetime.utcnow()
         q = db.query(models.Post).filter(models.Post.status == 'scheduled', models.Post.publish_at != None, models.Post.publish_at <= now)
-        changed = 0
+        published = []
         for post in q.all():
             post.status = 'published'
-            changed += 1
-        if changed:
+            published.append({"id": post.id, "title": post.title})
+        if published:
             db.commit()
-            logger.info("Auto-published %d scheduled posts", changed)
+            _announce_published(published)
+            logger.info("Auto-published %d scheduled posts", len(published))
     finally:
         db.close()
 
 def _cleanup_refresh_tokens_job():
     db = next(database.get_db())
     try:
-        now = datetime.utcnow()
-        q = db.query(models.RefreshToken).filter((models.RefreshToken.expires_at < now) | (models.RefreshToken.revoked == True))
-        # Limit deletion batch to avoid long locks
-        stale = q.limit(500).all()
-        if stale:
-            for row in stale:
-                db.delete(row)
-            db.commit()
-            logger.info("Cleanup removed %d stale refresh tokens", len(stale))
+        report = refresh_tokens.sweep(db)
+        if report.get("deleted"):
+            logger.info("Cleanup removed %d stale refresh tokens in %d chunks", report["deleted"], report["chunks"])
+    finally:
+        db.close()
+
+def _newsletter_job():
+    db = next(database.get_db())
+    try:
+        report = newsletter.run(db)
+        if report.get("sent") or report.get("complete"):
+            logger.info("Newsletter campaign %s: sent %d (%s)", report["campaign"], report["sent"],
+                        "done" if report["complete"] else "continuing")
+    finally:
+        db.close()
+
+def _sweep_uploads_job():
+    db = next(database.get_db())
+    try:
+        removed = uploads.sweep_orphans(db)
+        if removed:
+            logger.info("Removed %d uploads no post references", removed)
+    finally:
+        db.close()
+
+def _reconcile_counters_job():
+    db = next(database.get_db())
+    try:
+        report = reconcile.run(db)
+        if report.get("drifted"):
+            logger.warning("Counter reconcile fixed %d drifted counters (checked %d posts)", report["drifted"], report["checked"])
     finally:
         db.close()
 
@@ -544,7 +877,10 @@ def _start_scheduler():
         _scheduler = BackgroundScheduler()
         _scheduler.start()
         _scheduler.add_job(_auto_publish_job, IntervalTrigger(minutes=1), id='auto_publish', replace_existing=True)
-    _scheduler.add_job(_cleanup_refresh_tokens_job, IntervalTrigger(minutes=30), id='cleanup_refresh_tokens', replace_existing=True)
+    _scheduler.add_job(_cleanup_refresh_tokens_job, IntervalTrigger(minutes=10), id='cleanup_refresh_tokens', replace_existing=True)
+    _scheduler.add_job(_reconcile_counters_job, IntervalTrigger(minutes=15), id='reconcile_counters', replace_existing=True)
+    _scheduler.add_job(_newsletter_job, IntervalTrigger(minutes=1), id='newsletter', replace_existing=True)
+    _scheduler.add_job(_sweep_uploads_job, IntervalTrigger(hours=1), id='sweep_uploads', replace_existing=True)
 
 @app.on_event("shutdown")
 def _stop_scheduler():
@@ -555,33 +891,104 @@ def _stop_scheduler():
         _scheduler.shutdown(wait=False)
         _scheduler = None
 
+@app.on_event("startup")
+def _start_rate_limiter():
+    rate_limiter.start()
+
+@app.on_event("shutdown")
+def _stop_rate_limiter():
+    rate_limiter.stop()
+
+@app.on_event("startup")
+def _start_mail_sender():
+    mailer.sender.start()  # no-op without SMTP settings
+
+@app.on_event("shutdown")
+def _stop_mail_sender():
+    mailer.sender.stop()
+
+@app.on_event("startup")
+def _start_like_buffer():
+    if like_buffer.enabled():
+        like_buffer.buffer.start()
+
+@app.on_event("shutdown")
+def _stop_like_buffer():
+    if like_buffer.enabled():
+        like_buffer.buffer.stop()  # durable: writes whatever is still buffered
+
+@app.on_event("startup")
+def _start_hash_pool():
+    if os.getenv('DISABLE_SCHEDULER') != '1':  # not in tests; workers spawn on first use there
+        hashing.pool.start()
+
+@app.on_event("shutdown")
+def _stop_hash_pool():
+    hashing.pool.shutdown()
+
+@app.on_event("shutdown")
+def _stop_image_pool():
+    images.pool.shutdown()
+
+@app.get('/metrics')
+def read_metrics(current_admin: auth.Principal = Depends(auth.get_current_admin)):
+    """In-process cache and worker statistics for this server process."""
+    return {
+        "feed_cache": feedcache.cache.stats(),
+        "profile_cache": profiles.cache.stats(),
+        "auth_user_cache": auth.user_cache.stats(),
+        "token_versions": auth.token_versions.stats(),
+        "compression": compression.stats(),
+        "counter_reconcile": reconcile.last_report(),
+        "refresh_tokens": refresh_tokens.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "outbox": mailer.sender.stats(),
+        "newsletter": newsletter.stats(),
+        "images": images.pool.stats(),
+        "uploads": uploads.stats(),
+        "like_buffer": like_buffer.buffer.stats(),
+        "password_hashing": hashing.pool.stats(),
+        "events": events.hub.stats(),
+    }
+
 @app.get("/users", response_model=schemas.UserList)
 def read_users(
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin),
+    current_admin: auth.Principal = Depends(auth.get_current_admin),
     skip: int = 0,
     limit: int = 50,
-    search: str | None = None
+    search: str | None = None,
+    total: str = 'exact'
 ):
+    _check_total_mode(total)
     query = db.query(models.User)
     if search:
         like = f"%{search}%"
         query = query.filter(models.User.username.ilike(like) | models.User.email.ilike(like))
-    total = query.count()
-    users = query.order_by(models.User.id.desc()).offset(skip).limit(min(limit, 100)).all()
-    return {"total": total, "items": users}
+    if total == 'none':
+        total_count = None
+    elif search and total == 'exact':
+        total_count = query.count()
+    else:
+        total_count = counts.get(db, 'users')
+    query = query.order_by(models.User.id.desc()).offset(skip).limit(min(limit, 100))
+    if fastjson.enabled():
+        rows = query.with_entities(*fastjson.columns(models.User, schemas.User)).all()
+        return fastjson.response({"total": total_count, "items": fastjson.items(schemas.User, rows)})
+    return {"total": total_count, "items": query.all()}
 
 @app.put("/users/{user_id}/role", response_model=schemas.User)
 def update_user_role(
     user_id: int,
     role: str,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.role = role
+    auth.revoke_tokens(db, user)
     db.commit()
     db.refresh(user)
     return user
@@ -590,11 +997,14 @@ def update_user_role(
 def delete_user(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    # likes go with the user (comments stay, shown without an author)
+    counters.user_removed(db, user.id)
+    auth.forget_user(db, user)
     db.delete(user)
     db.commit()
     return {"detail": "User deleted"}
@@ -604,29 +1014,30 @@ def approve_user(
     user_id: int,
     body: schemas.UserApprove,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.approved = body.approved
+    auth.revoke_tokens(db, user)
     db.commit()
     db.refresh(user)
     return user
 
 @app.post('/users/password-change')
-def change_password(
+async def change_password(
     payload: schemas.PasswordChange,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    if not auth.verify_password(payload.old_password, current_user.hashed_password):
+    if not await hashing.pool.verify(payload.old_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail='Old password incorrect')
     pw_errors = auth.password_strength_errors(payload.new_password)
     if pw_errors:
         raise HTTPException(status_code=400, detail=f"Weak password, need: {', '.join(pw_errors)}")
-    current_user.hashed_password = auth.get_password_hash(payload.new_password)
-    db.commit()
+    hashed_password = await hashing.pool.hash(payload.new_password)
+    await run_in_threadpool(_set_password, db, current_user, hashed_password)
     return {"detail": "Password updated"}
 
 @app.get("/posts/{post_id}", response_model=schemas.Post)
@@ -634,19 +1045,42 @@ def get_post(post_id: int, db: Session = Depends(database.get_db)):
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    return _with_srcsets(db, schemas.Post, [post])[0]
 
 @app.get("/posts/{post_id}/comments", response_model=schemas.CommentList)
-def list_comments(post_id: int, db: Session = Depends(database.get_db), skip: int = 0, limit: int = 50):
+def list_comments(
+    post_id: int,
+    db: Session = Depends(database.get_db),
+    skip: int = 0,
+    limit: int = 50,
+    after_id: int | None = None,
+    total: str = 'exact'
+):
+    _check_total_mode(total)
+    page_size = max(min(limit, 200), 0)
     q = db.query(models.Comment).filter(models.Comment.post_id == post_id)
-    total = q.count()
-    comments = q.order_by(models.Comment.id.asc()).offset(skip).limit(min(limit, 200)).all()
-    # Attach user details for display
-    user_ids = list({c.user_id for c in comments})
-    users_map = {}
-    if user_ids:
-        users = db.query(models.User).filter(models.User.id.in_(user_ids)).all()
-        users_map = {u.id: {"id": u.id, "username": u.username, "full_name": u.full_name} for u in users}
+    total_count = None
+    if total != 'none':
+        # comments_count on the post is maintained alongside comment inserts/deletes
+        total_count = db.query(models.Post.comments_count).filter(models.Post.id == post_id).scalar() or 0
+    # Keyset mode: a range scan on (post_id, id) instead of skipping rows with OFFSET
+    if after_id is not None:
+        q = q.filter(models.Comment.id > after_id).order_by(models.Comment.id.asc())
+    else:
+        q = q.order_by(models.Comment.id.asc()).offset(skip)
+    if fastjson.enabled():
+        q = q.with_entities(*fastjson.columns(models.Comment, schemas.Comment))
+    # Fetch one extra row to learn whether another page exists
+    comments = q.limit(page_size + 1).all() if page_size else []
+    next_after_id = None
+    if len(comments) > page_size:
+        comments = comments[:page_size]
+        next_after_id = comments[-1].id
+    # Attach author profiles for display (cached across requests)
+    users_map = profiles.cache.get_many(db, {c.user_id for c in comments})
+    if fastjson.enabled():
+        items = fastjson.items(schemas.Comment, comments, user=lambda row: users_map.get(row.user_id))
+        return fastjson.response({"total": total_count, "items": items, "next_after_id": next_after_id})
     items = []
     for c in comments:
         d = {
@@ -658,91 +1092,88 @@ def list_comments(post_id: int, db: Session = Depends(database.get_db), skip: in
             "user": users_map.get(c.user_id)
         }
         items.append(d)
-    return {"total": total, "items": items}
+    return {"total": total_count, "items": items, "next_after_id": next_after_id}
 
 @app.post("/posts/{post_id}/comments", response_model=schemas.Comment)
-def add_comment(post_id: int, payload: schemas.CommentCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def add_comment(post_id: int, payload: schemas.CommentCreate, db: Session = Depends(database.get_db), current_user: auth.Principal = Depends(auth.get_current_principal)):
     # Ensure post exists and is visible (published) for non-admins
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail='Post not found')
-    if current_user.role != 'admin':
-        from datetime import datetime
-        now = datetime.utcnow()
-        if not (post.status == 'published' and (post.publish_at is None or post.publish_at <= now)):
-            raise HTTPException(status_code=403, detail='Cannot comment on unpublished post')
+    now = datetime.utcnow()
+    public = post.status == 'published' and (post.publish_at is None or post.publish_at <= now)
+    if current_user.role != 'admin' and not public:
+        raise HTTPException(status_code=403, detail='Cannot comment on unpublished post')
     if not payload.content or not payload.content.strip():
         raise HTTPException(status_code=400, detail='Content required')
     comment = models.Comment(post_id=post_id, user_id=current_user.id, content=payload.content.strip())
     db.add(comment)
-    # increment post.comments_count
-    post.comments_count = (post.comments_count or 0) + 1
-    db.commit()
-    db.refresh(comment)
-    return {
+    db.flush()
+    comments_count = counters.comment_added(db, post_id)
+    # build the response before commit expires the loaded attributes
+    result = {
         "id": comment.id,
         "post_id": comment.post_id,
         "user_id": comment.user_id,
         "content": comment.content,
         "created_at": comment.created_at,
-        "user": {"id": current_user.id, "username": current_user.username, "full_name": current_user.full_name}
+        "user": profiles.cache.get_many(db, [current_user.id])[current_user.id]
     }
+    db.commit()
+    if public:  # streams are unauthenticated; admin comments on drafts stay private
+        events.hub.publish(events.post_topic(post_id), 'comment', result | {"comments_count": comments_count})
+    return result
 
 @app.delete("/posts/{post_id}/comments/{comment_id}")
-def delete_comment(post_id: int, comment_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    c = db.query(models.Comment).filter(models.Comment.id == comment_id, models.Comment.post_id == post_id).first()
-    if not c:
-        raise HTTPException(status_code=404, detail='Comment not found')
-    if current_user.role != 'admin' and c.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail='Forbidden')
-    db.delete(c)
-    # decrement post.comments_count (not below 0)
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if post and (post.comments_count or 0) > 0:
-        post.comments_count = post.comments_count - 1
+def delete_comment(post_id: int, comment_id: int, db: Session = Depends(database.get_db), current_user: auth.Principal = Depends(auth.get_current_principal)):
+    from sqlalchemy import delete
+    stmt = delete(models.Comment).where(models.Comment.id == comment_id, models.Comment.post_id == post_id)
+    if current_user.role != 'admin':
+        stmt = stmt.where(models.Comment.user_id == current_user.id)
+    if db.execute(stmt.returning(models.Comment.id)).first() is None:
+        exists = db.query(models.Comment.id).filter(models.Comment.id == comment_id, models.Comment.post_id == post_id).first()
+        raise HTTPException(status_code=403 if exists else 404, detail='Forbidden' if exists else 'Comment not found')
+    comments_count = counters.comment_removed(db, post_id)
     db.commit()
+    if _post_is_public(db, post_id):  # streams are unauthenticated
+        events.hub.publish(events.post_topic(post_id), 'comment_deleted', {"id": comment_id, "post_id": post_id, "comments_count": comments_count})
     return {"detail": "Comment deleted"}
 
 @app.get("/posts/{post_id}/likes", response_model=schemas.LikeStatus)
-def like_status(post_id: int, db: Session = Depends(database.get_db), current_user: models.User | None = Depends(auth.get_current_user_optional)):
-    likes_count = db.query(models.PostLike).filter(models.PostLike.post_id == post_id).count()
+def like_status(post_id: int, db: Session = Depends(database.get_db), current_user: auth.Principal | None = Depends(auth.get_current_principal_optional)):
+    likes_count = db.query(models.Post.likes_count).filter(models.Post.id == post_id).first()
+    if likes_count is None:
+        raise HTTPException(status_code=404, detail='Post not found')
     liked = False
     if current_user:
-        liked = db.query(models.PostLike).filter(models.PostLike.post_id == post_id, models.PostLike.user_id == current_user.id).first() is not None
+        liked = db.query(models.PostLike.id).filter(models.PostLike.post_id == post_id, models.PostLike.user_id == current_user.id).first() is not None
+    likes_count = likes_count[0] or 0
+    if like_buffer.enabled():
+        liked, likes_count = like_buffer.buffer.overlay(post_id, likes_count, current_user.id if current_user else None, liked)
     return {"liked": liked, "likes_count": likes_count}
 
 @app.post("/posts/{post_id}/likes/toggle", response_model=schemas.LikeStatus)
-def toggle_like(post_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    existing = db.query(models.PostLike).filter(models.PostLike.post_id == post_id, models.PostLike.user_id == current_user.id).first()
-    if existing:
-        db.delete(existing)
-        # decrement
-        post = db.query(models.Post).filter(models.Post.id == post_id).first()
-        if post and (post.likes_count or 0) > 0:
-            post.likes_count = post.likes_count - 1
-        db.commit()
+def toggle_like(post_id: int, db: Session = Depends(database.get_db), current_user: auth.Principal = Depends(auth.get_current_principal)):
+    if like_buffer.enabled():
+        # write-behind: answer from db + buffered state, persist in the next batched flush
+        state = like_buffer.buffer.toggle(db, post_id, current_user.id)
     else:
-        like = models.PostLike(post_id=post_id, user_id=current_user.id)
-        try:
-            db.add(like)
-            # increment
-            post = db.query(models.Post).filter(models.Post.id == post_id).first()
-            if post:
-                post.likes_count = (post.likes_count or 0) + 1
-            db.commit()
-        except Exception:
-            db.rollback()
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    likes_count = post.likes_count if post and post.likes_count is not None else db.query(models.PostLike).filter(models.PostLike.post_id == post_id).count()
-    liked = db.query(models.PostLike).filter(models.PostLike.post_id == post_id, models.PostLike.user_id == current_user.id).first() is not None
-    return {"liked": liked, "likes_count": int(likes_count)}
+        state = counters.toggle_like(db, post_id, current_user.id)
+    if state is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail='Post not found')
+    db.commit()
+    liked, likes_count = state
+    if _post_is_public(db, post_id):  # streams are unauthenticated; drafts and scheduled posts stay private
+        events.hub.publish(events.post_topic(post_id), 'likes', {"post_id": post_id, "likes_count": likes_count})
+    return {"liked": liked, "likes_count": likes_count}
 
 @app.put("/posts/{post_id}", response_model=schemas.Post)
 def update_post(
     post_id: int,
     payload: schemas.PostUpdate,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if not post:
@@ -764,14 +1195,14 @@ def update_post(
                 raise HTTPException(status_code=400, detail='Invalid publish_at format (use ISO8601)')
     db.commit()
     db.refresh(post)
-    return post
+    return _with_srcsets(db, schemas.Post, [post])[0]
 
 @app.patch('/posts/{post_id}/status', response_model=schemas.Post)
 def change_post_status(
     post_id: int,
     payload: schemas.PostStatusChange,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if not post:
@@ -788,29 +1219,18 @@ def change_post_status(
                 raise HTTPException(status_code=400, detail='Invalid publish_at format (use ISO8601)')
     db.commit()
     db.refresh(post)
-    return post
+    return _with_srcsets(db, schemas.Post, [post])[0]
 
 @app.delete("/posts/{post_id}")
 def delete_post(
     post_id: int,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     post = db.query(models.Post).filter(models.Post.id == post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    # Attempt to delete image file(s) if local and in uploads
-    if post.image:
-        parts = [p.strip() for p in re.split(r"[;,\s]+", post.image) if p and p.strip()]
-        for p in parts:
-            if p.startswith('/uploads/'):
-                fname = p.split('/uploads/')[-1]
-                fpath = os.path.join(UPLOAD_DIR, fname)
-                if os.path.isfile(fpath):
-                    try:
-                        os.remove(fpath)
-                    except OSError:
-                        pass
+    # Uploads it lists are released; a file is deleted after the commit once no other post lists it
     db.delete(post)
     db.commit()
     return {"detail": "Post deleted"}
@@ -819,13 +1239,15 @@ def delete_post(
 @app.get('/investor-proposals', response_model=schemas.InvestorProposalList)
 def list_investor_proposals(
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin),
+    current_admin: auth.Principal = Depends(auth.get_current_admin),
     skip: int = 0,
     limit: int = 50,
     search: str | None = None,
     status: str | None = None,
-    sector: str | None = None
+    sector: str | None = None,
+    total: str = 'exact'
 ):
+    _check_total_mode(total)
     q = db.query(models.InvestorProposal)
     if status and status != 'all':
         q = q.filter(models.InvestorProposal.status == status)
@@ -838,16 +1260,24 @@ def list_investor_proposals(
             (models.InvestorProposal.email.ilike(like)) |
             (models.InvestorProposal.phone.ilike(like))
         )
-    total = q.count()
-    items = q.order_by(models.InvestorProposal.id.desc()).offset(skip).limit(min(limit, 200)).all()
-    return {"total": total, "items": items}
+    if total == 'none':
+        total_count = None
+    elif (search or sector) and total == 'exact':
+        total_count = q.count()
+    else:
+        total_count = counts.get(db, 'investor_proposals', [status] if status and status != 'all' else None)
+    q = q.order_by(models.InvestorProposal.id.desc()).offset(skip).limit(min(limit, 200))
+    if fastjson.enabled():
+        rows = q.with_entities(*fastjson.columns(models.InvestorProposal, schemas.InvestorProposal)).all()
+        return fastjson.response({"total": total_count, "items": fastjson.items(schemas.InvestorProposal, rows)})
+    return {"total": total_count, "items": q.all()}
 
 @app.patch('/investor-proposals/{proposal_id}/status', response_model=schemas.InvestorProposal)
 def update_investor_proposal_status(
     proposal_id: int,
     payload: schemas.InvestorProposalStatusUpdate,
     db: Session = Depends(database.get_db),
-    current_admin: models.User = Depends(auth.get_current_admin)
+    current_admin: auth.Principal = Depends(auth.get_current_admin)
 ):
     row = db.query(models.InvestorProposal).filter(models.InvestorProposal.id == proposal_id).first()
     if not row:
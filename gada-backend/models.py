@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, LargeBinary, UniqueConstraint, Index, event, inspect
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -6,6 +6,8 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    # AUTOINCREMENT: a deleted user's id is never handed out again (tokens carry it in `uid`)
+    __table_args__ = {'sqlite_autoincrement': True}
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -16,10 +18,12 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     email_verified = Column(Boolean, default=False)
-    email_verification_token = Column(String, nullable=True)
+    email_verification_token = Column(String, nullable=True, index=True)
     email_verification_sent_at = Column(DateTime, nullable=True)
-    password_reset_token = Column(String, nullable=True)
+    password_reset_token = Column(String, nullable=True, index=True)
     password_reset_sent_at = Column(DateTime, nullable=True)
+    # bumped to invalidate access tokens issued before (role/approval/password change)
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')
 
 class Post(Base):
     __tablename__ = "posts"
@@ -33,6 +37,34 @@ class Post(Base):
     publish_at = Column(DateTime, nullable=True)  # when scheduled to go live
     likes_count = Column(Integer, default=0)
     comments_count = Column(Integer, default=0)
+    excerpt = Column(String, nullable=True)  # short plain-text teaser derived from details
+    __table_args__ = (
+        # public feed: status = 'published' walked in id order
+        Index('ix_posts_status_id', 'status', 'id'),
+        # scheduled publishing, not-yet-visible counts and publish_at sorts within a status
+        Index('ix_posts_status_publish_at', 'status', 'publish_at'),
+    )
+
+EXCERPT_LENGTH = 240
+
+def make_excerpt(text: str | None, length: int = EXCERPT_LENGTH) -> str:
+    """Whitespace-collapsed teaser of `text`, cut at a word boundary."""
+    flat = " ".join((text or "").split())
+    if len(flat) <= length:
+        return flat
+    cut = flat[:length]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "…"
+
+@event.listens_for(Post, 'before_insert')
+def _excerpt_on_insert(mapper, connection, target):
+    target.excerpt = make_excerpt(target.details)
+
+@event.listens_for(Post, 'before_update')
+def _excerpt_on_update(mapper, connection, target):
+    if inspect(target).attrs.details.history.has_changes():
+        target.excerpt = make_excerpt(target.details)
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -56,13 +88,17 @@ class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
-    token = Column(String, unique=True, index=True)  # opaque random string (jti)
+    token = Column(LargeBinary, unique=True, index=True)  # sha256 digest of the cookie value
     expires_at = Column(DateTime, index=True)
     revoked = Column(Boolean, default=False, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class RateLimit(Base):
     __tablename__ = "rate_limits"
+    __table_args__ = (
+        # one row per window: the shared rate-limit backend upserts into it
+        Index('uq_rate_limits_scope_identifier_window', 'scope', 'identifier', 'window_start', unique=True),
+    )
     id = Column(Integer, primary_key=True)
     scope = Column(String, index=True)
     identifier = Column(String, index=True)  # e.g. ip:user or ip:email
@@ -79,3 +115,104 @@ class InvestorProposal(Base):
     proposal_filename = Column(String)  # stored under /uploads/proposals/
     status = Column(String, default='submitted', index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class OutboundEmail(Base):
+    """Outbox row: queued by `mailer.enqueue`, delivered by the background sender."""
+    __tablename__ = "outbound_emails"
+    __table_args__ = (
+        # the sender claims due rows and /metrics counts pending ones through this
+        Index('ix_outbound_emails_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = Column(Integer, primary_key=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    status = Column(String, default='pending', nullable=False)  # pending | sending | sent | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    claimed_at = Column(DateTime, nullable=True)  # lease start while status is sending
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+class NewsletterSubscriber(Base):
+    __tablename__ = "newsletter_subscribers"
+    __table_args__ = (
+        # the fan-out walks active subscribers in id order
+        Index('ix_newsletter_subscribers_status_id', 'status', 'id'),
+    )
+    id = Column(Integer, primary_key=True)
+    email = Column(String, unique=True, nullable=False)
+    status = Column(String, default='pending', nullable=False)  # pending | active | unsubscribed | bounced
+    unsubscribe_token = Column(String, unique=True, nullable=False)
+    confirm_token = Column(String, unique=True, nullable=True)  # set while pending
+    confirm_sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    unsubscribed_at = Column(DateTime, nullable=True)
+
+class NewsletterCampaign(Base):
+    """One mailing per published post; progress is checkpointed in job_checkpoints."""
+    __tablename__ = "newsletter_campaigns"
+    __table_args__ = (
+        Index('ix_newsletter_campaigns_status_send_after', 'status', 'send_after'),
+    )
+    id = Column(Integer, primary_key=True)
+    post_id = Column(Integer, unique=True, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)  # rendered once; only the unsubscribe footer differs per recipient
+    status = Column(String, default='queued', nullable=False)  # queued | sending | sent | cancelled
+    send_after = Column(DateTime, nullable=False)  # the post's publish_at, or when it was published
+    sent_count = Column(Integer, default=0, nullable=False)
+    deferred_count = Column(Integer, default=0, nullable=False)  # handed to the outbox after a transient failure
+    bounced_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class ImageVariant(Base):
+    """A resized copy of an upload under uploads/variants/, written by the images pool."""
+    __tablename__ = "image_variants"
+    __table_args__ = (
+        Index('uq_image_variants_filename_width_format', 'filename', 'width', 'format', unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    filename = Column(String, nullable=False)  # the upload's name under uploads/
+    width = Column(Integer, nullable=False)  # srcset width; pixel_width is smaller when the original is
+    format = Column(String, nullable=False)  # webp | jpeg
+    pixel_width = Column(Integer, nullable=False)
+    pixel_height = Column(Integer, nullable=False)
+    bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class UploadBlob(Base):
+    """A stored upload, named `<sha256><ext>` under uploads/; referenced by posts through post_uploads."""
+    __tablename__ = "upload_blobs"
+    __table_args__ = (
+        Index('ix_upload_blobs_last_uploaded_at', 'last_uploaded_at'),
+    )
+    filename = Column(String, primary_key=True)
+    sha256 = Column(String, nullable=True)  # null for files uploaded before content addressing
+    size = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)  # re-uploads refresh it; orphans age from here
+
+class PostUpload(Base):
+    """A post listing an upload in its `image`; a blob's reference count is its number of rows here."""
+    __tablename__ = "post_uploads"
+    __table_args__ = (
+        Index('ix_post_uploads_filename', 'filename'),
+    )
+    post_id = Column(Integer, primary_key=True)
+    filename = Column(String, primary_key=True)
+
+class JobCheckpoint(Base):
+    """Resume position of a chunked background job (e.g. the counter reconcile walk)."""
+    __tablename__ = "job_checkpoints"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)  # highest id fully processed in the current pass
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class TableCount(Base):
+    __tablename__ = "table_counts"
+    entity = Column(String, primary_key=True)  # table name, e.g. posts
+    bucket = Column(String, primary_key=True)  # filter bucket, e.g. a status value or 'all'
+    count = Column(Integer, default=0, nullable=False)
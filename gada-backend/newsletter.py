@@ -0,0 +1,296 @@
+"""Newsletter: double opt-in subscribers and a fan-out when a post is published.
+
+Subscribing creates (or re-opens) a `pending` row and mails a confirmation
+link; only `active` (confirmed) subscribers are mailed. The confirmation and
+unsubscribe links open a page whose button POSTs, so link scanners and mail
+prefetchers that follow GETs change nothing. Newsletter mails also carry
+`List-Unsubscribe` / `List-Unsubscribe-Post` (RFC 8058 one-click), which
+POSTs to the same unsubscribe URL.
+
+Publishing never sends anything itself. Whatever path flips a post to
+`published` (create, update, status change, the scheduled-publish job), the
+flush that writes it also inserts one `newsletter_campaigns` row for the post
+(`ON CONFLICT DO NOTHING`, so re-publishing does not mail twice), with the
+subject and body rendered once and `send_after` set to the post's
+`publish_at`.
+
+`run()` is called by the scheduler every minute and works through the oldest
+due campaign:
+
+- subscribers are walked in id order, `NEWSLETTER_CHUNK_SIZE` at a time, and
+  each chunk is sent in parallel over the outbox's pool of logged-in SMTP
+  sessions (`mailer.sender.pool`);
+- at most `NEWSLETTER_PER_MINUTE` messages go out per minute, across runs;
+- after each chunk the last subscriber id is saved in `job_checkpoints` and
+  committed, so a restart resumes after it (a crash mid-chunk can resend that
+  chunk, never more);
+- a transient failure hands that recipient's message to the outbox, which
+  retries it with backoff; a permanent 5xx marks the subscriber `bounced`.
+
+A campaign whose post is no longer published is cancelled; deleting the post
+deletes its campaign.
+"""
+import os, secrets, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models, mailer
+
+NEWSLETTER_CHUNK_SIZE = int(os.getenv('NEWSLETTER_CHUNK_SIZE', '100'))
+NEWSLETTER_PER_MINUTE = int(os.getenv('NEWSLETTER_PER_MINUTE', '600'))
+# Stop a run after this long; the next scheduled run continues
+NEWSLETTER_TIME_BUDGET = float(os.getenv('NEWSLETTER_TIME_BUDGET', '50'))
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:5173').rstrip('/')
+PUBLIC_API_URL = os.getenv('PUBLIC_API_URL', 'http://localhost:8000').rstrip('/')
+
+_lock = threading.Lock()
+_last_report: dict | None = None
+_totals = {"runs": 0, "sent": 0, "deferred": 0, "bounced": 0, "campaigns_pending": None}
+
+
+def _checkpoint_name(campaign_id: int) -> str:
+    return f'newsletter_campaign_{campaign_id}'
+
+
+# --- subscribers ---------------------------------------------------------------
+
+def confirm_url(token: str) -> str:
+    return f"{PUBLIC_API_URL}/newsletter/confirm?token={token}"
+
+
+def unsubscribe_url(token: str) -> str:
+    return f"{PUBLIC_API_URL}/newsletter/unsubscribe?token={token}"
+
+
+def subscribe(db, email: str):
+    """Add a pending subscriber, or re-open an inactive one, and queue the confirmation mail (caller commits).
+
+    Already active subscribers are left alone (and get no mail).
+    """
+    email = email.strip().lower()
+    row = db.execute(select(models.NewsletterSubscriber).where(models.NewsletterSubscriber.email == email)).scalar_one_or_none()
+    if row is None:
+        row = models.NewsletterSubscriber(email=email, status='pending', unsubscribe_token=secrets.token_urlsafe(24))
+        db.add(row)
+    elif row.status == 'active':
+        return row
+    row.status = 'pending'
+    row.confirm_token = secrets.token_urlsafe(24)
+    row.confirm_sent_at = datetime.utcnow()
+    mailer.enqueue(db, email, "Confirm your GSEZ newsletter subscription",
+                   f"Someone (hopefully you) asked to receive GSEZ news at this address.\n\n"
+                   f"Confirm: {confirm_url(row.confirm_token)}\n\nIf it was not you, ignore this email.\n")
+    return row
+
+
+def confirm(db, token: str) -> bool:
+    return db.execute(
+        update(models.NewsletterSubscriber)
+        .where(models.NewsletterSubscriber.confirm_token == token, models.NewsletterSubscriber.status == 'pending')
+        .values(status='active', confirm_token=None, unsubscribed_at=None)
+        .returning(models.NewsletterSubscriber.id)
+    ).first() is not None
+
+
+def unsubscribe(db, token: str) -> bool:
+    return db.execute(
+        update(models.NewsletterSubscriber)
+        .where(models.NewsletterSubscriber.unsubscribe_token == token, models.NewsletterSubscriber.status == 'active')
+        .values(status='unsubscribed', unsubscribed_at=datetime.utcnow())
+        .returning(models.NewsletterSubscriber.id)
+    ).first() is not None
+
+
+# --- campaigns -----------------------------------------------------------------
+
+def render(post) -> tuple[str, str]:
+    """Subject and body shared by every recipient of the post's campaign."""
+    subject = f"New on GSEZ: {post.title}"
+    body = f"{post.title}\n\n{post.excerpt or models.make_excerpt(post.details)}\n\nRead more: {SITE_URL}/news/{post.id}\n"
+    return subject, body
+
+
+def _personalize(body: str, token: str) -> str:
+    return f"{body}\n--\nUnsubscribe: {unsubscribe_url(token)}\n"
+
+
+def _list_headers(token: str) -> dict:
+    return {"List-Unsubscribe": f"<{unsubscribe_url(token)}>", "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"}
+
+
+@event.listens_for(Session, 'after_flush')
+def _queue_campaigns(session, flush_context):
+    # a deleted post's campaign goes with it: SQLite may hand its id to the next post
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, models.Post)]
+    if deleted:
+        conn = session.connection()
+        gone = conn.execute(
+            delete(models.NewsletterCampaign).where(models.NewsletterCampaign.post_id.in_(deleted)).returning(models.NewsletterCampaign.id)
+        ).scalars().all()
+        if gone:
+            conn.execute(delete(models.JobCheckpoint).where(models.JobCheckpoint.name.in_([_checkpoint_name(i) for i in gone])))
+    rows = []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Post) and 'published' in inspect(obj).attrs.status.history.added:
+            subject, body = render(obj)
+            rows.append({"post_id": obj.id, "subject": subject, "body": body, "status": 'queued',
+                         "send_after": obj.publish_at or datetime.utcnow(), "created_at": datetime.utcnow()})
+    if rows:
+        # same transaction as the publish; a post already mailed once keeps its campaign
+        session.connection().execute(
+            insert(models.NewsletterCampaign).values(rows).on_conflict_do_nothing(index_elements=['post_id'])
+        )
+
+
+# --- fan-out -------------------------------------------------------------------
+
+class Throttle:
+    """At most `per_minute` sends per fixed minute, shared by successive runs."""
+    def __init__(self, per_minute: int = NEWSLETTER_PER_MINUTE, clock=time.monotonic):
+        self.per_minute = per_minute
+        self.clock = clock
+        self._minute = None
+        self._used = 0
+
+    def available(self) -> int:
+        minute = int(self.clock() // 60)
+        if minute != self._minute:
+            self._minute, self._used = minute, 0
+        return max(self.per_minute - self._used, 0)
+
+    def take(self, n: int):
+        self._used += n
+
+    def seconds_to_reset(self) -> float:
+        return 60 - self.clock() % 60
+
+
+throttle = Throttle()
+
+
+def _send(pool, sub_id: int, email: str, token: str, subject: str, body: str):
+    try:
+        pool.send(mailer.build_message(email, subject, _personalize(body, token), _list_headers(token)))
+    except Exception as e:
+        return sub_id, email, token, e
+    return sub_id, email, token, None
+
+
+def _due_campaign(db, now: datetime):
+    return db.execute(
+        select(models.NewsletterCampaign)
+        .where(models.NewsletterCampaign.status.in_(('queued', 'sending')), models.NewsletterCampaign.send_after <= now)
+        .order_by(models.NewsletterCampaign.send_after, models.NewsletterCampaign.id)
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def send_chunk(db, campaign, after_id: int, limit: int, pool, executor) -> tuple[int | None, dict]:
+    """Send the campaign to up to `limit` active subscribers with id > after_id; returns (last id or None at the end, counts)."""
+    subs = db.execute(
+        select(models.NewsletterSubscriber.id, models.NewsletterSubscriber.email, models.NewsletterSubscriber.unsubscribe_token)
+        .where(models.NewsletterSubscriber.status == 'active', models.NewsletterSubscriber.id > after_id)
+        .order_by(models.NewsletterSubscriber.id).limit(limit)
+    ).all()
+    counts = {"sent": 0, "deferred": 0, "bounced": 0}
+    if not subs:
+        return None, counts
+    results = executor.map(lambda s: _send(pool, s.id, s.email, s.unsubscribe_token, campaign.subject, campaign.body), subs)
+    bounced = []
+    for sub_id, email, token, error in results:
+        if error is None:
+            counts["sent"] += 1
+        elif mailer.is_permanent(error):
+            bounced.append(sub_id)
+        else:
+            # the outbox retries it with backoff
+            mailer.enqueue(db, email, campaign.subject, _personalize(campaign.body, token))
+            counts["deferred"] += 1
+    if bounced:
+        db.execute(update(models.NewsletterSubscriber).where(models.NewsletterSubscriber.id.in_(bounced)).values(status='bounced'))
+        counts["bounced"] = len(bounced)
+    return subs[-1].id, counts
+
+
+def run(db, chunk_size: int = NEWSLETTER_CHUNK_SIZE, time_budget: float = NEWSLETTER_TIME_BUDGET, pool=None) -> dict:
+    """Continue the oldest due campaign from its checkpoint until it is done, throttled, or out of time."""
+    global _last_report
+    if not mailer.configured():
+        return {"skipped": "SMTP not configured"}
+    if not _lock.acquire(blocking=False):
+        return {"skipped": "already running"}
+    try:
+        started = time.monotonic()
+        pool = pool or mailer.sender.pool
+        campaign = _due_campaign(db, datetime.utcnow())
+        if campaign is None:
+            _totals["campaigns_pending"] = pending_campaigns(db)
+            return {"campaign": None}
+        report = {"campaign": campaign.id, "post_id": campaign.post_id, "chunks": 0, "sent": 0, "deferred": 0,
+                  "bounced": 0, "complete": False}
+        post = db.get(models.Post, campaign.post_id)
+        if post is None or post.status != 'published':
+            campaign.status = 'cancelled'
+            campaign.finished_at = datetime.utcnow()
+            db.commit()
+            report["cancelled"] = True
+            return report
+        cp = db.get(models.JobCheckpoint, _checkpoint_name(campaign.id))
+        if cp is None:
+            cp = models.JobCheckpoint(name=_checkpoint_name(campaign.id), last_id=0)
+            db.add(cp)
+        campaign.status = 'sending'
+        db.commit()
+        with ThreadPoolExecutor(max(pool.size, 1), thread_name_prefix='newsletter') as executor:
+            while True:
+                allowed = throttle.available()
+                if allowed == 0:
+                    wait = throttle.seconds_to_reset()
+                    if time.monotonic() - started + wait > time_budget:
+                        report["throttled"] = True
+                        break
+                    time.sleep(wait)
+                    continue
+                last_id, counts = send_chunk(db, campaign, cp.last_id, min(chunk_size, allowed), pool, executor)
+                if last_id is None:
+                    campaign.status = 'sent'
+                    campaign.finished_at = datetime.utcnow()
+                    db.delete(cp)
+                    db.commit()
+                    report["complete"] = True
+                    break
+                throttle.take(counts["sent"] + counts["deferred"] + counts["bounced"])
+                cp.last_id = last_id
+                campaign.sent_count += counts["sent"]
+                campaign.deferred_count += counts["deferred"]
+                campaign.bounced_count += counts["bounced"]
+                db.commit()
+                report["chunks"] += 1
+                for key in counts:
+                    report[key] += counts[key]
+                if time.monotonic() - started >= time_budget:
+                    break
+        report["seconds"] = round(time.monotonic() - started, 3)
+        _totals["campaigns_pending"] = pending_campaigns(db)
+        _totals["runs"] += 1
+        for key in ("sent", "deferred", "bounced"):
+            _totals[key] += report[key]
+        _last_report = report
+        return report
+    finally:
+        _lock.release()
+
+
+def pending_campaigns(db) -> int:
+    return db.execute(
+        select(func.count()).select_from(models.NewsletterCampaign)
+        .where(models.NewsletterCampaign.status.in_(('queued', 'sending')))
+    ).scalar_one()
+
+
+def stats() -> dict:
+    """Totals and the last run's report; campaigns_pending is as of that run."""
+    return {"last_run": _last_report, **_totals}
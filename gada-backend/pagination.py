@@ -0,0 +1,38 @@
+"""Opaque keyset cursors for list endpoints.
+
+A cursor is a urlsafe-base64 JSON blob holding the sort mode it was issued for
+and the sort-key values of the last row on the page. Clients treat it as opaque
+and pass it back unchanged to fetch the next page.
+"""
+import base64, json
+from datetime import datetime
+from fastapi import HTTPException
+
+
+def encode_cursor(sort: str, **values) -> str:
+    payload = {"s": sort}
+    for key, value in values.items():
+        payload[key] = value.isoformat() if isinstance(value, datetime) else value
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> dict:
+    """Decode a cursor issued for `sort`; raise 400 if it is malformed or was issued for another sort."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(payload, dict) or payload.get("s") != sort or not isinstance(payload.get("id"), int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return payload
+
+
+def parse_datetime(value: str | None) -> datetime | None:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
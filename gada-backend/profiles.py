@@ -0,0 +1,114 @@
+"""Bounded in-process cache of public author profiles.
+
+Comment pages show each author's id, username and full_name. Instead of
+re-querying `users` for every page, `cache.get_many` serves those dicts from
+an LRU and loads only the ids it has not seen, with one IN query. Unknown ids
+(deleted authors) are cached as None so orphaned comments cost nothing either.
+
+Entries are dropped on commit of an ORM change that creates or deletes a user or
+changes their username/full_name, and after `PROFILE_CACHE_TTL` seconds as a bound on
+writes made by other processes (e.g. wipe_users.py).
+"""
+import os, threading, time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import models
+
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '4096'))
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '300'))
+
+# User columns exposed in a public profile
+PROFILE_FIELDS = ('id', 'username', 'full_name')
+
+
+class ProfileCache:
+    def __init__(self, max_entries: int = PROFILE_CACHE_SIZE, ttl: int = PROFILE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # user id -> (profile dict or None, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db, user_ids) -> dict:
+        """Profiles for `user_ids` (None for users that do not exist), loading misses with one query."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for uid in set(user_ids):
+                entry = self._entries.get(uid)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(uid)
+                    found[uid] = entry[0]
+                else:
+                    missing.append(uid)
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            columns = [getattr(models.User, f) for f in PROFILE_FIELDS]
+            rows = db.query(*columns).filter(models.User.id.in_(missing)).all()
+            loaded = {row.id: dict(zip(PROFILE_FIELDS, row)) for row in rows}
+            with self._lock:
+                for uid in missing:
+                    profile = loaded.get(uid)
+                    found[uid] = profile
+                    self._entries[uid] = (profile, now + self.ttl)
+                    self._entries.move_to_end(uid)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return found
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for uid in user_ids:
+                self._entries.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+cache = ProfileCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_profile_changes(session, flush_context):
+    # after_flush still sees pre-flush new/dirty/deleted and history, with new ids assigned;
+    # new users matter because SQLite can reuse a deleted user's id (cached as None)
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, models.User):
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, models.User):
+            state = inspect(obj)
+            if any(state.attrs[f].history.has_changes() for f in PROFILE_FIELDS):
+                changed.add(obj.id)
+    if changed:
+        session.info.setdefault('profiles', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_profile_changes(session):
+    changed = session.info.pop('profiles', None)
+    if changed:
+        cache.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_profile_changes(session):
+    session.info.pop('profiles', None)
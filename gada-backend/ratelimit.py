@@ -0,0 +1,342 @@
+"""In-process rate limiting for the login, verification and reset endpoints.
+
+Each scope has a rule: `{"window_sec": W, "max": N}` allows N hits per W
+seconds, with `"algorithm"` either `sliding_window` (default) or
+`token_bucket` (refills N tokens per W seconds, bursts up to `"burst"`,
+default N). A decision is a dict lookup and a little arithmetic under one
+shard's lock, instead of the SELECT + COMMIT on `rate_limits` it used to be.
+
+- Sliding window: counts for the current and previous fixed window, the
+  previous one weighted by how much of it still overlaps the last W seconds.
+  Two integers per key, no per-hit timestamps.
+- Keys are spread over `RATE_LIMIT_SHARDS` locks. Each shard keeps keys in
+  last-use order and drops expired ones from the front as it goes, so idle
+  identifiers (one per attacking ip:username) do not accumulate.
+- Only allowed hits count, as before; a rejected request does not extend
+  the wait.
+
+`RATE_LIMIT_BACKEND=sqlite` is for several worker processes: decisions are
+still made in memory, but every `RATE_LIMIT_FLUSH_MS` the hits counted
+since the last flush are upserted into `rate_limits` in one transaction, and
+the returned totals (all workers) are merged back into the local counters.
+Expired windows are deleted from the table every `RATE_LIMIT_PRUNE_SEC`.
+Workers can overshoot a limit by what they admit within one flush interval,
+and token-bucket scopes stay per process.
+"""
+import atexit, logging, math, os, threading, time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+
+import models, database
+
+logger = logging.getLogger("gada")
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_SHARDS = int(os.getenv('RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_FLUSH_MS = int(os.getenv('RATE_LIMIT_FLUSH_MS', '100'))
+RATE_LIMIT_PRUNE_SEC = int(os.getenv('RATE_LIMIT_PRUNE_SEC', '60'))
+# rows per multi-row upsert, well under SQLite's bound-variable limit
+STATEMENT_BATCH = 300
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: int  # seconds; 0 when allowed
+
+
+class SlidingWindow:
+    """State: (window index, previous window count, current window count)."""
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+
+    def _roll(self, state, now: float):
+        idx = int(now // self.window)
+        if state is None or idx - state[0] > 1:
+            return idx, 0, 0
+        if idx == state[0] + 1:
+            return idx, state[2], 0
+        return state
+
+    def hit(self, state, now: float):
+        """Returns (allowed, new state, retry_after seconds, expires_at)."""
+        idx, prev, curr = self._roll(state, now)
+        elapsed = now - idx * self.window
+        expires_at = (idx + 2) * self.window
+        if prev * (1 - elapsed / self.window) + curr + 1 <= self.limit:
+            return True, (idx, prev, curr + 1), 0.0, expires_at
+        if curr + 1 <= self.limit:
+            # wait until the previous window's weight has decayed enough
+            wait = self.window * (1 - (self.limit - curr - 1) / prev) - elapsed
+        else:
+            # wait for the next window, then for this one's weight to decay
+            wait = self.window - elapsed + self.window * (1 - (self.limit - 1) / curr)
+        return False, (idx, prev, curr), max(wait, 0.0), expires_at
+
+    def merge(self, state, idx: int, total: int):
+        """Raise a window's count to a total seen across processes."""
+        if state is None:
+            return state
+        if idx == state[0]:
+            return state[0], state[1], max(state[2], total)
+        if idx == state[0] - 1:
+            return state[0], max(state[1], total), state[2]
+        return state
+
+
+class TokenBucket:
+    """State: (tokens, updated at)."""
+    def __init__(self, limit: int, window: float, burst: int | None = None):
+        self.rate = limit / window
+        self.burst = burst or limit
+
+    def hit(self, state, now: float):
+        tokens, updated = state if state is not None else (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        expires_at = now + (self.burst - tokens) / self.rate
+        if tokens >= 1:
+            return True, (tokens - 1, now), 0.0, expires_at + 1 / self.rate
+        return False, (tokens, now), (1 - tokens) / self.rate, expires_at
+
+
+def make_rule(cfg: dict):
+    algorithm = cfg.get("algorithm", "sliding_window")
+    if algorithm == "sliding_window":
+        return SlidingWindow(cfg["max"], cfg["window_sec"])
+    if algorithm == "token_bucket":
+        return TokenBucket(cfg["max"], cfg["window_sec"], cfg.get("burst"))
+    raise ValueError(f"unknown rate limit algorithm {algorithm!r}")
+
+
+class _Shard:
+    __slots__ = ('lock', 'scopes')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scopes: dict[str, OrderedDict] = {}  # scope -> identifier -> (state, expires_at), least recently used first
+
+
+class MemoryBackend:
+    name = 'memory'
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS):
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, identifier: str) -> _Shard:
+        return self._shards[hash(identifier) % len(self._shards)]
+
+    def hit(self, scope: str, rule, identifier: str, now: float) -> tuple[bool, float]:
+        shard = self._shard(identifier)
+        with shard.lock:
+            entries = shard.scopes.setdefault(scope, OrderedDict())
+            # prune from the least recently used end while expired
+            while entries:
+                key, (_, expires_at) = next(iter(entries.items()))
+                if expires_at > now:
+                    break
+                del entries[key]
+            entry = entries.get(identifier)
+            allowed, state, retry_after, expires_at = rule.hit(entry[0] if entry else None, now)
+            entries[identifier] = (state, expires_at)
+            entries.move_to_end(identifier)
+        if allowed:
+            self._counted(scope, rule, identifier, state)
+        return allowed, retry_after
+
+    def _counted(self, scope: str, rule, identifier: str, state):
+        pass
+
+    def keys(self) -> int:
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += sum(len(entries) for entries in shard.scopes.values())
+        return total
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.scopes.clear()
+
+    def start(self, rules: dict):
+        pass
+
+    def stop(self, rules: dict):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "shards": len(self._shards), "keys": self.keys()}
+
+
+class SQLiteBackend(MemoryBackend):
+    """Memory decisions, with sliding-window counts shared through `rate_limits` in batched upserts."""
+    name = 'sqlite'
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, session_factory=None, flush_ms: int = RATE_LIMIT_FLUSH_MS,
+                 prune_sec: int = RATE_LIMIT_PRUNE_SEC):
+        super().__init__(shards)
+        self.session_factory = session_factory or database.SessionLocal
+        self.interval = flush_ms / 1000
+        self.prune_sec = prune_sec
+        self._pending: dict = {}  # (scope, identifier, window index) -> hits not yet written
+        self._windows: dict[str, float] = {}  # scope -> window seconds, for pruning
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pruned_at = time.time()
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.pruned_rows = 0
+        self.failures = 0
+
+    def _counted(self, scope: str, rule, identifier: str, state):
+        if not isinstance(rule, SlidingWindow):
+            return
+        key = (scope, identifier, state[0])
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._windows[scope] = rule.window
+
+    def flush(self, rules: dict) -> int:
+        """Write pending hits and merge the totals back; returns the number of rows upserted."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                self._maybe_prune()
+                return 0
+            db = self.session_factory()
+            totals = []
+            try:
+                items = list(batch.items())
+                for i in range(0, len(items), STATEMENT_BATCH):
+                    rows = [{
+                        "scope": scope,
+                        "identifier": identifier,
+                        "window_start": datetime.utcfromtimestamp(idx * self._windows[scope]),
+                        "count": hits,
+                    } for (scope, identifier, idx), hits in items[i:i + STATEMENT_BATCH]]
+                    stmt = insert(models.RateLimit).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['scope', 'identifier', 'window_start'],
+                        set_={"count": models.RateLimit.count + stmt.excluded.count},
+                    ).returning(models.RateLimit.scope, models.RateLimit.identifier, models.RateLimit.window_start, models.RateLimit.count)
+                    totals.extend(db.execute(stmt).all())
+                db.commit()
+            except Exception:
+                db.rollback()
+                self.failures += 1
+                with self._lock:  # retry with the next flush
+                    for key, hits in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + hits
+                raise
+            finally:
+                db.close()
+            for scope, identifier, window_start, total in totals:
+                rule = rules.get(scope)
+                if isinstance(rule, SlidingWindow):
+                    idx = round((window_start - datetime(1970, 1, 1)).total_seconds() / rule.window)
+                    shard = self._shard(identifier)
+                    with shard.lock:
+                        entries = shard.scopes.get(scope)
+                        entry = entries.get(identifier) if entries is not None else None
+                        if entry is not None:
+                            entries[identifier] = (rule.merge(entry[0], idx, total), entry[1])
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self._maybe_prune()
+            return len(batch)
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._pruned_at < self.prune_sec or not self._windows:
+            return
+        self._pruned_at = now
+        db = self.session_factory()
+        try:
+            for scope, window in list(self._windows.items()):
+                cutoff = datetime.utcfromtimestamp((int(now // window) - 1) * window)
+                self.pruned_rows += db.execute(
+                    delete(models.RateLimit).where(models.RateLimit.scope == scope, models.RateLimit.window_start < cutoff)
+                ).rowcount
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, rules: dict):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.flush(rules)
+            except Exception:
+                logger.exception("Rate limit flush failed; will retry")
+
+    def start(self, rules: dict):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(rules,), name='rate-limit-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop, rules)
+
+    def stop(self, rules: dict):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush(rules)
+        except Exception:
+            logger.exception("Final rate limit flush failed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return super().stats() | {
+            "pending": pending,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "pruned_rows": self.pruned_rows,
+            "failures": self.failures,
+        }
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    raise ValueError(f"RATE_LIMIT_BACKEND must be memory or sqlite, not {name!r}")
+
+
+class RateLimiter:
+    def __init__(self, defs: dict, backend=None, clock=time.time):
+        self.rules = {scope: make_rule(cfg) for scope, cfg in defs.items()}
+        self.backend = backend or make_backend()
+        self.clock = clock
+        self.allowed = 0
+        self.limited = 0
+
+    def hit(self, scope: str, identifier: str) -> Decision:
+        """Count a hit for identifier in scope if the rule allows it."""
+        allowed, retry_after = self.backend.hit(scope, self.rules[scope], identifier, self.clock())
+        if allowed:
+            self.allowed += 1
+            return Decision(True, 0)
+        self.limited += 1
+        return Decision(False, max(1, math.ceil(retry_after)))
+
+    def start(self):
+        self.backend.start(self.rules)
+
+    def stop(self):
+        self.backend.stop(self.rules)
+
+    def clear(self):
+        self.backend.clear()
+        self.allowed = self.limited = 0
+
+    def stats(self) -> dict:
+        return self.backend.stats() | {"allowed": self.allowed, "limited": self.limited}
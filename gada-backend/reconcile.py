@@ -0,0 +1,116 @@
+"""Incremental reconciliation of the denormalized post counters.
+
+`posts.likes_count` / `posts.comments_count` are maintained by `counters`, but
+bulk deletes, crashes and other processes can still make them drift. `run()`
+walks posts in id order, `CHUNK_SIZE` ids at a time:
+
+1. read the chunk's stored counters and one grouped COUNT per source table
+   (`post_likes`, `comments`) over the chunk's id range, with no write lock held;
+2. for the drifted ids only, rewrite the counter from a correlated COUNT in a
+   single UPDATE, so a like landing between steps 1 and 2 is still counted;
+3. save the chunk's last id in `job_checkpoints` and commit.
+
+Each commit covers one chunk, so the write lock is held for milliseconds, and a
+pass interrupted by a restart or the time budget resumes where it stopped.
+"""
+import os, threading, time
+from datetime import datetime
+from sqlalchemy import func, select, update
+
+import models, feedcache
+
+CHECKPOINT = 'reconcile_post_counters'
+CHUNK_SIZE = int(os.getenv('RECONCILE_CHUNK_SIZE', '500'))
+# Pause between chunks so request writers get the database in between
+CHUNK_PAUSE = float(os.getenv('RECONCILE_CHUNK_PAUSE', '0.05'))
+TIME_BUDGET = float(os.getenv('RECONCILE_TIME_BUDGET', '20'))
+# How many drifted posts a report lists individually
+SAMPLE_SIZE = 20
+
+# counter column -> (source model, its post id column)
+SOURCES = {
+    'likes_count': (models.PostLike, models.PostLike.post_id),
+    'comments_count': (models.Comment, models.Comment.post_id),
+}
+
+_lock = threading.Lock()
+_last_report: dict | None = None
+
+
+def _checkpoint(db) -> models.JobCheckpoint:
+    cp = db.get(models.JobCheckpoint, CHECKPOINT)
+    if cp is None:
+        cp = models.JobCheckpoint(name=CHECKPOINT, last_id=0)
+        db.add(cp)
+    return cp
+
+
+def reconcile_chunk(db, after_id: int, chunk_size: int = CHUNK_SIZE):
+    """Check and fix posts with id > after_id (up to chunk_size). Returns (last_id or None at the end, checked, drift)."""
+    rows = db.execute(
+        select(models.Post.id, models.Post.likes_count, models.Post.comments_count)
+        .where(models.Post.id > after_id).order_by(models.Post.id).limit(chunk_size)
+    ).all()
+    if not rows:
+        return None, 0, []
+    lo, hi = rows[0].id, rows[-1].id
+    actual = {}
+    for column, (model, post_id) in SOURCES.items():
+        actual[column] = dict(db.execute(
+            select(post_id, func.count()).where(post_id.between(lo, hi)).group_by(post_id)
+        ).all())
+    drift = []
+    for row in rows:
+        for column in SOURCES:
+            stored, real = getattr(row, column) or 0, actual[column].get(row.id, 0)
+            if stored != real:
+                drift.append({"post_id": row.id, "counter": column, "stored": stored, "actual": real})
+    for column, (model, post_id) in SOURCES.items():
+        ids = sorted({d["post_id"] for d in drift if d["counter"] == column})
+        if ids:
+            recount = select(func.count()).where(post_id == models.Post.id).scalar_subquery()
+            db.execute(update(models.Post).where(models.Post.id.in_(ids)).values({column: recount}),
+                       execution_options={'synchronize_session': False})
+    for post_id in {d["post_id"] for d in drift}:
+        feedcache.mark_post(db, post_id)
+    return hi, len(rows), drift
+
+
+def run(db, chunk_size: int = CHUNK_SIZE, time_budget: float = TIME_BUDGET, pause: float = CHUNK_PAUSE) -> dict:
+    """Continue the reconcile pass from its checkpoint until it completes or the time budget runs out."""
+    global _last_report
+    if not _lock.acquire(blocking=False):
+        return {"skipped": "already running"}
+    try:
+        started = time.monotonic()
+        cp = _checkpoint(db)
+        position = cp.last_id
+        report = {"started_at": datetime.utcnow().isoformat(), "from_id": position, "chunks": 0,
+                  "checked": 0, "drifted": 0, "complete": False, "samples": []}
+        while True:
+            last_id, checked, drift = reconcile_chunk(db, position, chunk_size)
+            done = checked < chunk_size
+            # reaching the end restarts the next pass from the beginning
+            cp.last_id = position = 0 if done else last_id
+            db.commit()
+            report["chunks"] += 1
+            report["checked"] += checked
+            report["drifted"] += len(drift)
+            report["samples"] = (report["samples"] + drift)[:SAMPLE_SIZE]
+            if done:
+                report["complete"] = True
+                break
+            if time.monotonic() - started >= time_budget:
+                break
+            if pause:
+                time.sleep(pause)
+        report["next_id"] = position
+        report["seconds"] = round(time.monotonic() - started, 3)
+        _last_report = report
+        return report
+    finally:
+        _lock.release()
+
+
+def last_report() -> dict | None:
+    return _last_report
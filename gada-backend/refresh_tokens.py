@@ -0,0 +1,109 @@
+"""Refresh-token rows: issue, rotate, revoke and sweep.
+
+A row stores the 32-byte sha256 digest of the cookie value (`auth.hash_refresh_token`),
+not its hex string, which halves the unique token index.
+
+- `rotate` revokes the presented token with one conditional
+  `UPDATE ... WHERE revoked = 0 AND expires_at >= now RETURNING user_id` and
+  inserts its successor, so two concurrent refreshes of the same cookie cannot
+  both succeed.
+- `sweep` deletes expired and revoked rows set-wise,
+  `DELETE ... WHERE id IN (SELECT id ... LIMIT n)` per chunk with a commit and a
+  short pause in between, until none are left or the time budget runs out.
+"""
+import os, threading, time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, or_, select, update
+
+import auth, models
+
+SWEEP_CHUNK_SIZE = int(os.getenv('REFRESH_SWEEP_CHUNK_SIZE', '1000'))
+# Pause between chunks so request writers get the database in between
+SWEEP_CHUNK_PAUSE = float(os.getenv('REFRESH_SWEEP_CHUNK_PAUSE', '0.02'))
+SWEEP_TIME_BUDGET = float(os.getenv('REFRESH_SWEEP_TIME_BUDGET', '10'))
+
+_lock = threading.Lock()
+_last_report: dict | None = None
+_totals = {"runs": 0, "deleted": 0}
+
+
+def issue(db, user_id: int) -> str:
+    """Store a new refresh token for the user; returns the raw value for the cookie."""
+    raw = auth.generate_refresh_token()
+    db.execute(insert(models.RefreshToken).values(
+        user_id=user_id,
+        token=auth.hash_refresh_token(raw),
+        expires_at=datetime.utcnow() + timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS),
+        revoked=False,
+    ))
+    return raw
+
+
+def rotate(db, raw: str) -> tuple[int, str] | None:
+    """Revoke a live token and issue its successor. Returns (user_id, new raw token), or None if it was not live."""
+    user_id = db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.token == auth.hash_refresh_token(raw),
+            models.RefreshToken.revoked == False,
+            models.RefreshToken.expires_at >= datetime.utcnow(),
+        )
+        .values(revoked=True)
+        .returning(models.RefreshToken.user_id)
+    ).scalar_one_or_none()
+    if user_id is None:
+        return None
+    return user_id, issue(db, user_id)
+
+
+def revoke(db, raw: str) -> bool:
+    return db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.token == auth.hash_refresh_token(raw), models.RefreshToken.revoked == False)
+        .values(revoked=True)
+        .returning(models.RefreshToken.id)
+    ).first() is not None
+
+
+def sweep_chunk(db, now: datetime, chunk_size: int = SWEEP_CHUNK_SIZE) -> int:
+    """Delete up to chunk_size expired or revoked rows; returns how many went."""
+    stale = (
+        select(models.RefreshToken.id)
+        .where(or_(models.RefreshToken.expires_at < now, models.RefreshToken.revoked == True))
+        .limit(chunk_size)
+    )
+    return db.execute(delete(models.RefreshToken).where(models.RefreshToken.id.in_(stale))).rowcount
+
+
+def sweep(db, chunk_size: int = SWEEP_CHUNK_SIZE, time_budget: float = SWEEP_TIME_BUDGET, pause: float = SWEEP_CHUNK_PAUSE) -> dict:
+    """Delete stale refresh tokens chunk by chunk until none are left or the time budget runs out."""
+    global _last_report
+    if not _lock.acquire(blocking=False):
+        return {"skipped": "already running"}
+    try:
+        started = time.monotonic()
+        now = datetime.utcnow()
+        report = {"started_at": now.isoformat(), "chunks": 0, "deleted": 0, "complete": False}
+        while True:
+            deleted = sweep_chunk(db, now, chunk_size)
+            db.commit()
+            report["chunks"] += 1
+            report["deleted"] += deleted
+            if deleted < chunk_size:
+                report["complete"] = True
+                break
+            if time.monotonic() - started >= time_budget:
+                break
+            if pause:
+                time.sleep(pause)
+        report["seconds"] = round(time.monotonic() - started, 3)
+        _totals["runs"] += 1
+        _totals["deleted"] += report["deleted"]
+        _last_report = report
+        return report
+    finally:
+        _lock.release()
+
+
+def stats() -> dict:
+    return {"last_sweep": _last_report, **_totals}
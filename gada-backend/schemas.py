@@ -42,12 +42,49 @@ class Post(BaseModel):
     publish_at: datetime | None = None
     likes_count: int | None = 0
     comments_count: int | None = 0
+    excerpt: str | None = None
+    snippet: str | None = None  # search results only: safe HTML (escaped text, matches in <mark>)
+    images: dict[str, dict[str, str]] = {}  # uploaded image url -> {format: srcset}; filled by the endpoint
 
     model_config = {"from_attributes": True}
 
 class PostList(BaseModel):
-    total: int
+    total: int | None  # None when requested with total=none
     items: list[Post]
+    next_cursor: str | None = None
+
+class PostSummary(BaseModel):
+    """Card/table view of a post: everything but the full details body."""
+    id: int
+    title: str
+    date: str
+    image: str
+    excerpt: str | None = None
+    created_at: datetime
+    status: str
+    publish_at: datetime | None = None
+    likes_count: int | None = 0
+    comments_count: int | None = 0
+    snippet: str | None = None  # search results only: safe HTML (escaped text, matches in <mark>)
+    images: dict[str, dict[str, str]] = {}  # uploaded image url -> {format: srcset}; filled by the endpoint
+
+    model_config = {"from_attributes": True}
+
+class PostSummaryList(BaseModel):
+    total: int | None
+    items: list[PostSummary]
+    next_cursor: str | None = None
+
+class PostBatchRequest(BaseModel):
+    ids: list[int]
+
+class PostBatch(BaseModel):
+    items: list[Post]
+    missing: list[int]
+
+class PostSummaryBatch(BaseModel):
+    items: list[PostSummary]
+    missing: list[int]
 
 class PostUpdate(BaseModel):
     title: str
@@ -62,7 +99,7 @@ class PostStatusChange(BaseModel):
     publish_at: str | None = None
 
 class UserList(BaseModel):
-    total: int
+    total: int | None
     items: list[User]
 
 class PasswordChange(BaseModel):
@@ -96,6 +133,9 @@ class EmailVerificationAuthRequest(BaseModel):
 class PasswordResetRequest(BaseModel):
     email: str
 
+class NewsletterSubscribeRequest(BaseModel):
+    email: str
+
 class PasswordResetPerform(BaseModel):
     token: str
     new_password: str
@@ -114,13 +154,21 @@ class Comment(BaseModel):
     model_config = {"from_attributes": True}
 
 class CommentList(BaseModel):
-    total: int
+    total: int | None
     items: list[Comment]
+    next_after_id: int | None = None  # pass as after_id for the next page
 
 class LikeStatus(BaseModel):
     liked: bool
     likes_count: int
 
+class PostLikeStatus(LikeStatus):
+    post_id: int
+
+class LikeStatusBatch(BaseModel):
+    items: list[PostLikeStatus]
+    missing: list[int]
+
 # ----- Investor Proposal -----
 class InvestorProposal(BaseModel):
     id: int
@@ -134,7 +182,7 @@ class InvestorProposal(BaseModel):
     model_config = {"from_attributes": True}
 
 class InvestorProposalList(BaseModel):
-    total: int
+    total: int | None
     items: list[InvestorProposal]
 
 class InvestorProposalStatusUpdate(BaseModel):
@@ -4,11 +4,14 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 # Ensure SECRET_KEY set before importing application modules
 os.environ.setdefault('SECRET_KEY', 'test_secret_key')
 os.environ.setdefault('DISABLE_SCHEDULER', '1')
+# Cheapest bcrypt cost keeps the suite fast; production default is 12
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-import models, database, main, auth
+import models, database, main, auth, feedcache, compression, profiles, mailer
+from smtp_stub import SMTPStub
 
 # Create a fresh SQLite DB per test session
 @pytest.fixture(scope='session')
@@ -49,6 +52,13 @@ def client(db_session, monkeypatch):
     # Ensure SECRET_KEY set
     # Already set globally; keep for explicitness
     monkeypatch.setenv('SECRET_KEY', 'test_secret_key')
+    # In-process caches outlive a test; start each one cold
+    feedcache.cache.clear()
+    compression.clear()
+    profiles.cache.clear()
+    auth.user_cache.clear()
+    auth.token_versions.clear()
+    main.rate_limiter.clear()
     return TestClient(main.app)
 
 @pytest.fixture()
@@ -72,3 +82,13 @@ def create_admin(db_session):
         db_session.refresh(user)
         return user
     return _create
+
+# Local SMTP server with the mailer pointed at it
+@pytest.fixture()
+def smtp(monkeypatch):
+    with SMTPStub() as stub:
+        monkeypatch.setattr(mailer, 'SMTP_HOST', stub.host)
+        monkeypatch.setattr(mailer, 'SMTP_PORT', stub.port)
+        monkeypatch.setattr(mailer, 'SMTP_USER', 'mailer')
+        monkeypatch.setattr(mailer, 'SMTP_PASS', 'secret')
+        yield stub
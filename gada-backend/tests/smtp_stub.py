@@ -0,0 +1,91 @@
+"""Minimal local SMTP server for tests, in the spirit of aiosmtpd's Controller.
+
+Accepts any AUTH PLAIN/LOGIN, records delivered messages and counts sessions.
+Recipients listed in `reject` get a 550; `defer` makes the next N other RCPTs get a 451.
+
+    with SMTPStub() as smtp:
+        ...  # point SMTP_HOST / SMTP_PORT at smtp.host / smtp.port
+        smtp.messages  # [(mail_from, [rcpt], raw bytes)]
+"""
+import socketserver, threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.sessions += 1
+        self.reply("220 stub ESMTP")
+        mail_from, rcpts = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode().rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-stub\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif verb == "AUTH":
+                if line.upper().startswith("AUTH LOGIN"):
+                    for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                        self.reply(prompt)
+                        self.rfile.readline()
+                with stub.lock:
+                    stub.logins += 1
+                self.reply("235 ok")
+            elif verb == "MAIL":
+                mail_from, rcpts = line[10:].strip("<>"), []
+                self.reply("250 ok")
+            elif verb == "RCPT":
+                rcpt = line[8:].strip("<>")
+                with stub.lock:
+                    # rejected recipients don't use up a deferral (sends run in parallel, in any order)
+                    deferred = stub.defer > 0 and rcpt not in stub.reject
+                    stub.defer -= deferred
+                if rcpt in stub.reject:
+                    self.reply("550 no such user")
+                elif deferred:
+                    self.reply("451 try again later")
+                else:
+                    rcpts.append(rcpt)
+                    self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(chunk)
+                with stub.lock:
+                    stub.messages.append((mail_from, rcpts, b"".join(data)))
+                self.reply("250 queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class SMTPStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.host, self.port = self.server.server_address
+        self.lock = threading.Lock()
+        self.messages: list = []
+        self.sessions = 0
+        self.logins = 0
+        self.reject: set[str] = set()
+        self.defer = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from fastapi import status
-import auth, models
+import auth, hashing, models
 
 def test_login_and_refresh_flow(client, create_user, db_session):
     user = create_user()
@@ -72,3 +72,120 @@ def test_password_reset_flow(client, create_user, db_session):
     # login with new works
     new = client.post('/token', data={'username':'u4','password':'NewPass1!@'}, headers={'Content-Type':'application/x-www-form-urlencoded'})
     assert new.status_code == 200
+
+
+def test_resolved_users_are_cached_until_changed(client, create_admin, create_user, db_session):
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    create_admin()
+    create_admin(username='admin2', email='admin2@example.com')
+    tokens = {
+        name: client.post('/token', data={'username': name, 'password': 'AdminPass1!'}, headers=FORM).json()['access_token']
+        for name in ('admin', 'admin2')
+    }
+    A = {'Authorization': f"Bearer {tokens['admin']}"}
+    A2 = {'Authorization': f"Bearer {tokens['admin2']}"}
+    db_session.expunge_all()  # the test client shares this session; start without loaded users
+    for _ in range(5):
+        assert client.get('/users/me', headers=A).status_code == 200
+    stats = auth.user_cache.stats()
+    assert stats['misses'] == 1 and stats['hits'] == 4
+    admin_id = client.get('/users/me', headers=A).json()['id']
+    assert client.put(f'/users/{admin_id}/role', params={'role': 'user'}, headers=A2).status_code == 200
+    db_session.expunge_all()
+    me = client.get('/users/me', headers=A2).json()
+    assert me['username'] == 'admin2'
+    assert client.delete(f'/users/{admin_id}', headers=A2).status_code == 200
+    assert auth.user_cache.stats()['entries'] == 1  # only admin2 left
+
+
+def test_guards_use_token_claims_and_versions(client, create_admin, create_user, db_session):
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    create_admin(username='claims_admin', email='claims_admin@example.com')
+    user_id = create_user(username='claims_user', email='claims_user@example.com').id
+    login = lambda name, pw: client.post('/token', data={'username': name, 'password': pw}, headers=FORM).json()['access_token']
+    A = {'Authorization': f"Bearer {login('claims_admin', 'AdminPass1!')}"}
+    U = {'Authorization': f"Bearer {login('claims_user', 'Passw0rd!')}"}
+    claims = auth.jwt.decode(U['Authorization'][7:], auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert claims['uid'] == user_id and claims['role'] == 'user' and claims['ev'] is True and claims['tv'] == 0
+    assert client.get('/metrics', headers=U).status_code == 403
+    # promotion revokes the old token: the role claim in it is stale
+    assert client.put(f'/users/{user_id}/role', params={'role': 'admin'}, headers=A).status_code == 200
+    assert client.get('/metrics', headers=U).status_code == 401
+    fresh = client.post('/token/refresh')  # refresh cookie from the last login still works
+    assert fresh.status_code == 200
+    U = {'Authorization': f"Bearer {fresh.json()['access_token']}"}
+    assert client.get('/metrics', headers=U).status_code == 200
+    # admin guards answer from claims and the version map without loading the user row
+    db_session.expunge_all()
+    reloads = auth.token_versions.stats()['reloads']
+    statements = []
+    listen = lambda *args: statements.append(args[2])
+    auth.event.listen(db_session.get_bind(), 'before_cursor_execute', listen)
+    try:
+        assert client.get('/metrics', headers=A).status_code == 200
+    finally:
+        auth.event.remove(db_session.get_bind(), 'before_cursor_execute', listen)
+    assert statements == [] and auth.token_versions.stats()['reloads'] == reloads
+    # tokens of deleted users stop working too
+    assert client.delete(f'/users/{user_id}', headers=A).status_code == 200
+    assert client.get('/posts/likes', params={'ids': '1'}, headers=U).status_code == 200  # optional auth: anonymous
+    assert client.get('/metrics', headers=U).status_code == 401
+
+
+def test_deleted_users_id_and_token_are_not_reused(client, create_admin, db_session):
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    create_admin(username='reuse_boss', email='reuse_boss@example.com')
+    doomed = create_admin(username='reuse_admin', email='reuse_admin@example.com')
+    login = lambda name, pw: client.post('/token', data={'username': name, 'password': pw}, headers=FORM).json()['access_token']
+    boss = {'Authorization': f"Bearer {login('reuse_boss', 'AdminPass1!')}"}
+    old = {'Authorization': f"Bearer {login('reuse_admin', 'AdminPass1!')}"}
+    assert client.delete(f'/users/{doomed.id}', headers=boss).status_code == 200
+    assert client.get('/metrics', headers=old).status_code == 401
+    # the highest id was just freed; the next user must not inherit it (and the admin token with it)
+    resp = client.post('/register', json={'username': 'reuse_newbie', 'email': 'reuse_newbie@example.com', 'password': 'Passw0rd!', 'role': 'user'})
+    assert resp.status_code == 200, resp.text
+    assert resp.json()['id'] != doomed.id
+    assert client.get('/metrics', headers=old).status_code == 401
+    assert client.get('/users', headers=old).status_code == 401
+
+
+def test_token_sub_must_match_user(client, create_admin):
+    admin = create_admin(username='sub_admin', email='sub_admin@example.com')
+    claims = {'uid': admin.id, 'tv': 0, 'role': 'admin', 'approved': True, 'ev': True}
+    ok = auth.create_access_token({'sub': 'sub_admin', **claims})
+    other = auth.create_access_token({'sub': 'someone_else', **claims})
+    assert client.get('/metrics', headers={'Authorization': f'Bearer {ok}'}).status_code == 200
+    assert client.get('/metrics', headers={'Authorization': f'Bearer {other}'}).status_code == 401
+
+
+def test_password_hashing_runs_in_bounded_pool(client, create_user, monkeypatch):
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    create_user(username='pool_user', email='pool_user@example.com')
+    before = hashing.pool.stats()['completed']
+    resp = client.post('/token', data={'username': 'pool_user', 'password': 'Passw0rd!'}, headers=FORM)
+    assert resp.status_code == 200, resp.text
+    stats = hashing.pool.stats()
+    assert stats['completed'] == before + 1 and stats['hash_ms_max'] > 0 and stats['pending'] == 0
+    # saturated pool: rejected up front rather than queued
+    monkeypatch.setattr(hashing.pool, 'max_pending', 0)
+    resp = client.post('/token', data={'username': 'pool_user', 'password': 'Passw0rd!'}, headers=FORM)
+    assert resp.status_code == 503 and resp.headers['retry-after'] == str(hashing.HASH_RETRY_AFTER)
+    assert hashing.pool.stats()['rejected'] >= 1
+
+
+def test_login_rehashes_outdated_hash(client, create_user, db_session):
+    FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+    user = create_user(username='old_cost', email='old_cost@example.com')
+    user.hashed_password = hashing.make_context(bcrypt_rounds=hashing.BCRYPT_ROUNDS + 1).hash('Passw0rd!')
+    db_session.commit()
+    assert hashing.pwd_context.needs_update(user.hashed_password)
+    resp = client.post('/token', data={'username': 'old_cost', 'password': 'Passw0rd!'}, headers=FORM)
+    assert resp.status_code == 200, resp.text
+    db_session.refresh(user)
+    assert not hashing.pwd_context.needs_update(user.hashed_password)
+    assert f"${hashing.BCRYPT_ROUNDS:02d}$" in user.hashed_password
+    # the new hash still logs in, and is not rewritten again
+    stored = user.hashed_password
+    assert client.post('/token', data={'username': 'old_cost', 'password': 'Passw0rd!'}, headers=FORM).status_code == 200
+    db_session.refresh(user)
+    assert user.hashed_password == stored
@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+import models, events
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+class _Request:
+    """Just enough of starlette's Request for the stream: disconnects after `polls` heartbeats."""
+    def __init__(self, polls=1):
+        self.polls = polls
+
+    async def is_disconnected(self):
+        self.polls -= 1
+        return self.polls < 0
+
+
+async def _read(body, frames):
+    out = []
+    async for chunk in body:
+        out.append(chunk)
+        if len(out) >= frames:
+            break
+    await body.aclose()
+    return out
+
+
+@pytest.fixture()
+def hub(monkeypatch):
+    hub = events.Hub(queue_size=4, replay_size=3, max_subscribers=2)
+    monkeypatch.setattr(events, 'hub', hub)
+    monkeypatch.setattr(events, 'SSE_HEARTBEAT', 0.01)
+    return hub
+
+
+def test_resume_replays_missed_events_and_resets_when_evicted(hub):
+    topic = events.post_topic(1)
+    for n in range(3):
+        hub.publish(topic, 'likes', {'post_id': 1, 'likes_count': n})
+    hub.publish(events.post_topic(2), 'likes', {'post_id': 2, 'likes_count': 9})  # other topics share the sequence
+    first_id = hub._replay[topic][0][1]
+
+    async def resume(last_id):
+        body = events.open_stream(_Request(), topic, last_id)
+        return await _read(body, 10)
+
+    frames = asyncio.run(resume(first_id))
+    assert frames[0].startswith('retry:')
+    assert [f for f in frames if f.startswith('id:')] == [events._frame(i) for i in list(hub._replay[topic])[1:]]
+    assert frames[-1] == ': ping\n\n'
+    assert hub.stats()['subscribers'] == 0  # unsubscribed when the stream ended
+
+    # the client saw first_id; losing it from the buffer is fine, losing the next one is not
+    hub.publish(topic, 'likes', {'post_id': 1, 'likes_count': 3})
+    assert 'event: reset' not in ''.join(asyncio.run(resume(first_id)))
+    hub.publish(topic, 'likes', {'post_id': 1, 'likes_count': 4})
+    assert 'event: reset' in asyncio.run(resume(first_id))[1]
+    assert 'event: reset' in asyncio.run(resume('stale-epoch-1'))[1]
+
+
+def test_slow_subscriber_is_dropped_and_cap_enforced(hub, client):
+    topic = events.post_topic(5)
+
+    async def scenario():
+        body = events.open_stream(_Request(), topic)
+        other = events.open_stream(_Request(), topic)
+        with pytest.raises(events.HubFull):
+            events.open_stream(_Request(), topic)
+        for n in range(10):  # more than the queue holds before the reader catches up
+            hub.publish(topic, 'likes', {'post_id': 5, 'likes_count': n})
+        await asyncio.sleep(0)
+        frames = await _read(body, 20)
+        await other.aclose()
+        return frames
+
+    frames = asyncio.run(scenario())
+    assert frames[-1].startswith('event: lagged')
+    assert hub.stats()['dropped_slow_subscribers'] == 1
+    # a full hub answers 503 before streaming
+    hub.max_subscribers = 0
+    resp = client.get('/posts/5/events')
+    assert resp.status_code == 503 and resp.headers['retry-after'] == '30'
+
+
+def test_write_paths_publish_to_post_stream(hub, client, db_session, create_user):
+    post = models.Post(title='Live post', date='2025-01-01', details='x', image='a.jpg', status='published')
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    create_user(username='sse_user', email='sse_user@example.com')
+    tok = client.post('/token', data={'username': 'sse_user', 'password': 'Passw0rd!'}, headers=FORM).json()['access_token']
+    U = {'Authorization': f'Bearer {tok}'}
+
+    async def scenario():
+        body = events.open_stream(_Request(polls=50), events.post_topic(post_id))
+        await asyncio.to_thread(client.post, f'/posts/{post_id}/likes/toggle', headers=U)
+        comment = (await asyncio.to_thread(client.post, f'/posts/{post_id}/comments', json={'content': 'live!'}, headers=U)).json()
+        await asyncio.to_thread(client.delete, f"/posts/{post_id}/comments/{comment['id']}", headers=U)
+        return await _read(body, 4)
+
+    frames = [f for f in asyncio.run(scenario()) if f.startswith('id:')]
+    kinds = [f.split('\n')[1] for f in frames]
+    assert kinds == ['event: likes', 'event: comment', 'event: comment_deleted']
+    assert '"likes_count":1' in frames[0]
+    assert '"content":"live!"' in frames[1] and '"comments_count":1' in frames[1]
+    assert '"comments_count":0' in frames[2]
+
+
+def test_unpublished_posts_publish_no_events(hub, client, db_session, create_admin):
+    post = models.Post(title='Draft post', date='2025-01-01', details='x', image='a.jpg', status='draft')
+    db_session.add(post)
+    db_session.commit()
+    create_admin(username='sse_admin', email='sse_admin@example.com')
+    tok = client.post('/token', data={'username': 'sse_admin', 'password': 'AdminPass1!'}, headers=FORM).json()['access_token']
+    A = {'Authorization': f'Bearer {tok}'}
+    assert client.post(f'/posts/{post.id}/likes/toggle', headers=A).status_code == 200
+    comment = client.post(f'/posts/{post.id}/comments', json={'content': 'internal note'}, headers=A).json()
+    assert client.delete(f"/posts/{post.id}/comments/{comment['id']}", headers=A).status_code == 200
+    # the unauthenticated stream of a draft has nothing to tell
+    assert hub.stats()['published'] == 0
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import models, fastjson, feedcache
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def _bodies(client, db_session, monkeypatch, url, **kwargs):
+    out = []
+    for fast in (False, True):
+        monkeypatch.setattr(fastjson, 'FAST_JSON', fast)
+        feedcache.cache.clear()
+        db_session.expunge_all()  # requests share the test session; start from fresh entities
+        resp = client.get(url, **kwargs)
+        assert resp.status_code == 200
+        out.append(resp.content)
+    return out
+
+
+def test_fast_path_matches_validated_wire_format(client, db_session, monkeypatch, create_admin, create_user):
+    create_admin(username='fj_admin', email='fj_admin@example.com')
+    user = create_user(username='fj_user', email='fj_user@example.com')
+    tok = client.post('/token', data={'username': 'fj_admin', 'password': 'AdminPass1!'}, headers=FORM).json()['access_token']
+    A = {'Authorization': f'Bearer {tok}'}
+    stamp = datetime(2025, 3, 1, 12, 30, 15, 123456)
+    posts = [models.Post(title=f'Fastjson ünïcode {i}', date='2025-01-01', details='body "quoted" ✓', image='a.jpg',
+                         status='published', publish_at=stamp - timedelta(days=i) if i % 2 else None) for i in range(5)]
+    db_session.add_all(posts)
+    db_session.add(models.InvestorProposal(name='Fj Co', email='fj@example.com', sector='agro', phone='1', proposal_filename='p.pdf'))
+    db_session.commit()
+    db_session.add(models.Comment(post_id=posts[0].id, user_id=user.id, content='first 👋', created_at=stamp))
+    db_session.add(models.Comment(post_id=posts[0].id, user_id=999999, content='orphan'))
+    db_session.commit()
+    post_id = posts[0].id
+
+    for params in ({'search': 'fastjson'}, {'search': 'fastjson', 'fields': 'summary', 'limit': 2}, {'sort': 'publish_at_asc'}):
+        slow, fast = _bodies(client, db_session, monkeypatch, '/posts', params=params)
+        assert slow == fast
+    slow, fast = _bodies(client, db_session, monkeypatch, '/posts', params={'status': 'all'}, headers=A)
+    assert slow == fast
+    for url in ('/users', '/investor-proposals'):
+        slow, fast = _bodies(client, db_session, monkeypatch, url, headers=A)
+        assert slow == fast
+    slow, fast = _bodies(client, db_session, monkeypatch, f'/posts/{post_id}/comments')
+    assert slow == fast
+    assert b'"user":null' in fast
@@ -0,0 +1,80 @@
+import io
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+import images, main, models, uploads
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture()
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(uploads, 'UPLOAD_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture()
+def image_pool(test_engine, monkeypatch):
+    pool = images.ImagePool(workers=0, session_factory=sessionmaker(bind=test_engine))
+    monkeypatch.setattr(images, 'pool', pool)
+    yield pool
+    pool.shutdown()
+
+
+def _jpeg_with_exif(width, height) -> bytes:
+    img = Image.new('RGB', (width, height), (200, 40, 40))
+    exif = Image.Exif()
+    exif[0x010F] = 'CameraMaker'  # Make
+    exif[0x0112] = 6  # Orientation: rotate 90 CW on display
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def test_upload_renders_variants_in_background(client, create_admin, upload_dir, image_pool):
+    create_admin(username='img_admin', email='img_admin@example.com')
+    token = client.post('/token', data={'username': 'img_admin', 'password': 'AdminPass1!'}).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    resp = client.post('/upload-image', files={'file': ('photo.jpg', _jpeg_with_exif(1000, 700), 'image/jpeg')}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    name, url = body['filename'], body['url']
+    assert body['srcset'] == {}  # nothing rendered yet: clients use the original
+
+    assert image_pool.drain(timeout=30)
+    variants = {(r.width, r.format): r for r in image_pool.session_factory().execute(
+        select(models.ImageVariant).where(models.ImageVariant.filename == name)).scalars()}
+    assert set(variants) == {(w, f) for w in images.IMAGE_WIDTHS for f in images.FORMATS}
+    # EXIF rotation is applied: 1000x700 landscape becomes portrait, and 1280 is not upscaled
+    assert (variants[(320, 'webp')].pixel_width, variants[(320, 'webp')].pixel_height) == (320, 457)
+    assert variants[(1280, 'jpeg')].pixel_width == 700
+
+    r = client.get(f'/images/320/{name}.webp')
+    assert r.status_code == 200 and r.headers['content-type'] == 'image/webp' and 'immutable' in r.headers['cache-control']
+    variant = Image.open(io.BytesIO(r.content))
+    assert variant.width == 320 and not variant.getexif()
+    assert not Image.open(io.BytesIO(client.get(f'/images/640/{name}.jpg').content)).getexif()
+
+    # post payloads list the recorded variants by real width: the 1280 slot is the 700 px original size
+    post = client.post('/posts', json={'title': 'Pictured', 'date': '2025-01-01', 'details': 'x', 'image': f'{url}, https://example.com/a.jpg',
+                                       'status': 'published'}, headers=headers).json()
+    assert list(post['images']) == [url]
+    assert post['images'][url]['webp'] == f'/images/320/{name}.webp 320w, /images/640/{name}.webp 640w, /images/1280/{name}.webp 700w'
+    assert post['images'][url]['jpeg'].endswith(f'/images/1280/{name}.jpg 700w')
+    assert client.get('/posts', params={'fields': 'summary'}).json()['items'][0]['images'] == post['images']
+    assert client.get(f"/posts/{post['id']}").json()['images'] == post['images']
+
+    client.delete(f"/posts/{post['id']}", headers=headers)
+    assert not list((upload_dir / 'variants').iterdir())
+    assert client.get(f'/images/320/{name}.webp').status_code == 404
+
+
+def test_missing_variant_falls_back_to_original(client, upload_dir):
+    (upload_dir / 'abc123.png').write_bytes(b'png bytes')
+    r = client.get('/images/640/abc123.png.webp')
+    assert r.status_code == 200 and r.content == b'png bytes' and r.headers['cache-control'] == 'public, max-age=60'
+    assert client.get('/images/641/abc123.png.webp').status_code == 404
+    assert client.get('/images/640/..%2Fsecret.png.webp').status_code == 404
+    assert client.get('/images/640/abc123.png.gif').status_code == 404
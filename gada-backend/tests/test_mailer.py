@@ -0,0 +1,57 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.orm import sessionmaker
+import mailer, models
+
+
+@pytest.fixture()
+def sender(test_engine):
+    sender = mailer.MailSender(sessionmaker(bind=test_engine), mailer.SMTPPool(2), batch_size=5, backoff=60)
+    yield sender
+    sender.stop()
+
+
+def test_verification_email_is_queued_and_sent_over_pooled_session(client, create_user, db_session, smtp, sender):
+    user = create_user(username='mailq', email='mailq@example.com')
+    user.email_verified = False
+    db_session.commit()
+    resp = client.post('/email/send-verification-login', json={'username': 'mailq', 'password': 'Passw0rd!'})
+    assert resp.status_code == 200, resp.text
+    # SMTP is configured: the code is mailed, not returned, and nothing was sent inside the request
+    assert 'dev_code' not in resp.json()
+    assert smtp.messages == []
+    row = db_session.execute(select(models.OutboundEmail).where(models.OutboundEmail.to_email == 'mailq@example.com')).scalar_one()
+    assert row.status == 'pending'
+
+    assert sender.run_once() == {"claimed": 1, "sent": 1, "retried": 0, "failed": 0}
+    mailer.enqueue(db_session, 'mailq@example.com', 'Second', 'hello again')
+    db_session.commit()
+    assert sender.run_once()["sent"] == 1
+    assert [rcpts for _, rcpts, _ in smtp.messages] == [['mailq@example.com'], ['mailq@example.com']]
+    assert b'Your verification code is' in smtp.messages[0][2]
+    # one login, reused for the second batch
+    assert smtp.sessions == 1 and smtp.logins == 1
+    stats = sender.stats()
+    assert stats["sent"] == 2 and stats["smtp_pool"]["reused"] == 1 and stats["pending"] == 0
+
+
+def test_failed_sends_back_off_or_fail_permanently(db_session, smtp, sender):
+    smtp.defer = 1
+    smtp.reject.add('nobody@example.com')
+    mailer.enqueue(db_session, 'later@example.com', 'Deferred', 'body')
+    mailer.enqueue(db_session, 'nobody@example.com', 'Rejected', 'body')
+    db_session.commit()
+    assert sender.run_once() == {"claimed": 2, "sent": 0, "retried": 1, "failed": 1}
+    rows = {r.to_email: r for r in db_session.execute(
+        select(models.OutboundEmail).where(models.OutboundEmail.subject.in_(['Deferred', 'Rejected']))).scalars()}
+    deferred, rejected = rows['later@example.com'], rows['nobody@example.com']
+    assert deferred.status == 'pending' and deferred.attempts == 1 and '451' in deferred.last_error
+    assert (deferred.next_attempt_at - datetime.utcnow()).total_seconds() > 40
+    assert rejected.status == 'failed' and rejected.attempts == 1
+    # not due yet
+    assert sender.run_once()["claimed"] == 0
+    db_session.execute(update(models.OutboundEmail).where(models.OutboundEmail.id == deferred.id).values(next_attempt_at=datetime.utcnow()))
+    db_session.commit()
+    assert sender.run_once()["sent"] == 1
+    assert [rcpts for _, rcpts, _ in smtp.messages] == [['later@example.com']]
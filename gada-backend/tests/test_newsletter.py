@@ -0,0 +1,106 @@
+import re
+from sqlalchemy import select, update
+import mailer, models, newsletter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 600.0
+
+    def __call__(self):
+        return self.now
+
+
+def _subscriber(db_session, email):
+    return db_session.execute(select(models.NewsletterSubscriber).where(models.NewsletterSubscriber.email == email)).scalar_one()
+
+
+def test_subscription_needs_confirmation_and_links_change_state_only_on_post(client, db_session, smtp):
+    assert client.post('/newsletter/subscribe', json={'email': 'nope'}).status_code == 400
+    assert client.post('/newsletter/subscribe', json={'email': 'Reader@Example.com'}).status_code == 200
+    assert client.post('/newsletter/subscribe', json={'email': 'reader@example.com '}).status_code == 200
+    row = _subscriber(db_session, 'reader@example.com')
+    assert row.status == 'pending' and row.confirm_token
+    mail = db_session.execute(select(models.OutboundEmail).where(models.OutboundEmail.to_email == 'reader@example.com')
+                              .order_by(models.OutboundEmail.id.desc())).scalars().first()
+    assert newsletter.confirm_url(row.confirm_token) in mail.body
+    # following the link (as a scanner would) only shows a button
+    page = client.get('/newsletter/confirm', params={'token': row.confirm_token})
+    assert page.status_code == 200 and 'method="post"' in page.text
+    db_session.refresh(row)
+    assert row.status == 'pending'
+    assert client.post('/newsletter/confirm', params={'token': 'bogus'}).status_code == 404
+    assert client.post('/newsletter/confirm', params={'token': row.confirm_token}).status_code == 200
+    db_session.refresh(row)
+    assert row.status == 'active' and row.confirm_token is None
+
+    assert client.get('/newsletter/unsubscribe', params={'token': row.unsubscribe_token}).status_code == 200
+    db_session.refresh(row)
+    assert row.status == 'active'
+    assert client.post('/newsletter/unsubscribe', params={'token': 'bogus'}).status_code == 404
+    # RFC 8058 one-click: POST to the List-Unsubscribe URL
+    assert client.post('/newsletter/unsubscribe', params={'token': row.unsubscribe_token},
+                       data={'List-Unsubscribe': 'One-Click'}).status_code == 200
+    db_session.refresh(row)
+    assert row.status == 'unsubscribed'
+    # subscribing again needs a fresh confirmation
+    assert client.post('/newsletter/subscribe', json={'email': 'reader@example.com'}).status_code == 200
+    db_session.refresh(row)
+    assert row.status == 'pending'
+
+
+def test_publish_fans_out_in_throttled_checkpointed_chunks(client, db_session, smtp, monkeypatch):
+    # campaigns left by other tests' publishes are not this test's business
+    db_session.execute(update(models.NewsletterCampaign).where(models.NewsletterCampaign.status.in_(('queued', 'sending'))).values(status='cancelled'))
+    for i in range(5):
+        newsletter.subscribe(db_session, f'fan{i}@example.com')
+    newsletter.subscribe(db_session, 'unconfirmed@example.com')
+    db_session.commit()
+    for i in range(5):
+        assert newsletter.confirm(db_session, _subscriber(db_session, f'fan{i}@example.com').confirm_token)
+    db_session.commit()
+    smtp.reject.add('fan3@example.com')
+    active = db_session.execute(select(models.NewsletterSubscriber.email).where(models.NewsletterSubscriber.status == 'active')).scalars().all()
+
+    post = models.Post(title='Fan-out', date='2025-01-01', details='News for investors.', image='a.jpg')
+    db_session.add(post)
+    db_session.commit()
+    assert db_session.execute(select(models.NewsletterCampaign).where(models.NewsletterCampaign.post_id == post.id)).first() is None
+    post.status = 'published'
+    db_session.commit()
+    # re-publishing does not queue a second mailing
+    post.status = 'draft'
+    db_session.commit()
+    post.status = 'published'
+    db_session.commit()
+    campaign = db_session.execute(select(models.NewsletterCampaign).where(models.NewsletterCampaign.post_id == post.id)).scalar_one()
+    assert campaign.status == 'queued' and 'Fan-out' in campaign.subject
+    assert smtp.messages == []  # nothing is sent by the publish itself
+
+    clock = Clock()
+    monkeypatch.setattr(newsletter, 'throttle', newsletter.Throttle(per_minute=3, clock=clock))
+    pool = mailer.SMTPPool(2)
+    first = newsletter.run(db_session, chunk_size=2, time_budget=0, pool=pool)
+    assert first["campaign"] == campaign.id and first["sent"] == 2 and not first["complete"]
+    cp = db_session.get(models.JobCheckpoint, f'newsletter_campaign_{campaign.id}')
+    assert cp is not None and cp.last_id > 0
+    # one send left this minute, then the next run stops before sending
+    assert newsletter.run(db_session, chunk_size=2, time_budget=0, pool=pool)["sent"] + first["sent"] == 3
+    assert newsletter.run(db_session, chunk_size=2, time_budget=0, pool=pool)["throttled"]
+    while not (report := newsletter.run(db_session, chunk_size=2, time_budget=0, pool=pool))["complete"]:
+        clock.now += 60
+    pool.close()
+
+    recipients = [r for _, rcpts, _ in smtp.messages for r in rcpts]
+    assert sorted(recipients) == sorted(e for e in active if e != 'fan3@example.com')
+    assert 'unconfirmed@example.com' not in recipients
+    db_session.refresh(campaign)
+    assert campaign.status == 'sent' and campaign.sent_count == len(recipients) and campaign.bounced_count == 1
+    assert db_session.get(models.JobCheckpoint, f'newsletter_campaign_{campaign.id}') is None
+    bounced = db_session.execute(select(models.NewsletterSubscriber.status).where(models.NewsletterSubscriber.email == 'fan3@example.com')).scalar_one()
+    assert bounced == 'bounced'
+    # one shared session per pool slot, not one per recipient
+    assert smtp.logins <= 2
+    body = smtp.messages[0][2].decode()
+    assert 'News for investors.' in body and re.search(r'unsubscribe\?token=\S+', body)
+    assert 'List-Unsubscribe-Post: List-Unsubscribe=One-Click' in body and re.search(r'List-Unsubscribe: <\S+unsubscribe\?token=', body)
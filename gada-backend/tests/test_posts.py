@@ -0,0 +1,410 @@
+from datetime import datetime, timedelta
+import pytest
+import models, feedcache, counts, compression, profiles, reconcile
+
+
+def _make_posts(db_session, marker, count=11):
+    base = datetime.utcnow() - timedelta(days=30)
+    for i in range(count):
+        # mix of NULL and tied publish_at values to exercise the tie-break on id
+        publish_at = None if i % 4 == 0 else base + timedelta(days=i // 3)
+        db_session.add(models.Post(title=f"{marker} {i}", date='2025-01-01', details='body', image='img.jpg', status='published', publish_at=publish_at))
+    db_session.commit()
+
+
+@pytest.mark.parametrize('sort', [None, 'created_asc', 'publish_at_asc', 'publish_at_desc'])
+def test_cursor_pages_match_offset_order(client, db_session, sort):
+    marker = f"kset{sort}"
+    _make_posts(db_session, marker)
+    params = {'search': marker, 'limit': 100}
+    if sort:
+        params['sort'] = sort
+    expected = [p['id'] for p in client.get('/posts', params=params).json()['items']]
+    assert len(expected) == 11
+
+    seen, cursor = [], None
+    while True:
+        page_params = {**params, 'limit': 3}
+        if cursor:
+            page_params['cursor'] = cursor
+        body = client.get('/posts', params=page_params).json()
+        assert body['total'] == 11
+        seen.extend(p['id'] for p in body['items'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert seen == expected
+
+
+def test_cursor_rejects_other_sort(client, db_session):
+    _make_posts(db_session, 'ksetmismatch', count=3)
+    first = client.get('/posts', params={'search': 'ksetmismatch', 'limit': 1}).json()
+    resp = client.get('/posts', params={'search': 'ksetmismatch', 'cursor': first['next_cursor'], 'sort': 'created_asc'})
+    assert resp.status_code == 400
+    assert client.get('/posts', params={'cursor': 'not-a-cursor'}).status_code == 400
+
+
+def test_fulltext_search_ranks_and_highlights(client, db_session):
+    db_session.add(models.Post(title='Textile park expansion', date='2025-01-01', details='New sheds for garment exporters', image='a.jpg', status='published'))
+    db_session.add(models.Post(title='Logistics update', date='2025-01-01', details='The textile corridor road is finished', image='b.jpg', status='published'))
+    db_session.add(models.Post(title='Textile draft', date='2025-01-01', details='not public', image='c.jpg', status='draft'))
+    db_session.commit()
+    body = client.get('/posts', params={'search': 'textil', 'sort': 'relevance'}).json()
+    titles = [p['title'] for p in body['items']]
+    # prefix match, title hits outrank body hits, drafts stay hidden
+    assert titles == ['Textile park expansion', 'Logistics update']
+    assert body['total'] == 2
+    assert '<mark>Textile</mark>' in body['items'][0]['snippet']
+    # snippets are safe HTML: post text is escaped, only the match markers are tags
+    db_session.add(models.Post(title='Harbour note', date='2025-01-01', details='Bring <img src=x onerror=alert(1)> zebrafish & co',
+                               image='d.jpg', status='published'))
+    db_session.commit()
+    for fields in ('full', 'summary'):
+        snippet = client.get('/posts', params={'search': 'zebrafish', 'fields': fields}).json()['items'][0]['snippet']
+        assert '<img' not in snippet and '&lt;img src=x onerror=alert(1)&gt;' in snippet
+        assert '<mark>zebrafish</mark> &amp; co' in snippet
+    page1 = client.get('/posts', params={'search': 'textil', 'sort': 'relevance', 'limit': 1}).json()
+    page2 = client.get('/posts', params={'search': 'textil', 'sort': 'relevance', 'limit': 1, 'cursor': page1['next_cursor']}).json()
+    assert [p['title'] for p in page1['items'] + page2['items']] == titles
+    assert page2['next_cursor'] is None
+
+
+def test_fulltext_index_follows_updates_and_deletes(client, db_session):
+    post = models.Post(title='Coffee export', date='2025-01-01', details='beans', image='a.jpg', status='published')
+    db_session.add(post)
+    db_session.commit()
+    assert client.get('/posts', params={'search': 'coffee'}).json()['total'] == 1
+    post.title = 'Sesame export'
+    db_session.commit()
+    assert client.get('/posts', params={'search': 'coffee'}).json()['total'] == 0
+    assert client.get('/posts', params={'search': 'sesame'}).json()['total'] == 1
+    db_session.delete(post)
+    db_session.commit()
+    assert client.get('/posts', params={'search': 'sesame'}).json()['total'] == 0
+
+
+def test_public_feed_cache_hits_and_invalidation(client, db_session):
+    post = models.Post(title='Cached feed item', date='2025-01-01', details='x', image='a.jpg', status='published')
+    draft = models.Post(title='Cached feed draft', date='2025-01-01', details='x', image='a.jpg', status='draft')
+    db_session.add_all([post, draft])
+    db_session.commit()
+    first = client.get('/posts', params={'limit': 5})
+    second = client.get('/posts', params={'limit': 5})
+    assert first.content == second.content
+    assert feedcache.cache.stats()['hits'] == 1
+    # editing a draft cannot change public pages
+    draft.details = 'still hidden'
+    db_session.commit()
+    assert feedcache.cache.stats()['entries'] == 1
+    # counter change drops only pages containing that post
+    post.likes_count = 7
+    db_session.commit()
+    assert feedcache.cache.stats()['entries'] == 0
+    assert client.get('/posts', params={'limit': 5}).json()['items'][0]['likes_count'] == 7
+    # publishing the draft invalidates everything
+    draft.status = 'published'
+    db_session.commit()
+    assert client.get('/posts', params={'limit': 5}).json()['items'][0]['title'] == 'Cached feed draft'
+
+
+def test_maintained_counts_follow_status_changes(client, db_session, create_admin):
+    before = {s: counts.get(db_session, 'posts', [s]) for s in ('draft', 'published')}
+    post = models.Post(title='Counted', date='2025-01-01', details='x', image='a.jpg')
+    db_session.add(post)
+    db_session.commit()
+    assert counts.get(db_session, 'posts', ['draft']) == before['draft'] + 1
+    post.status = 'published'
+    db_session.commit()
+    assert counts.get(db_session, 'posts', ['draft']) == before['draft']
+    assert counts.get(db_session, 'posts', ['published']) == before['published'] + 1
+    exact = db_session.query(models.Post).filter(models.Post.status == 'published').count()
+    assert client.get('/posts', params={'limit': 1}).json()['total'] == exact
+    assert client.get('/posts', params={'limit': 1, 'total': 'none'}).json()['total'] is None
+    assert client.get('/posts', params={'total': 'bogus'}).status_code == 400
+    db_session.delete(post)
+    db_session.commit()
+    assert counts.get(db_session, 'posts', ['published']) == before['published']
+    create_admin(username='counts_admin', email='counts_admin@example.com')
+    assert counts.get(db_session, 'users') == db_session.query(models.User).count()
+
+
+def test_summary_fields_skip_details(client, db_session):
+    long_body = 'Gada zone ' + 'word ' * 200
+    db_session.add(models.Post(title='Summary view', date='2025-01-01', details=long_body, image='a.jpg', status='published'))
+    db_session.commit()
+    item = client.get('/posts', params={'fields': 'summary', 'search': 'summary view'}).json()['items'][0]
+    assert 'details' not in item
+    assert item['title'] == 'Summary view'
+    assert item['excerpt'] == models.make_excerpt(long_body)
+    assert len(item['excerpt']) <= models.EXCERPT_LENGTH + 1 and item['excerpt'].endswith('…')
+    assert '<mark>' in item['snippet']
+    full = client.get('/posts', params={'search': 'summary view'}).json()['items'][0]
+    assert full['details'] == long_body
+    assert client.get('/posts', params={'fields': 'bogus'}).status_code == 400
+
+
+def test_batch_get_keeps_order_and_hides_drafts(client, db_session):
+    a = models.Post(title='Batch A', date='2025-01-01', details='a', image='a.jpg', status='published')
+    b = models.Post(title='Batch B', date='2025-01-01', details='b', image='b.jpg', status='published')
+    hidden = models.Post(title='Batch draft', date='2025-01-01', details='c', image='c.jpg', status='draft')
+    db_session.add_all([a, b, hidden])
+    db_session.commit()
+    ids = f"{b.id},{a.id},{hidden.id},999999,{b.id}"
+    body = client.get('/posts/batch', params={'ids': ids}).json()
+    assert [p['title'] for p in body['items']] == ['Batch B', 'Batch A']
+    assert body['missing'] == [hidden.id, 999999]
+    posted = client.post('/posts/batch', params={'fields': 'summary'}, json={'ids': [a.id, b.id]}).json()
+    assert [p['id'] for p in posted['items']] == [a.id, b.id]
+    assert 'details' not in posted['items'][0]
+    too_many = client.post('/posts/batch', json={'ids': list(range(1, 102))})
+    assert too_many.status_code == 400
+    assert client.get('/posts/batch', params={'ids': '1,x'}).status_code == 400
+
+
+def test_compressed_pages_reuse_cached_variants(client, db_session):
+    _make_posts(db_session, 'squeeze', count=20)
+    params = {'search': 'squeeze', 'limit': 20}
+    plain = client.get('/posts', params=params, headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    etag = plain.headers['etag']
+
+    for encoding in compression.supported_encodings():
+        first = client.get('/posts', params=params, headers={'Accept-Encoding': encoding})
+        assert first.headers['content-encoding'] == encoding
+        assert 'Accept-Encoding' in first.headers['vary']
+        assert first.headers['etag'] == compression.variant_etag(etag, encoding)
+        assert first.json() == plain.json()
+        assert int(first.headers['content-length']) < len(plain.content)
+        again = client.get('/posts', params=params, headers={'Accept-Encoding': encoding})
+        assert again.json() == plain.json()
+
+    stats = compression.stats()
+    assert stats['routes']['/posts']['cached'] == len(compression.supported_encodings())
+    # a compressed variant's validator still revalidates the page
+    revalidated = client.get('/posts', params=params, headers={'Accept-Encoding': 'gzip', 'If-None-Match': compression.variant_etag(etag, 'gzip')})
+    assert revalidated.status_code == 304
+    # small bodies stay uncompressed
+    small = client.get('/posts', params={'search': 'squeeze', 'limit': 1, 'fields': 'summary', 'total': 'none'}, headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in small.headers
+
+
+def test_negotiate_honours_q_values():
+    assert compression.negotiate('gzip;q=0.5, br;q=0') == 'gzip'
+    assert compression.negotiate('identity') is None
+    assert compression.negotiate('*') == compression.supported_encodings()[0]
+    assert compression.negotiate('gzip, br') == compression.supported_encodings()[0]
+
+
+def test_like_and_comment_counters_are_exact(client, db_session, create_user):
+    post = models.Post(title='Counter post', date='2025-01-01', details='x', image='a.jpg', status='published')
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    create_user(username='cnt_a', email='cnt_a@example.com')
+    create_user(username='cnt_b', email='cnt_b@example.com')
+    tokens = {}
+    for name in ('cnt_a', 'cnt_b'):
+        resp = client.post('/token', data={'username': name, 'password': 'Passw0rd!'}, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        tokens[name] = {'Authorization': f"Bearer {resp.json()['access_token']}"}
+
+    assert client.post(f'/posts/{post_id}/likes/toggle', headers=tokens['cnt_a']).json() == {'liked': True, 'likes_count': 1}
+    assert client.post(f'/posts/{post_id}/likes/toggle', headers=tokens['cnt_b']).json() == {'liked': True, 'likes_count': 2}
+    assert client.post(f'/posts/{post_id}/likes/toggle', headers=tokens['cnt_a']).json() == {'liked': False, 'likes_count': 1}
+    assert client.post('/posts/999999/likes/toggle', headers=tokens['cnt_a']).status_code == 404
+    assert db_session.query(models.PostLike).filter_by(post_id=999999).count() == 0
+
+    comment = client.post(f'/posts/{post_id}/comments', json={'content': 'hi'}, headers=tokens['cnt_a']).json()
+    assert client.get(f'/posts/{post_id}/comments').json()['total'] == 1
+    assert client.delete(f"/posts/{post_id}/comments/{comment['id']}", headers=tokens['cnt_b']).status_code == 403
+    assert client.delete(f"/posts/{post_id}/comments/{comment['id']}", headers=tokens['cnt_a']).status_code == 200
+    assert client.delete(f"/posts/{post_id}/comments/{comment['id']}", headers=tokens['cnt_a']).status_code == 404
+    assert client.get(f'/posts/{post_id}/comments').json()['total'] == 0
+
+
+def test_parallel_like_toggles_keep_count_exact(test_engine):
+    import threading
+    import counters
+    from sqlalchemy.orm import sessionmaker
+    Session = sessionmaker(bind=test_engine)
+    with Session() as s:
+        post = models.Post(title='Race post', date='2025-01-01', details='x', image='a.jpg', status='published')
+        s.add(post)
+        s.commit()
+        post_id = post.id
+
+    users = range(1000, 1008)
+    errors = []
+
+    def clicker(user_id, clicks):
+        try:
+            with Session() as s:
+                for _ in range(clicks):
+                    assert counters.toggle_like(s, post_id, user_id) is not None
+                    s.commit()
+        except Exception as exc:  # surfaced by the assertion below
+            errors.append(exc)
+
+    # two threads per user so the same (post, user) pair races too
+    threads = [threading.Thread(target=clicker, args=(uid, 5 + n)) for uid in users for n in (0, 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    with Session() as s:
+        rows = s.query(models.PostLike).filter_by(post_id=post_id).count()
+        assert s.get(models.Post, post_id).likes_count == rows
+
+
+def test_batched_like_statuses(client, db_session, create_user):
+    a = models.Post(title='Likes A', date='2025-01-01', details='a', image='a.jpg', status='published', likes_count=3)
+    b = models.Post(title='Likes B', date='2025-01-01', details='b', image='b.jpg', status='published')
+    hidden = models.Post(title='Likes draft', date='2025-01-01', details='c', image='c.jpg', status='draft')
+    db_session.add_all([a, b, hidden])
+    db_session.commit()
+    user = create_user(username='likes_user', email='likes_user@example.com')
+    db_session.add(models.PostLike(post_id=b.id, user_id=user.id))
+    db_session.commit()
+    tok = client.post('/token', data={'username': 'likes_user', 'password': 'Passw0rd!'}, headers={'Content-Type': 'application/x-www-form-urlencoded'}).json()['access_token']
+
+    ids = f"{a.id},{b.id},{hidden.id}"
+    anon = client.get('/posts/likes', params={'ids': ids}).json()
+    assert anon['items'] == [
+        {'liked': False, 'likes_count': 3, 'post_id': a.id},
+        {'liked': False, 'likes_count': 0, 'post_id': b.id},
+    ]
+    assert anon['missing'] == [hidden.id]
+    mine = client.get('/posts/likes', params={'ids': ids}, headers={'Authorization': f'Bearer {tok}'}).json()
+    assert [i['liked'] for i in mine['items']] == [False, True]
+    # the single-post endpoint reads the maintained column too
+    assert client.get(f'/posts/{a.id}/likes').json() == {'liked': False, 'likes_count': 3}
+    assert client.get('/posts/999999/likes').status_code == 404
+
+
+def test_comment_keyset_pages_use_profile_cache(client, db_session, create_user):
+    post = models.Post(title='Chatty post', date='2025-01-01', details='x', image='a.jpg', status='published')
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    authors = [create_user(username=f'author{i}', email=f'author{i}@example.com') for i in range(3)]
+    db_session.add_all(models.Comment(post_id=post_id, user_id=authors[i % 3].id, content=f'c{i}') for i in range(7))
+    db_session.commit()
+    author_id = authors[0].id
+
+    seen, after_id, pages = [], None, 0
+    while True:
+        params = {'limit': 3} | ({'after_id': after_id} if after_id else {})
+        body = client.get(f'/posts/{post_id}/comments', params=params).json()
+        seen += [c['content'] for c in body['items']]
+        pages += 1
+        after_id = body['next_after_id']
+        if after_id is None:
+            break
+    assert seen == [f'c{i}' for i in range(7)]
+    assert pages == 3
+    stats = profiles.cache.stats()
+    assert stats['misses'] == 3 and stats['hits'] >= 3  # authors loaded once, then served from cache
+
+    user = db_session.get(models.User, author_id)
+    user.full_name = 'Renamed Author'
+    db_session.commit()
+    first = client.get(f'/posts/{post_id}/comments', params={'limit': 1}).json()['items'][0]
+    assert first['user']['full_name'] == 'Renamed Author'
+    db_session.delete(db_session.get(models.User, author_id))
+    db_session.commit()
+    assert client.get(f'/posts/{post_id}/comments', params={'limit': 1}).json()['items'][0]['user'] is None
+
+
+def test_reconcile_fixes_drift_in_resumable_chunks(client, db_session, create_admin, create_user, monkeypatch):
+    posts = [models.Post(title=f'Drift {i}', date='2025-01-01', details='x', image='a.jpg', status='published') for i in range(5)]
+    db_session.add_all(posts)
+    db_session.commit()
+    ids = [p.id for p in posts]
+    db_session.add_all(models.PostLike(post_id=ids[1], user_id=uid) for uid in (501, 502))
+    db_session.add(models.Comment(post_id=ids[3], user_id=501, content='x'))
+    db_session.commit()
+    db_session.query(models.Post).filter(models.Post.id == ids[0]).update({'likes_count': 9})  # stale leftovers
+
+    cp = db_session.get(models.JobCheckpoint, reconcile.CHECKPOINT) or models.JobCheckpoint(name=reconcile.CHECKPOINT)
+    cp.last_id = ids[0] - 1
+    db_session.add(cp)
+    db_session.commit()
+
+    # a zero time budget processes one chunk per run and leaves a checkpoint behind
+    first = reconcile.run(db_session, chunk_size=2, time_budget=0, pause=0)
+    assert first['chunks'] == 1 and not first['complete'] and first['next_id'] == ids[1]
+    second = reconcile.run(db_session, chunk_size=2, time_budget=0, pause=0)
+    assert second['from_id'] == ids[1]
+    reconcile.run(db_session, chunk_size=2, time_budget=60, pause=0)
+    db_session.expire_all()
+    assert [db_session.get(models.Post, i).likes_count for i in ids] == [0, 2, 0, 0, 0]
+    assert [db_session.get(models.Post, i).comments_count for i in ids] == [0, 0, 0, 1, 0]
+    assert db_session.get(models.JobCheckpoint, reconcile.CHECKPOINT).last_id == 0  # pass complete
+
+    # deleting a user takes their likes and the counts with them
+    create_admin(username='drift_admin', email='drift_admin@example.com')
+    liker = create_user(username='drift_liker', email='drift_liker@example.com')
+    db_session.add(models.PostLike(post_id=ids[2], user_id=liker.id))
+    db_session.query(models.Post).filter(models.Post.id == ids[2]).update({'likes_count': 1})
+    db_session.commit()
+    tok = client.post('/token', data={'username': 'drift_admin', 'password': 'AdminPass1!'}, headers={'Content-Type': 'application/x-www-form-urlencoded'}).json()['access_token']
+    assert client.delete(f'/users/{liker.id}', headers={'Authorization': f'Bearer {tok}'}).status_code == 200
+    db_session.expire_all()
+    assert db_session.get(models.Post, ids[2]).likes_count == 0
+
+    # the admin endpoint does one chunk per request instead of the scheduler's time budget
+    monkeypatch.setattr(reconcile, 'CHUNK_SIZE', 2)
+    report = client.post('/tasks/reconcile-counters', headers={'Authorization': f'Bearer {tok}'}).json()
+    assert report['chunks'] == 1 and not report['complete'] and report['next_id'] > 0
+    assert db_session.query(models.PostLike).filter_by(post_id=ids[2]).count() == 0
+
+
+def test_like_buffer_merges_and_flushes_in_batches(client, db_session, test_engine, monkeypatch, create_user):
+    import threading
+    import like_buffer
+    from sqlalchemy.orm import sessionmaker
+    Session = sessionmaker(bind=test_engine)
+    buf = like_buffer.LikeBuffer(session_factory=Session, interval_ms=5, max_events=50)
+    monkeypatch.setattr(like_buffer, 'LIKE_BUFFER', True)
+    monkeypatch.setattr(like_buffer, 'buffer', buf)
+    post = models.Post(title='Buffered post', date='2025-01-01', details='x', image='a.jpg', status='published')
+    db_session.add(post)
+    db_session.commit()
+    post_id = post.id
+    create_user(username='buf_user', email='buf_user@example.com')
+    tok = client.post('/token', data={'username': 'buf_user', 'password': 'Passw0rd!'}, headers={'Content-Type': 'application/x-www-form-urlencoded'}).json()['access_token']
+    U = {'Authorization': f'Bearer {tok}'}
+
+    assert client.post(f'/posts/{post_id}/likes/toggle', headers=U).json() == {'liked': True, 'likes_count': 1}
+    assert db_session.query(models.PostLike).filter_by(post_id=post_id).count() == 0  # not written yet
+    assert client.get(f'/posts/{post_id}/likes', headers=U).json() == {'liked': True, 'likes_count': 1}
+    assert client.get('/posts/likes', params={'ids': str(post_id)}, headers=U).json()['items'][0]['liked'] is True
+    assert buf.flush() == 1
+    db_session.expire_all()
+    assert db_session.get(models.Post, post_id).likes_count == 1
+    # like + unlike before a flush cancels out without touching the db
+    client.post(f'/posts/{post_id}/likes/toggle', headers=U)
+    assert client.post(f'/posts/{post_id}/likes/toggle', headers=U).json() == {'liked': True, 'likes_count': 1}
+    assert buf.stats()['pending'] == 0
+
+    # parallel clickers with the background flusher running; stop() persists the rest
+    buf.start()
+    users = range(2000, 2010)
+
+    def clicker(user_id):
+        with Session() as s:
+            for _ in range(7 if user_id % 2 else 6):
+                buf.toggle(s, post_id, user_id)
+                s.commit()
+
+    threads = [threading.Thread(target=clicker, args=(uid,)) for uid in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    buf.stop()
+    db_session.expire_all()
+    liked_by = {row.user_id for row in db_session.query(models.PostLike).filter_by(post_id=post_id)}
+    assert liked_by == {uid for uid in users if uid % 2} | {db_session.query(models.User.id).filter_by(username='buf_user').scalar()}
+    assert db_session.get(models.Post, post_id).likes_count == len(liked_by)
+    assert buf.stats()['flushes'] >= 2
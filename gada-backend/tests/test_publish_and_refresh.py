@@ -28,3 +28,33 @@ def test_scheduled_publish_and_refresh(client, create_admin, db_session):
     assert posts_public.status_code == 200
     items = posts_public.json()['items']
     assert any(p['title']=='scheduled' for p in items)
+
+
+def test_refresh_rotation_is_single_use_and_sweeper_drains_in_chunks(client, create_user, db_session):
+    import refresh_tokens
+    user = create_user(username='sweep_user', email='sweep_user@example.com')
+    raw = refresh_tokens.issue(db_session, user.id)
+    db_session.commit()
+    stored = db_session.query(models.RefreshToken).filter_by(user_id=user.id).one().token
+    assert isinstance(stored, bytes) and len(stored) == 32 and auth.verify_refresh_token(raw, stored)
+    # the cookie value is only good once
+    user_id, successor = refresh_tokens.rotate(db_session, raw)
+    assert user_id == user.id and successor != raw
+    assert refresh_tokens.rotate(db_session, raw) is None
+    db_session.commit()
+    client.cookies.set('refresh_token', raw, path='/token')
+    assert client.post('/token/refresh').status_code == 401
+    # backlog of revoked and expired rows, plus live ones that must survive
+    past = datetime.utcnow() - timedelta(days=1)
+    future = datetime.utcnow() + timedelta(days=1)
+    db_session.add_all(models.RefreshToken(user_id=user.id, token=bytes([i % 256, i // 256]) * 16, expires_at=past if i % 2 else future, revoked=not i % 2)
+                       for i in range(1, 251))
+    db_session.commit()
+    stale = db_session.query(models.RefreshToken).filter((models.RefreshToken.expires_at < datetime.utcnow()) | (models.RefreshToken.revoked == True)).count()
+    assert stale >= 251  # 250 + the rotated one (earlier tests may leave more)
+    report = refresh_tokens.sweep(db_session, chunk_size=40, pause=0)
+    assert report['complete'] and report['deleted'] == stale and report['chunks'] == stale // 40 + 1
+    assert db_session.query(models.RefreshToken).filter_by(user_id=user.id).count() == 1  # the successor
+    partial = refresh_tokens.sweep(db_session, chunk_size=40, time_budget=0, pause=0)
+    assert partial['deleted'] == 0 and partial['complete']
+    assert refresh_tokens.stats()['last_sweep'] == partial
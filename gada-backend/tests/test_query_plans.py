@@ -0,0 +1,152 @@
+"""EXPLAIN QUERY PLAN regression suite.
+
+Drives every list/lookup endpoint (plus the scheduler jobs and auth guards)
+against the test DB, captures each distinct SELECT/UPDATE/DELETE statement
+SQLAlchemy emits, and fails if SQLite would answer any of them with a full
+table SCAN. A SCAN is tolerated only when it walks the table in primary-key
+order with a LIMIT (the admin "newest first" pages), or when listed in
+KNOWN_FULL_SCANS with a reason.
+"""
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+import main, models, database
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+# (table, regex over the statement) -> why a full scan is acceptable
+KNOWN_FULL_SCANS = {
+    ('users', r"lower\(users\.username\) LIKE"): "admin substring search (leading wildcard) over users",
+    ('investor_proposals', r"lower\(investor_proposals\.(name|sector)\) LIKE"): "admin substring search/sector filter (leading wildcard)",
+    ('posts', r"ORDER BY posts\.publish_at (ASC|DESC) NULLS LAST"): "admin publish_at sort across all statuses; NULLS LAST needs a sort",
+    ('posts', r"WHERE posts\.status IS NULL$"): "legacy backfill task; status is NOT NULL so nothing matches",
+    ('users', r"^SELECT users\.id, users\.token_version, users\.username\s+FROM users$"): "token version map: one bulk reload every TOKEN_VERSION_REFRESH seconds",
+}
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+def _is_bounded_pk_walk(statement: str, table: str) -> bool:
+    return bool(re.search(rf"ORDER BY {table}\.id (ASC|DESC)\s+LIMIT", statement))
+
+
+def _known(table: str, statement: str) -> bool:
+    return any(t == table and re.search(pattern, statement, re.I) for (t, pattern) in KNOWN_FULL_SCANS)
+
+
+def _full_scans(conn, statement, params):
+    plan = [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()]
+    bad = []
+    for detail in plan:
+        m = _SCAN_RE.match(detail)
+        if not m or 'USING' in m.group(2) or 'VIRTUAL TABLE' in m.group(2):
+            continue
+        table = m.group(1)
+        if table not in {t.name for t in models.Base.metadata.sorted_tables}:
+            continue  # subquery/CTE materialisations
+        if not any('TEMP B-TREE' in d for d in plan) and _is_bounded_pk_walk(statement, table):
+            continue
+        if _known(table, statement):
+            continue
+        bad.append((detail, plan))
+    return bad
+
+
+def _exercise(client, db_session, monkeypatch, create_admin, create_user):
+    create_admin(username='qp_admin', email='qp_admin@example.com')
+    user = create_user(username='qp_user', email='qp_user@example.com')
+    tok = client.post('/token', data={'username': 'qp_admin', 'password': 'AdminPass1!'}, headers=FORM).json()['access_token']
+    utok = client.post('/token', data={'username': 'qp_user', 'password': 'Passw0rd!'}, headers=FORM).json()['access_token']
+    A = {'Authorization': f'Bearer {tok}'}
+    U = {'Authorization': f'Bearer {utok}'}
+
+    post = client.post('/posts', json={'title': 'plan post', 'date': 'd', 'details': 'x', 'image': 'i', 'status': 'published'}, headers=A).json()
+    future = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    client.post('/posts', json={'title': 'plan later', 'date': 'd', 'details': 'x', 'image': 'i', 'status': 'scheduled', 'publish_at': future}, headers=A)
+    pid = post['id']
+
+    # post lists: public and admin, every sort, filters, cursor and search
+    for headers in ({}, A):
+        for sort in (None, 'created_asc', 'publish_at_asc', 'publish_at_desc', 'relevance'):
+            params = {'limit': 1} | ({'sort': sort} if sort else {})
+            body = client.get('/posts', params=params, headers=headers).json()
+            if body.get('next_cursor'):
+                client.get('/posts', params=params | {'cursor': body['next_cursor']}, headers=headers)
+            client.get('/posts', params=params | {'search': 'plan'}, headers=headers)
+        client.get('/posts', params={'status': 'published', 'total': 'exact'}, headers=headers)
+    client.get('/posts', params={'status': 'draft', 'sort': 'publish_at_desc'}, headers=A)
+    client.get(f'/posts/{pid}')
+    client.get('/posts/batch', params={'ids': f'{pid},999999'})
+    client.post('/posts/batch', params={'fields': 'summary'}, json={'ids': [pid]}, headers=A)
+
+    # comments and likes
+    comment = client.post(f'/posts/{pid}/comments', json={'content': 'hi'}, headers=U).json()
+    client.get(f'/posts/{pid}/comments')
+    client.get(f'/posts/{pid}/comments', params={'after_id': comment['id'], 'limit': 10})
+    client.get(f'/posts/{pid}/likes', headers=U)
+    client.get('/posts/likes', params={'ids': f'{pid},999999'}, headers=U)
+    client.post(f'/posts/{pid}/likes/toggle', headers=U)
+    client.post(f'/posts/{pid}/likes/toggle', headers=U)
+    client.delete(f"/posts/{pid}/comments/{comment['id']}", headers=U)
+
+    # post writes
+    client.put(f'/posts/{pid}', json={'title': 'plan post 2', 'date': 'd', 'details': 'y', 'image': 'i'}, headers=A)
+    client.patch(f'/posts/{pid}/status', json={'status': 'published'}, headers=A)
+    client.post('/tasks/publish-scheduled', headers=A)
+    client.post('/tasks/backfill-post-status', headers=A)
+    client.post('/tasks/reconcile-counters', headers=A)
+
+    # users
+    client.get('/users/me', headers=U)
+    client.get('/users', headers=A)
+    client.get('/users', params={'search': 'qp'}, headers=A)
+    client.patch(f'/users/{user.id}/approve', json={'approved': True}, headers=A)
+    client.put(f'/users/{user.id}/role', params={'role': 'user'}, headers=A)
+
+    # proposals
+    client.get('/investor-proposals', headers=A)
+    client.get('/investor-proposals', params={'status': 'submitted'}, headers=A)
+    client.get('/investor-proposals', params={'search': 'x', 'sector': 'agro'}, headers=A)
+    client.patch('/investor-proposals/999999/status', json={'status': 'accepted'}, headers=A)
+
+    # auth lookups: verification codes, password reset, refresh rotation, logout
+    client.post('/email/verify', json={'token': '000000', 'username': 'qp_user'})
+    client.post('/password/reset-request', json={'email': 'qp_user@example.com'})
+    client.post('/password/reset-perform', json={'token': 'nope', 'new_password': 'Xx1!xxxxxx'})
+    client.post('/token/refresh')
+    client.post('/token/logout')
+
+    # scheduler jobs run against the same session
+    def _test_db():
+        yield db_session
+    monkeypatch.setattr(database, 'get_db', _test_db)
+    monkeypatch.setattr(db_session, 'close', lambda: None)
+    main._auto_publish_job()
+    main._cleanup_refresh_tokens_job()
+    main._reconcile_counters_job()
+
+    client.delete(f'/posts/{pid}', headers=A)
+
+
+def test_no_full_table_scans(client, db_session, test_engine, monkeypatch, create_admin, create_user):
+    captured = {}
+
+    def capture(conn, cursor, statement, params, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            return
+        captured.setdefault(statement, params)
+
+    event.listen(test_engine, 'before_cursor_execute', capture)
+    try:
+        _exercise(client, db_session, monkeypatch, create_admin, create_user)
+    finally:
+        event.remove(test_engine, 'before_cursor_execute', capture)
+
+    assert len(captured) > 20
+    failures = []
+    with test_engine.connect() as conn:
+        for statement, params in captured.items():
+            for detail, plan in _full_scans(conn, statement, params):
+                failures.append(f"{detail}\n    plan: {plan}\n    sql: {' '.join(statement.split())}")
+    assert not failures, "full table scans:\n" + "\n".join(failures)
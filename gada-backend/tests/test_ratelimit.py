@@ -0,0 +1,81 @@
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+import main, models, ratelimit
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_sliding_window_weights_previous_window():
+    clock = Clock(600.0)  # start of a window
+    limiter = ratelimit.RateLimiter({"s": {"window_sec": 60, "max": 3}}, backend=ratelimit.MemoryBackend(4), clock=clock)
+    assert all(limiter.hit("s", "a").allowed for _ in range(3))
+    decision = limiter.hit("s", "a")
+    # next window at 60s, then 20s more until 3 previous hits weigh 2
+    assert not decision.allowed and decision.retry_after == 80
+    # other identifiers are counted separately
+    assert limiter.hit("s", "b").allowed
+    # halfway into the next window the previous 3 hits weigh 1.5
+    clock.now = 690.0
+    assert limiter.hit("s", "a").allowed
+    assert not limiter.hit("s", "a").allowed
+    # two windows later everything has expired
+    clock.now = 800.0
+    assert all(limiter.hit("s", "a").allowed for _ in range(3))
+    assert limiter.stats()["limited"] == 2
+
+
+def test_token_bucket_refills_and_expired_keys_are_pruned():
+    clock = Clock()
+    backend = ratelimit.MemoryBackend(1)
+    limiter = ratelimit.RateLimiter({"t": {"window_sec": 10, "max": 5, "algorithm": "token_bucket", "burst": 2}},
+                                    backend=backend, clock=clock)
+    assert limiter.hit("t", "x").allowed and limiter.hit("t", "x").allowed
+    decision = limiter.hit("t", "x")
+    assert not decision.allowed and decision.retry_after == 2
+    clock.now += 2  # one token back
+    assert limiter.hit("t", "x").allowed
+    assert not limiter.hit("t", "x").allowed
+    for i in range(50):
+        limiter.hit("t", f"ip{i}")
+    assert backend.keys() == 51
+    # once idle keys are full again they are dropped as new hits arrive
+    clock.now += 60
+    limiter.hit("t", "late")
+    assert backend.keys() == 1
+
+
+def test_login_rate_limit_answers_429_with_retry_after(client, create_user):
+    create_user(username='ratelimited', email='ratelimited@example.com')
+    for _ in range(main.RATE_LIMIT_DEFS[main.LOGIN_SCOPE]["max"]):
+        r = client.post('/token', data={'username': 'ratelimited', 'password': 'wrong'})
+        assert r.status_code == 401
+    r = client.post('/token', data={'username': 'ratelimited', 'password': 'Passw0rd!'})
+    assert r.status_code == 429
+    assert 1 <= int(r.headers['Retry-After']) <= 120
+    assert main.rate_limiter.stats()["limited"] == 1
+
+
+def test_sqlite_backend_shares_counts_between_workers(test_engine):
+    factory = sessionmaker(bind=test_engine)
+    defs = {"shared": {"window_sec": 60, "max": 4}}
+    clock = Clock(time.time())
+    first = ratelimit.RateLimiter(defs, backend=ratelimit.SQLiteBackend(2, factory), clock=clock)
+    second = ratelimit.RateLimiter(defs, backend=ratelimit.SQLiteBackend(2, factory), clock=clock)
+    assert first.hit("shared", "k").allowed and first.hit("shared", "k").allowed
+    assert second.hit("shared", "k").allowed
+    assert first.backend.flush(first.rules) == 1
+    assert second.backend.flush(second.rules) == 1
+    with factory() as db:
+        rows = db.execute(select(models.RateLimit.count).where(models.RateLimit.scope == "shared")).scalars().all()
+    assert rows == [3]
+    # the second worker learned about the first one's hits from its upsert
+    assert second.hit("shared", "k").allowed
+    assert not second.hit("shared", "k").allowed
+    assert second.stats()["flushes"] == 1
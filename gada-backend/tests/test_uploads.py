@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+import itertools
+import pytest
+from sqlalchemy import func, select, update
+import main, models, uploads
+
+
+@pytest.fixture()
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(uploads, 'UPLOAD_DIR', str(tmp_path))
+    # no variant rendering here; test_images covers it
+    monkeypatch.setattr(main.images.pool, 'submit', lambda *a, **k: None)
+    return tmp_path
+
+
+_admins = itertools.count()
+
+
+@pytest.fixture()
+def headers(client, create_admin):
+    username = f'blob_admin{next(_admins)}'
+    create_admin(username=username, email=f'{username}@example.com')
+    token = client.post('/token', data={'username': username, 'password': 'AdminPass1!'}).json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _refs(db, filename):
+    return db.execute(select(func.count()).select_from(models.PostUpload).where(models.PostUpload.filename == filename)).scalar_one()
+
+
+def _post(client, headers, image):
+    resp = client.post('/posts', json={'title': 'Shared', 'date': '2025-01-01', 'details': 'x', 'image': image}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()['id']
+
+
+def test_duplicate_upload_is_stored_once_and_deleted_with_last_reference(client, headers, db_session, upload_dir):
+    data = b'\x89PNG same bytes'
+    first = client.post('/upload-image', files={'file': ('a.png', data, 'image/png')}, headers=headers).json()
+    second = client.post('/upload-image', files={'file': ('b.png', data, 'image/png')}, headers=headers).json()
+    name = first['filename']
+    assert second['filename'] == name and not first['deduplicated'] and second['deduplicated']
+    assert [p.name for p in upload_dir.iterdir()] == [name]
+
+    (upload_dir / 'variants').mkdir()
+    (upload_dir / 'variants' / f'{name}-320.webp').write_bytes(b'v')
+    a = _post(client, headers, first['url'])
+    b = _post(client, headers, f"{first['url']}, https://example.com/x.jpg")
+    assert _refs(db_session, name) == 2
+
+    assert client.delete(f'/posts/{a}', headers=headers).status_code == 200
+    assert (upload_dir / name).exists() and _refs(db_session, name) == 1
+    # editing the other post off the image drops the last reference
+    assert client.put(f'/posts/{b}', json={'title': 'Shared', 'date': '2025-01-01', 'details': 'x', 'image': 'https://example.com/x.jpg'}, headers=headers).status_code == 200
+    assert not (upload_dir / name).exists()
+    assert not (upload_dir / 'variants' / f'{name}-320.webp').exists()
+    assert db_session.get(models.UploadBlob, name) is None
+
+    # uploading it again starts over
+    again = client.post('/upload-image', files={'file': ('c.png', data, 'image/png')}, headers=headers).json()
+    assert again['filename'] == name and not again['deduplicated'] and (upload_dir / name).exists()
+
+
+def test_older_uploads_are_tracked_and_orphans_swept(client, headers, db_session, upload_dir):
+    (upload_dir / 'legacy0123.jpg').write_bytes(b'old')
+    post_id = _post(client, headers, '/uploads/legacy0123.jpg')
+    assert _refs(db_session, 'legacy0123.jpg') == 1
+    assert client.delete(f'/posts/{post_id}', headers=headers).status_code == 200
+    assert not (upload_dir / 'legacy0123.jpg').exists()
+
+    orphan = client.post('/upload-image', files={'file': ('o.png', b'never used', 'image/png')}, headers=headers).json()['filename']
+    assert uploads.sweep_orphans(db_session) == 0  # still within the grace period
+    db_session.execute(update(models.UploadBlob).where(models.UploadBlob.filename == orphan)
+                       .values(last_uploaded_at=datetime.utcnow() - timedelta(hours=uploads.UPLOAD_ORPHAN_HOURS + 1)))
+    db_session.commit()
+    assert uploads.sweep_orphans(db_session) == 1
+    assert not (upload_dir / orphan).exists()
@@ -0,0 +1,203 @@
+"""Content-addressed upload storage with reference counting.
+
+`store` streams an upload to a temp file while hashing it and names it
+`<sha256><ext>`. Re-uploading the same photo, for another post or by another
+admin, therefore maps to the file already on disk: the temp copy is dropped
+and nothing new is stored.
+
+`upload_blobs` has one row per stored file and `post_uploads` links posts to
+the files their `image` field lists. The links are kept in step by a flush
+hook, whichever endpoint changes or deletes a post, so the reference count of
+a file is the number of its link rows. When a flush removes a file's last
+reference, its blob and variant rows go in the same transaction and the file
+(with its variants) is deleted after the commit. A file is never deleted while
+another post still lists it.
+
+An upload that is never attached to a post is removed by `sweep_orphans`
+after `UPLOAD_ORPHAN_HOURS`.
+
+Uploads register their blob row before placing the file, and deletion
+re-checks that row just before unlinking; both steps share one lock, so a
+re-upload racing the last reference's removal keeps its file.
+"""
+import hashlib, os, re, tempfile, threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, exists, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models, images
+
+UPLOAD_DIR = images.UPLOAD_DIR
+UPLOAD_ORPHAN_HOURS = int(os.getenv('UPLOAD_ORPHAN_HOURS', '24'))
+# Extensions that name the same format
+EXT_ALIASES = {'.jpeg': '.jpg'}
+CHUNK = 1024 * 1024
+
+_fs_lock = threading.Lock()
+_totals = {"stored": 0, "deduplicated": 0, "bytes_saved": 0, "deleted": 0}
+
+
+class TooLarge(Exception):
+    pass
+
+
+def referenced(image: str | None) -> set[str]:
+    """Upload filenames a post's `image` field lists."""
+    names = set()
+    for part in re.split(r"[;,\s]+", image or ""):
+        if part.startswith('/uploads/'):
+            name = part[len('/uploads/'):]
+            if name and '/' not in name and not name.startswith('.'):
+                names.add(name)
+    return names
+
+
+def store(fileobj, ext: str, max_bytes: int, upload_dir: str | None = None) -> tuple[str, str, int]:
+    """Copy an upload to a temp file under upload_dir, hashing as it streams.
+
+    Returns (filename, temp path, size); `place` moves it into position.
+    Raises TooLarge past max_bytes.
+    """
+    upload_dir = upload_dir or UPLOAD_DIR
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(prefix='.upload-', dir=upload_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := fileobj.read(CHUNK):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise TooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return f"{digest.hexdigest()}{EXT_ALIASES.get(ext, ext)}", tmp, size
+
+
+def register(db, filename: str, size: int):
+    """Record (or refresh) the blob row for an upload; caller commits before `place`."""
+    now = datetime.utcnow()
+    stmt = insert(models.UploadBlob).values(filename=filename, sha256=filename.split('.', 1)[0], size=size,
+                                            created_at=now, last_uploaded_at=now)
+    db.execute(stmt.on_conflict_do_update(index_elements=['filename'], set_={"last_uploaded_at": now}))
+
+
+def place(tmp: str, filename: str, size: int, upload_dir: str | None = None) -> bool:
+    """Move the temp file into place; True if it was new, False if the same content was already stored."""
+    path = os.path.join(upload_dir or UPLOAD_DIR, filename)
+    with _fs_lock:
+        if os.path.isfile(path):
+            os.remove(tmp)
+            _totals["deduplicated"] += 1
+            _totals["bytes_saved"] += size
+            return False
+        os.replace(tmp, path)
+        _totals["stored"] += 1
+        return True
+
+
+def _release(conn, filenames: set[str]) -> list[str]:
+    """Drop blob and variant rows of the files no link row references any more; returns their names."""
+    if not filenames:
+        return []
+    still = set(conn.execute(select(models.PostUpload.filename).where(models.PostUpload.filename.in_(filenames))).scalars())
+    unreferenced = sorted(filenames - still)
+    if unreferenced:
+        conn.execute(delete(models.UploadBlob).where(models.UploadBlob.filename.in_(unreferenced)))
+        conn.execute(delete(models.ImageVariant).where(models.ImageVariant.filename.in_(unreferenced)))
+    return unreferenced
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_references(session, flush_context):
+    changed = {}
+    for obj in session.deleted:
+        if isinstance(obj, models.Post):
+            changed[obj.id] = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Post) and obj not in session.deleted:
+            if obj in session.new or inspect(obj).attrs.image.history.has_changes():
+                changed[obj.id] = referenced(obj.image)
+    if not changed:
+        return
+    conn = session.connection()
+    current = {}
+    for post_id, filename in conn.execute(
+        select(models.PostUpload.post_id, models.PostUpload.filename).where(models.PostUpload.post_id.in_(list(changed)))
+    ):
+        current.setdefault(post_id, set()).add(filename)
+    released = set()
+    added = []
+    for post_id, wanted in changed.items():
+        have = current.get(post_id, set())
+        added += [{"post_id": post_id, "filename": name} for name in wanted - have]
+        gone = have - wanted
+        if gone:
+            conn.execute(delete(models.PostUpload).where(models.PostUpload.post_id == post_id, models.PostUpload.filename.in_(gone)))
+            released |= gone
+    if added:
+        conn.execute(insert(models.PostUpload).values(added).on_conflict_do_nothing())
+        # files listed before they were tracked (older uploads) become managed too
+        now = datetime.utcnow()
+        conn.execute(insert(models.UploadBlob).values(
+            [{"filename": name, "created_at": now, "last_uploaded_at": now} for name in {a["filename"] for a in added}]
+        ).on_conflict_do_nothing())
+    unreferenced = _release(conn, released)
+    if unreferenced:
+        session.info.setdefault('upload_unlink', set()).update(unreferenced)
+
+
+@event.listens_for(Session, 'after_commit')
+def _unlink_released(session):
+    filenames = session.info.pop('upload_unlink', None)
+    if filenames:
+        unlink(session.get_bind(), filenames)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_released(session):
+    session.info.pop('upload_unlink', None)
+
+
+def unlink(bind, filenames, upload_dir: str | None = None) -> int:
+    """Delete the files (and variants) of blobs whose rows are gone; a re-upload that re-registered one keeps it."""
+    upload_dir = upload_dir or UPLOAD_DIR
+    removed = 0
+    with _fs_lock:
+        with bind.connect() as conn:
+            alive = set(conn.execute(select(models.UploadBlob.filename).where(models.UploadBlob.filename.in_(list(filenames)))).scalars())
+        for name in filenames:
+            if name in alive:
+                continue
+            path = os.path.join(upload_dir, name)
+            if os.path.isfile(path):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+            images.remove_variant_files(name, upload_dir)
+    _totals["deleted"] += removed
+    return removed
+
+
+def sweep_orphans(db, older_than_hours: int = UPLOAD_ORPHAN_HOURS, upload_dir: str | None = None) -> int:
+    """Delete uploads no post has referenced since they were last uploaded `older_than_hours` ago."""
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    orphans = db.execute(
+        delete(models.UploadBlob)
+        .where(models.UploadBlob.last_uploaded_at < cutoff,
+               ~exists().where(models.PostUpload.filename == models.UploadBlob.filename))
+        .returning(models.UploadBlob.filename)
+    ).scalars().all()
+    if orphans:
+        db.execute(delete(models.ImageVariant).where(models.ImageVariant.filename.in_(orphans)))
+    db.commit()
+    return unlink(db.get_bind(), orphans, upload_dir) if orphans else 0
+
+
+def stats() -> dict:
+    return dict(_totals)
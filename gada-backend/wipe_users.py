@@ -1,6 +1,6 @@
 import argparse
 from database import SessionLocal, engine
-import models
+import models, counts
 
 
 def wipe_users(confirm: bool):
@@ -15,6 +15,9 @@ def wipe_users(confirm: bool):
         db.query(models.RefreshToken).delete()
         # finally delete users
         db.query(models.User).delete()
+        # bulk deletes bypass the maintained counts and the per-post like/comment counters
+        counts.rebuild(db)
+        db.query(models.Post).update({models.Post.likes_count: 0, models.Post.comments_count: 0}, synchronize_session=False)
         db.commit()
         print("All users and related rows deleted.")
     finally:
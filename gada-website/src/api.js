@@ -56,16 +56,20 @@ export async function logout() {
   await fetch(`${API_BASE}/token/logout`, { method: 'POST', credentials: 'include' });
 }
 
-export async function getPosts({ skip = 0, limit = 50, search, status, sort } = {}) {
+export async function getPosts({ skip = 0, limit = 50, search, status, sort, cursor, fields } = {}) {
   const params = new URLSearchParams();
-  if (skip) params.append('skip', skip);
+  // cursor (from a previous page's next_cursor) takes precedence over skip on the server
+  if (cursor) params.append('cursor', cursor);
+  else if (skip) params.append('skip', skip);
   if (limit) params.append('limit', limit);
   if (search) params.append('search', search);
   if (status) params.append('status', status);
   if (sort) params.append('sort', sort);
+  // fields: 'summary' returns excerpt instead of the full details body
+  if (fields) params.append('fields', fields);
   const res = await fetch(`${API_BASE}/posts` + (params.toString() ? `?${params}` : ''));
   if (!res.ok) throw new Error('Failed to load posts');
-  return res.json(); // { total, items }
+  return res.json(); // { total, items, next_cursor }
 }
 
 export async function createPost(post, token) {
@@ -185,9 +189,10 @@ export async function getPost(id) {
   return data;
 }
 
-export async function listComments(postId, { skip = 0, limit = 50 } = {}) {
+export async function listComments(postId, { skip = 0, limit = 50, afterId } = {}) {
   const params = new URLSearchParams();
-  if (skip) params.append('skip', skip);
+  if (afterId != null) params.append('after_id', afterId); // keyset paging via next_after_id
+  else if (skip) params.append('skip', skip);
   if (limit) params.append('limit', limit);
   const res = await authFetch(`${API_BASE}/posts/${postId}/comments` + (params.toString() ? `?${params}` : ''));
   const data = await res.json();
@@ -219,6 +224,11 @@ export async function getLikeStatus(postId) {
   return data; // { liked, likes_count }
 }
 
+// Server-Sent Events for one post: 'comment', 'comment_deleted', 'likes' (the browser resumes with Last-Event-ID)
+export function openPostEvents(postId) {
+  return new EventSource(`${API_BASE}/posts/${postId}/events`);
+}
+
 export async function toggleLike(postId) {
   const res = await authFetch(`${API_BASE}/posts/${postId}/likes/toggle`, { method: 'POST' });
   const data = await res.json();
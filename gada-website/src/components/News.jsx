@@ -10,7 +10,15 @@ function resolveImageUrl(img) {
   return img;
 }
 
-function NewsCard({ id, title, details, date, image }) {
+// srcset from the API lists /images/... paths; make them absolute like the original
+function resolveSrcset(srcset) {
+  return srcset.split(', ').map(entry => `${API_BASE}${entry}`).join(', ');
+}
+
+// Cards fill the grid column (full width on phones)
+const CARD_SIZES = '(max-width: 600px) 100vw, 400px';
+
+function NewsCard({ id, title, details, date, image, images }) {
   const [showMore, setShowMore] = useState(false);
   const maxLen = 220;
   const isLong = details.length > maxLen;
@@ -26,9 +34,21 @@ function NewsCard({ id, title, details, date, image }) {
     }
   }
   const src = resolveImageUrl(firstImage);
+  // Resized WebP/JPEG variants when the backend has them; the original otherwise
+  const variants = images && images[firstImage];
   return (
   <div className="news-card" onClick={() => { window.location.hash = `#news/${id}`; }} style={{cursor:'pointer'}}>
-      <img src={src} alt={title} className="news-card-img" />
+      <picture>
+        {variants && <source type="image/webp" srcSet={resolveSrcset(variants.webp)} sizes={CARD_SIZES} />}
+        <img
+          src={src}
+          srcSet={variants ? resolveSrcset(variants.jpeg) : undefined}
+          sizes={variants ? CARD_SIZES : undefined}
+          alt={title}
+          className="news-card-img"
+          loading="lazy"
+        />
+      </picture>
       <div className="news-card-content">
         <h3 className="news-card-title">{title}</h3>
         <div className="news-card-date">{date}</div>
@@ -74,6 +94,7 @@ function News({ previewCount }) {
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(true);
   const [skip, setSkip] = useState(0);
+  const [cursor, setCursor] = useState(null);
   const [hasMore, setHasMore] = useState(true);
   const [search, setSearch] = useState("");
   const PAGE_SIZE = 6;
@@ -95,7 +116,7 @@ function News({ previewCount }) {
     if (!hasMore && !reset) return;
     try {
       setLoading(true);
-      const data = await getPosts({ skip: reset ? 0 : skip, limit: PAGE_SIZE, search: search || undefined });
+      const data = await getPosts({ skip: reset ? 0 : skip, cursor: reset ? undefined : cursor, limit: PAGE_SIZE, search: search || undefined });
       const items = (data.items || []).slice().sort((a,b) => getItemTime(b) - getItemTime(a));
       if (reset) {
         setPosts(items);
@@ -107,7 +128,8 @@ function News({ previewCount }) {
         });
         setSkip(s => s + items.length);
       }
-      setHasMore(items.length === PAGE_SIZE);
+      setCursor(data.next_cursor || null);
+      setHasMore(data.next_cursor !== undefined ? !!data.next_cursor : items.length === PAGE_SIZE);
     } catch (e) {
       setError(e.message || 'Failed to load posts');
       if (reset) setPosts([...fallbackNews].sort((a,b) => new Date(b.date).getTime() - new Date(a.date).getTime()));
@@ -117,7 +139,7 @@ function News({ previewCount }) {
   };
 
   useEffect(() => { loadPosts(true); /* initial */ }, []);
-  const handleSearch = (e) => { e.preventDefault(); setSkip(0); setHasMore(true); loadPosts(true); };
+  const handleSearch = (e) => { e.preventDefault(); setSkip(0); setCursor(null); setHasMore(true); loadPosts(true); };
 
   const itemsToRender = isPreview ? (posts || []).slice(0, previewCount) : (posts || []);
 
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { getPost, listComments, addComment, deleteCommentApi, getLikeStatus, toggleLike } from '../api';
+import { getPost, listComments, addComment, deleteCommentApi, getLikeStatus, toggleLike, openPostEvents } from '../api';
 import { API_BASE } from '../config';
 import '../News.css';
 
@@ -9,6 +9,13 @@ function resolveImageUrl(img){
   return img;
 }
 
+function resolveSrcset(srcset){
+  return srcset.split(', ').map(entry => `${API_BASE}${entry}`).join(', ');
+}
+
+// Two images per row in a 980px column
+const DETAIL_SIZES = '(max-width: 600px) 100vw, 490px';
+
 export default function NewsFeed({ postId, onBack }){
   const [post, setPost] = useState(null);
   const [error, setError] = useState(null);
@@ -49,6 +56,28 @@ export default function NewsFeed({ postId, onBack }){
     return () => { active = false; };
   }, [postId]);
 
+  // Live updates pushed by the server instead of polling
+  useEffect(() => {
+    const es = openPostEvents(postId);
+    es.addEventListener('comment', (e) => {
+      const c = JSON.parse(e.data);
+      setComments(prev => prev.some(x => x.id === c.id) ? prev : [...prev, c]);
+    });
+    es.addEventListener('comment_deleted', (e) => {
+      const { id } = JSON.parse(e.data);
+      setComments(prev => prev.filter(x => x.id !== id));
+    });
+    es.addEventListener('likes', (e) => {
+      const { likes_count } = JSON.parse(e.data);
+      setLikes(prev => ({ ...prev, likes_count }));
+    });
+    es.addEventListener('reset', async () => {
+      // missed too many events while disconnected: refetch
+      try { const cs = await listComments(postId, { skip: 0, limit: 100 }); setComments(cs.items || []); } catch (_) { /* keep current */ }
+    });
+    return () => es.close();
+  }, [postId]);
+
   if (loading) return <div className="news-loading">Loading...</div>;
   if (error) return <div className="news-error">{error}</div>;
   if (!post) return null;
@@ -57,7 +86,7 @@ export default function NewsFeed({ postId, onBack }){
     .split(/[;,\s]+/)
     .map(s => s.trim())
     .filter(Boolean)
-    .map(resolveImageUrl);
+    .map(url => ({ src: resolveImageUrl(url), variants: post.images && post.images[url] }));
 
   return (
     <div className="news-detail-container" style={{maxWidth: '980px', margin: '0 auto'}}>
@@ -65,8 +94,17 @@ export default function NewsFeed({ postId, onBack }){
       <h1 className="news-card-title" style={{fontSize:'2rem'}}>{post.title}</h1>
       <div className="news-card-date" style={{fontSize:'1.1rem'}}>{post.date}</div>
       <div style={{display:'flex', gap:'0.75rem', flexWrap:'wrap', margin:'0.75rem 0'}}>
-        {images.map((src, i) => (
-          <img key={i} src={src} alt={`image-${i}`} style={{maxWidth:'100%', width:'calc(50% - 0.75rem)', borderRadius:'0.5rem'}} />
+        {images.map(({ src, variants }, i) => (
+          <picture key={i} style={{display:'contents'}}>
+            {variants && <source type="image/webp" srcSet={resolveSrcset(variants.webp)} sizes={DETAIL_SIZES} />}
+            <img
+              src={src}
+              srcSet={variants ? resolveSrcset(variants.jpeg) : undefined}
+              sizes={variants ? DETAIL_SIZES : undefined}
+              alt={`image-${i}`}
+              style={{maxWidth:'100%', width:'calc(50% - 0.75rem)', borderRadius:'0.5rem'}}
+            />
+          </picture>
         ))}
       </div>
       <div className="news-actions">